@@ -0,0 +1,31 @@
+# Generated by Django 3.2 on 2026-10-18 12:14
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_recurring_tasks_of_users(apps, schema_editor):
+    CustomUser = apps.get_model("accounts", "CustomUser")
+    user_model_list = list(CustomUser.objects.annotate(task_count=Count("tasks")))
+    for user_model in user_model_list:
+        user_model.recurring_task_count = user_model.task_count
+    CustomUser.objects.bulk_update(
+        user_model_list, ["recurring_task_count"], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0001_initial"),
+        ("tasks", "0017_recurringtaskrun_retries"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="customuser",
+            name="recurring_task_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_recurring_tasks_of_users, migrations.RunPython.noop),
+    ]
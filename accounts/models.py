@@ -3,7 +3,8 @@ from django.db import models
 
 
 class CustomUser(AbstractUser):
-    pass
+    # Kept up to date when tasks are created or deleted, so plan limits do not count rows
+    recurring_task_count = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.email
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 # GENERAL
@@ -64,6 +65,7 @@ MIDDLEWARE = [
     "debug_toolbar.middleware.DebugToolbarMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "security.authorization_context.AuthorizationContextMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -124,10 +126,67 @@ Q_CLUSTER = {
     "orm": "default",
     "save_limit": 0,
     "ack_failures": True,
-    "max_attempts": 1,
+    "max_attempts": 5,
     "attempt_count": 1,
 }
 
+# RECURRING TASK JOBS
+# Tasks due within this many seconds are picked up together by the batch executor
+RECURRING_TASK_BATCH_WINDOW_SECONDS = 60
+# Number of due tasks claimed and enqueued as one batch job
+RECURRING_TASK_SCAN_CHUNK_SIZE = 500
+# Runs that are overdue by more than this were missed, e.g. while the cluster was down
+RECURRING_TASK_CATCH_UP_GRACE_SECONDS = 5 * 60
+# Number of tasks with missed runs enqueued per scan
+RECURRING_TASK_CATCH_UP_CHUNK_SIZE = 100
+# Tasks with a schedule tolerance are spread so that at most this many are due per minute
+RECURRING_TASK_MAX_DUE_TASKS_PER_MINUTE = 50
+# Failed page creations are retried after 30s, 60s, 120s, ... capped at an hour,
+# and moved to the dead letters after the last attempt
+RECURRING_TASK_RUN_MAX_ATTEMPTS = 6
+RECURRING_TASK_RUN_RETRY_BASE_SECONDS = 30
+RECURRING_TASK_RUN_RETRY_MAX_SECONDS = 60 * 60
+# Enqueued runs and claimed retries stay leased for as long as the job may take, if
+# the job gets lost or killed its runs are claimed as retries once the lease ran out
+RECURRING_TASK_RUN_LEASE_SECONDS = Q_CLUSTER["timeout"]
+# Runs that are done with are removed from the ledger after this many days
+RECURRING_TASK_RUN_RETENTION_DAYS = 30
+# Run page creations of a batch on an asyncio event loop instead of one after another
+NOTION_ASYNC_JOB_RUNNER_ENABLED = True
+NOTION_ASYNC_MAX_CONCURRENCY = 200
+NOTION_ASYNC_MAX_CONCURRENCY_PER_WORKSPACE = 10
+
+# NOTION API
+# Notion allows about 3 requests per second for each integration token. Every
+# process on a node shares its token buckets through files in this directory.
+NOTION_RATE_LIMIT_REQUESTS_PER_SECOND = 3
+NOTION_RATE_LIMIT_BURST = 3
+NOTION_RATE_LIMIT_DIRECTORY = os.environ.get(
+    "NOTION_RATE_LIMIT_DIRECTORY",
+    os.path.join(tempfile.gettempdir(), "notion-rate-limit"),
+)
+# Each process keeps the connections of its most recently used access tokens open
+NOTION_CLIENT_POOL_MAX_SIZE = 256
+NOTION_CLIENT_POOL_IDLE_SECONDS = 10 * 60
+NOTION_CLIENT_KEEPALIVE_SECONDS = 60
+# Property form classes are built once per property schema and kept in each process
+NOTION_PROPERTY_FORM_CLASS_CACHE_SIZE = 256
+# Jobs use the stored database schema instead of retrieving it while it is fresh
+NOTION_DATABASE_SCHEMA_TTL_SECONDS = 15 * 60
+NOTION_DATABASE_SCHEMA_REFRESH_LOCK_SECONDS = 30
+# The database picker searches a stored catalog of each workspace access, which is
+# refreshed in the background once it is older than the TTL
+NOTION_DATABASE_CATALOG_TTL_SECONDS = 5 * 60
+NOTION_DATABASE_CATALOG_FULL_REFRESH_SECONDS = 24 * 60 * 60
+NOTION_DATABASE_CATALOG_REFRESH_LOCK_SECONDS = 5 * 60
+# Identical Notion reads running at the same time in this process share one
+# request. Sharing them across processes too costs cache writes on every read,
+# when enabled the first process holds a lock row in the cache and shares its result.
+NOTION_SINGLE_FLIGHT_ACROSS_PROCESSES = False
+NOTION_SINGLE_FLIGHT_LOCK_SECONDS = 10
+NOTION_SINGLE_FLIGHT_RESULT_SECONDS = 5
+NOTION_SINGLE_FLIGHT_POLL_SECONDS = 0.05
+
 # URLS
 # ------------------------------------------------------------------------------
 # https://docs.djangoproject.com/en/dev/ref/settings/#root-urlconf
@@ -183,12 +242,35 @@ DEFAULT_AUTO_FIELD = "django.db.models.AutoField"
 
 # CACHE
 
+# Reads are served from an LRU of each process (L1) in front of the cache that all
+# processes share (L2), see config/two_tier_cache.py. L2 stays in the database
+# unless SHARED_CACHE_DIRECTORY keeps it in files, which only works on a single node.
 CACHES = {
     "default": {
+        "BACKEND": "config.two_tier_cache.TwoTierCache",
+        "LOCATION": "shared",
+        "OPTIONS": {
+            "L1_MAX_ENTRIES": 1000,
+            "L1_TIMEOUT": 30,
+            "SYNC_SECONDS": 1,
+        },
+    },
+    "shared": {
         "BACKEND": "django.core.cache.backends.db.DatabaseCache",
         "LOCATION": "caching_table",
-    }
+        # values are stored with their expire time, the prefix keeps them apart
+        # from rows that were written to the table without it
+        "KEY_PREFIX": "two-tier",
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
 }
+if os.environ.get("SHARED_CACHE_DIRECTORY"):
+    CACHES["shared"] = {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.environ.get("SHARED_CACHE_DIRECTORY"),
+        "KEY_PREFIX": "two-tier",
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    }
 
 # PASSWORDS
 # ------------------------------------------------------------------------------
@@ -232,6 +314,9 @@ STATIC_URL = "/static/"
 STATICFILES_DIRS = [str(BASE_DIR.joinpath("static"))]
 # http://whitenoise.evans.io/en/stable/django.html#add-compression-and-caching-support
 STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
+# Icons reference symbols of static/images/bootstrap-icons-sprite.svg instead of
+# inlining their markup, rebuild the sprite with build_bootstrap_icon_sprite
+BOOTSTRAP_ICON_SPRITE_ENABLED = bool(os.environ.get("BOOTSTRAP_ICON_SPRITE_ENABLED"))
 
 # MEDIA
 MEDIA_URL = "/media/"
@@ -335,3 +420,5 @@ HONEYPOT_FIELD_NAME = "Full Name"
 
 # USAGE LIIMITS
 NUM_FREE_RECURRING_TASKS = 10
+# Workspace access and task count of a user are cached between requests
+AUTHORIZATION_CONTEXT_CACHE_SECONDS = 5 * 60
@@ -0,0 +1,14 @@
+from django.core.cache import cache
+from django.test import TestCase
+
+
+class CacheIsolatedTestCase(TestCase):
+    """
+    Test case for code that reads the default cache. The database of every
+    test is rolled back together with the shared cache table, but the L1 of
+    the test process is not, so it is cleared before every test.
+    """
+
+    def _pre_setup(self):
+        super()._pre_setup()
+        cache.clear_l1()
@@ -0,0 +1,115 @@
+from django.test import TestCase
+
+from .two_tier_cache import TwoTierCache, mark_request_finished, mark_request_started
+
+
+def create_two_tier_cache(**option_dict):
+    # every instance stands in for the cache of one process
+    return TwoTierCache("shared", {"OPTIONS": {"SYNC_SECONDS": 0, **option_dict}})
+
+
+def start_request(test_case):
+    mark_request_started()
+    test_case.addCleanup(mark_request_finished)
+
+
+class TestTwoTierCache(TestCase):
+    def test_repeated_get_is_served_from_l1(self):
+        two_tier_cache = create_two_tier_cache(SYNC_SECONDS=60)
+        two_tier_cache.set("key", {"value": 1})
+        with self.assertNumQueries(0):
+            self.assertEqual(two_tier_cache.get("key"), {"value": 1})
+        self.assertEqual(two_tier_cache.get_stats()["l1_hits"], 1)
+
+    def test_value_is_read_from_l2_in_other_process(self):
+        first_cache, second_cache = create_two_tier_cache(), create_two_tier_cache()
+        first_cache.set("key", "value")
+        self.assertEqual(second_cache.get("key"), "value")
+        self.assertEqual(second_cache.get_stats()["l2_hits"], 1)
+        self.assertIsNone(second_cache.get("missing-key"))
+        self.assertEqual(second_cache.get_stats()["l2_misses"], 1)
+
+    def test_write_evicts_l1_of_other_process(self):
+        first_cache, second_cache = create_two_tier_cache(), create_two_tier_cache()
+        first_cache.set("key", "old-value")
+        self.assertEqual(second_cache.get("key"), "old-value")
+        first_cache.set("key", "new-value")
+        self.assertEqual(second_cache.get("key"), "new-value")
+        first_cache.delete("key")
+        self.assertIsNone(second_cache.get("key"))
+        self.assertEqual(second_cache.get_stats()["l1_invalidations"], 2)
+
+    def test_clear_evicts_l1_of_other_process(self):
+        first_cache, second_cache = create_two_tier_cache(), create_two_tier_cache()
+        first_cache.set("key", "value")
+        second_cache.get("key")
+        first_cache.clear()
+        self.assertIsNone(second_cache.get("key"))
+        first_cache.set("key", "new-value")
+        self.assertEqual(second_cache.get("key"), "new-value")
+
+    def test_least_recently_used_entry_is_evicted(self):
+        two_tier_cache = create_two_tier_cache(L1_MAX_ENTRIES=2, SYNC_SECONDS=60)
+        two_tier_cache.set("first-key", 1)
+        two_tier_cache.set("second-key", 2)
+        two_tier_cache.get("first-key")
+        two_tier_cache.set("third-key", 3)
+        stats_dict = two_tier_cache.get_stats()
+        self.assertEqual(stats_dict["l1_size"], 2)
+        self.assertEqual(stats_dict["l1_evictions"], 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(two_tier_cache.get("first-key"), 1)
+        self.assertEqual(two_tier_cache.get("second-key"), 2)
+
+    def test_add_does_not_replace_existing_value(self):
+        first_cache, second_cache = create_two_tier_cache(), create_two_tier_cache()
+        self.assertTrue(first_cache.add("lock-key", "first"))
+        self.assertFalse(second_cache.add("lock-key", "second"))
+        self.assertEqual(second_cache.get("lock-key"), "first")
+
+    def test_writes_of_a_request_are_published_together(self):
+        first_cache = create_two_tier_cache(SYNC_SECONDS=60)
+        second_cache = create_two_tier_cache()
+        first_cache.set("first-key", 1)
+        first_cache.set("second-key", 1)
+        self.assertEqual(second_cache.get("first-key"), 1)
+        self.assertEqual(second_cache.get("second-key"), 1)
+        start_request(self)
+        generation = first_cache._last_seen_generation
+        first_cache.set("first-key", 2)
+        first_cache.set("second-key", 2)
+        # the writes are published with the next sync or when the cache is closed
+        self.assertEqual(first_cache._last_seen_generation, generation)
+        first_cache.close()
+        self.assertEqual(first_cache._last_seen_generation, generation + 1)
+        self.assertEqual(second_cache.get("first-key"), 2)
+        self.assertEqual(second_cache.get("second-key"), 2)
+
+    def test_writes_outside_a_request_are_published_right_away(self):
+        first_cache = create_two_tier_cache(SYNC_SECONDS=60)
+        second_cache = create_two_tier_cache()
+        first_cache.set("key", 1)
+        self.assertEqual(second_cache.get("key"), 1)
+        # e.g. a django-q job, nothing closes the cache after it
+        first_cache.set("key", 2)
+        self.assertEqual(second_cache.get("key"), 2)
+
+    def test_delete_is_published_right_away(self):
+        first_cache = create_two_tier_cache(SYNC_SECONDS=60)
+        second_cache = create_two_tier_cache()
+        first_cache.set("key", 1)
+        self.assertEqual(second_cache.get("key"), 1)
+        start_request(self)
+        first_cache.delete("key")
+        self.assertIsNone(second_cache.get("key"))
+
+    def test_full_batch_is_published_right_away(self):
+        first_cache = create_two_tier_cache(SYNC_SECONDS=60, SYNC_BATCH_SIZE=2)
+        second_cache = create_two_tier_cache()
+        start_request(self)
+        first_cache.set("first-key", 1)
+        first_cache.close()
+        self.assertEqual(second_cache.get("first-key"), 1)
+        first_cache.set("first-key", 2)
+        first_cache.set("second-key", 2)
+        self.assertEqual(second_cache.get("first-key"), 2)
@@ -0,0 +1,317 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.signals import request_finished, request_started
+
+INVALIDATION_HEAD_KEY = "two-tier-cache:invalidation-head"
+# Marks an invalidation of the whole cache instead of a single key
+CLEAR_ALL_KEYS_MARKER = "*"
+
+
+# Set while the thread serves a request, Django closes the caches at its end
+_request_state = threading.local()
+
+
+def get_invalidation_log_key(generation):
+    return f"two-tier-cache:invalidation:{generation}"
+
+
+def mark_request_started(**kwargs):
+    _request_state.in_request = True
+
+
+def mark_request_finished(**kwargs):
+    _request_state.in_request = False
+
+
+request_started.connect(mark_request_started)
+request_finished.connect(mark_request_finished)
+
+
+class TwoTierCache(BaseCache):
+    """
+    Keeps recently read values in a bounded LRU of this process (L1) in front
+    of another configured cache that every process shares (L2).
+
+    The keys set in L2 during a request are collected and published together
+    under the next number of an invalidation log in L2, once every
+    SYNC_SECONDS, when SYNC_BATCH_SIZE keys are pending or when Django closes
+    the cache at the end of the request. Deletes and writes outside a request,
+    e.g. in django-q jobs or management commands, are published right away
+    since nothing closes the cache after them. Each process reads the log entries after the last number
+    it saw at most once every SYNC_SECONDS and evicts the written keys from its
+    L1. L1 entries never live longer than L1_TIMEOUT, which bounds staleness
+    if a log entry got lost or a process stopped writing before publishing.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        # LOCATION names the alias of the shared cache in CACHES
+        self.l2_cache_alias = location
+        self.l1_max_entries = int(options.get("L1_MAX_ENTRIES", 1000))
+        self.l1_timeout = float(options.get("L1_TIMEOUT", 30))
+        self.sync_seconds = float(options.get("SYNC_SECONDS", 1))
+        self.sync_batch_size = int(options.get("SYNC_BATCH_SIZE", 32))
+        self.invalidation_log_timeout = int(
+            options.get("INVALIDATION_LOG_TIMEOUT", 300)
+        )
+        # value is (pickled value, expire time of the entry in time.time() seconds)
+        self._l1_entry_by_key = OrderedDict()
+        self._lock = threading.Lock()
+        # keys written since the last publish, a dict keeps them unique and ordered
+        self._pending_l1_key_dict = {}
+        self._last_seen_generation = None
+        self._last_sync_time = 0
+        self._stat_count_by_name = {
+            "l1_hits": 0,
+            "l1_misses": 0,
+            "l1_evictions": 0,
+            "l1_invalidations": 0,
+            "l2_hits": 0,
+            "l2_misses": 0,
+        }
+
+    @property
+    def l2_cache(self):
+        # caches are per thread, the L2 backend may hold a connection
+        return caches[self.l2_cache_alias]
+
+    def get_stats(self):
+        with self._lock:
+            stats_dict = dict(self._stat_count_by_name)
+            stats_dict["l1_size"] = len(self._l1_entry_by_key)
+        return stats_dict
+
+    def count_stat(self, stat_name, count=1):
+        self._stat_count_by_name[stat_name] += count
+
+    @property
+    def l1_enabled(self):
+        return self.l1_max_entries > 0
+
+    def get_l1_value(self, l1_key):
+        with self._lock:
+            l1_entry = self._l1_entry_by_key.get(l1_key)
+            if l1_entry is not None and l1_entry[1] <= time.time():
+                del self._l1_entry_by_key[l1_key]
+                self.count_stat("l1_evictions")
+                l1_entry = None
+            if l1_entry is None:
+                self.count_stat("l1_misses")
+                return self._missing_key
+            self._l1_entry_by_key.move_to_end(l1_key)
+            self.count_stat("l1_hits")
+            pickled_value = l1_entry[0]
+        return pickle.loads(pickled_value)
+
+    def set_l1_value(self, l1_key, value, expire_time):
+        if not self.l1_enabled:
+            return
+        l1_expire_time = time.time() + self.l1_timeout
+        if expire_time is not None:
+            l1_expire_time = min(l1_expire_time, expire_time)
+        pickled_value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._l1_entry_by_key[l1_key] = (pickled_value, l1_expire_time)
+            self._l1_entry_by_key.move_to_end(l1_key)
+            while len(self._l1_entry_by_key) > self.l1_max_entries:
+                self._l1_entry_by_key.popitem(last=False)
+                self.count_stat("l1_evictions")
+
+    def evict_l1_keys(self, l1_key_list):
+        with self._lock:
+            for l1_key in l1_key_list:
+                if l1_key == CLEAR_ALL_KEYS_MARKER:
+                    self.count_stat("l1_invalidations", len(self._l1_entry_by_key))
+                    self._l1_entry_by_key.clear()
+                elif self._l1_entry_by_key.pop(l1_key, None) is not None:
+                    self.count_stat("l1_invalidations")
+
+    def read_invalidation_log(self):
+        """
+        Evicts the keys written by other processes since the last read and
+        returns the number of the last log entry that was seen.
+        """
+        while True:
+            start_generation = self._last_seen_generation + 1
+            log_key_list = [
+                get_invalidation_log_key(generation)
+                for generation in range(
+                    start_generation, start_generation + self.sync_batch_size
+                )
+            ]
+            found_value_by_key = self.l2_cache.get_many(
+                [INVALIDATION_HEAD_KEY] + log_key_list
+            )
+            head_generation = found_value_by_key.pop(INVALIDATION_HEAD_KEY, 0)
+            found_generation_list = sorted(
+                int(log_key.rsplit(":", 1)[1]) for log_key in found_value_by_key
+            )
+            last_generation = max(
+                found_generation_list + [head_generation, self._last_seen_generation]
+            )
+            has_gap = last_generation > self._last_seen_generation + len(
+                found_generation_list
+            )
+            if has_gap:
+                # entries expired before this process read them
+                self.evict_l1_keys([CLEAR_ALL_KEYS_MARKER])
+            else:
+                self.evict_l1_keys(
+                    [
+                        l1_key
+                        for l1_key_list in found_value_by_key.values()
+                        for l1_key in l1_key_list
+                    ]
+                )
+            self._last_seen_generation = last_generation
+            if len(found_generation_list) < self.sync_batch_size:
+                return last_generation
+
+    def sync_l1(self, force=False):
+        current_time = time.time()
+        if not force and current_time - self._last_sync_time < self.sync_seconds:
+            return
+        if (
+            self._last_seen_generation is None
+            or current_time - self._last_sync_time >= self.invalidation_log_timeout
+        ):
+            # whatever was missed could not be read from the log anymore
+            self.evict_l1_keys([CLEAR_ALL_KEYS_MARKER])
+            self._last_seen_generation = self.l2_cache.get(INVALIDATION_HEAD_KEY, 0)
+        self.read_invalidation_log()
+        self._last_sync_time = current_time
+        self.publish_pending_invalidations()
+
+    def queue_invalidation(self, l1_key, force=False):
+        with self._lock:
+            self._pending_l1_key_dict[l1_key] = None
+            pending_count = len(self._pending_l1_key_dict)
+        self.sync_l1(
+            force=force
+            or pending_count >= self.sync_batch_size
+            or not getattr(_request_state, "in_request", False)
+        )
+
+    def publish_pending_invalidations(self):
+        with self._lock:
+            l1_key_list = list(self._pending_l1_key_dict)
+            self._pending_l1_key_dict.clear()
+        if len(l1_key_list) == 0:
+            return
+        generation = self._last_seen_generation + 1
+        while not self.l2_cache.add(
+            get_invalidation_log_key(generation),
+            l1_key_list,
+            timeout=self.invalidation_log_timeout,
+        ):
+            generation = self.read_invalidation_log() + 1
+        self._last_seen_generation = generation
+        # the head only has to be close to the last entry, readers scan past it
+        if generation % self.sync_batch_size == 0:
+            self.l2_cache.set(INVALIDATION_HEAD_KEY, generation, timeout=None)
+
+    def get(self, key, default=None, version=None):
+        l1_key = self.make_key(key, version=version)
+        self.validate_key(l1_key)
+        if self.l1_enabled:
+            self.sync_l1()
+            value = self.get_l1_value(l1_key)
+            if value is not self._missing_key:
+                return value
+        l2_entry = self.l2_cache.get(key, version=version)
+        with self._lock:
+            self.count_stat("l2_misses" if l2_entry is None else "l2_hits")
+        if l2_entry is None:
+            return default
+        value, expire_time = l2_entry
+        self.set_l1_value(l1_key, value, expire_time)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        l1_key = self.make_key(key, version=version)
+        self.validate_key(l1_key)
+        expire_time = self.get_backend_timeout(timeout)
+        self.l2_cache.set(
+            key,
+            (value, expire_time),
+            timeout=self.get_l2_timeout(timeout),
+            version=version,
+        )
+        # syncing may evict L1, so the new value is kept after it
+        self.queue_invalidation(l1_key)
+        self.set_l1_value(l1_key, value, expire_time)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        l1_key = self.make_key(key, version=version)
+        self.validate_key(l1_key)
+        expire_time = self.get_backend_timeout(timeout)
+        # The key did not exist in L2, so no process can hold it in its L1
+        # beyond its expire time and there is nothing to publish
+        was_added = self.l2_cache.add(
+            key,
+            (value, expire_time),
+            timeout=self.get_l2_timeout(timeout),
+            version=version,
+        )
+        if was_added:
+            self.set_l1_value(l1_key, value, expire_time)
+        return was_added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        l2_entry = self.l2_cache.get(key, version=version)
+        if l2_entry is None:
+            return False
+        self.set(key, l2_entry[0], timeout=timeout, version=version)
+        return True
+
+    def delete(self, key, version=None):
+        l1_key = self.make_key(key, version=version)
+        self.validate_key(l1_key)
+        was_deleted = self.l2_cache.delete(key, version=version)
+        self.evict_l1_keys([l1_key])
+        # other processes must not keep serving a value that is gone
+        self.queue_invalidation(l1_key, force=True)
+        return was_deleted
+
+    def has_key(self, key, version=None):
+        value = self.get(key, self._missing_key, version=version)
+        return value is not self._missing_key
+
+    def clear(self):
+        self.l2_cache.clear()
+        self.evict_l1_keys([CLEAR_ALL_KEYS_MARKER])
+        with self._lock:
+            self._pending_l1_key_dict.clear()
+        # Clearing L2 also removed the log, numbering continues from the head
+        # so processes that read further than it notice the gap
+        self.sync_l1(force=True)
+        self.l2_cache.set(
+            INVALIDATION_HEAD_KEY, self._last_seen_generation, timeout=None
+        )
+        with self._lock:
+            self._pending_l1_key_dict[CLEAR_ALL_KEYS_MARKER] = None
+        self.publish_pending_invalidations()
+
+    def clear_l1(self):
+        # Drops what this process holds without touching L2, e.g. after the
+        # database of a test case was rolled back
+        self.evict_l1_keys([CLEAR_ALL_KEYS_MARKER])
+        with self._lock:
+            self._pending_l1_key_dict.clear()
+        self._last_seen_generation = None
+
+    def close(self, **kwargs):
+        # Django closes the caches when a request finishes
+        if len(self._pending_l1_key_dict) > 0:
+            self.sync_l1(force=True)
+
+    def get_l2_timeout(self, timeout):
+        if timeout == DEFAULT_TIMEOUT:
+            return self.default_timeout
+        return timeout
@@ -0,0 +1,118 @@
+import atexit
+import importlib.util
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import httpx
+
+from config.settings import (
+    NOTION_CLIENT_KEEPALIVE_SECONDS,
+    NOTION_CLIENT_POOL_IDLE_SECONDS,
+    NOTION_CLIENT_POOL_MAX_SIZE,
+)
+
+from .rate_limit import wait_for_notion_request_slot
+
+logger = logging.getLogger(__name__)
+
+# httpx only speaks HTTP/2 when the h2 package is installed
+NOTION_HTTP2_ENABLED = importlib.util.find_spec("h2") is not None
+
+# Least recently used first, every entry holds the http transport and the time it was last handed out
+_http_transport_entry_by_access_token = OrderedDict()
+_http_transport_lock = threading.Lock()
+
+
+class SharedNotionHttpTransport(httpx.BaseTransport):
+    # httpx closes the transport of a client when the client is closed or
+    # collected, the pooled transport is only closed by the pool
+    def __init__(self, http_transport):
+        self.http_transport = http_transport
+
+    def handle_request(self, request):
+        return self.http_transport.handle_request(request)
+
+    def close(self):
+        pass
+
+
+def create_notion_http_transport():
+    return httpx.HTTPTransport(
+        http2=NOTION_HTTP2_ENABLED,
+        limits=httpx.Limits(keepalive_expiry=NOTION_CLIENT_KEEPALIVE_SECONDS),
+    )
+
+
+def create_notion_http_client(access_token):
+    """
+    Returns a new http client for one Notion client. The Notion client sets
+    its headers, base url and timeout on it, only the connections of the
+    pooled transport of the access token are shared with other threads.
+    """
+
+    def wait_for_rate_limit(request):
+        wait_for_notion_request_slot(access_token)
+
+    return httpx.Client(
+        event_hooks={"request": [wait_for_rate_limit]},
+        transport=SharedNotionHttpTransport(
+            get_pooled_notion_http_transport(access_token)
+        ),
+    )
+
+
+def get_pooled_notion_http_transport(access_token):
+    """
+    Returns the http transport of the access token in this process, so
+    requests of the same token reuse its open connections to the Notion API.
+    Transports that sat idle for too long or fell out of the pool are only
+    dropped, another thread might still send requests through them. Their
+    connections are closed once the last client using them is collected.
+    """
+    current_time = time.monotonic()
+    with _http_transport_lock:
+        while _http_transport_entry_by_access_token:
+            oldest_access_token, (_, last_used_time) = next(
+                iter(_http_transport_entry_by_access_token.items())
+            )
+            if current_time - last_used_time < NOTION_CLIENT_POOL_IDLE_SECONDS:
+                break
+            del _http_transport_entry_by_access_token[oldest_access_token]
+        http_transport_entry = _http_transport_entry_by_access_token.pop(
+            access_token, None
+        )
+        http_transport = (
+            create_notion_http_transport()
+            if http_transport_entry is None
+            else http_transport_entry[0]
+        )
+        _http_transport_entry_by_access_token[access_token] = (
+            http_transport,
+            current_time,
+        )
+        while len(_http_transport_entry_by_access_token) > NOTION_CLIENT_POOL_MAX_SIZE:
+            _http_transport_entry_by_access_token.popitem(last=False)
+    return http_transport
+
+
+def discard_pooled_notion_http_transport(access_token):
+    # Called once a token is revoked or replaced, its connections are of no use anymore
+    with _http_transport_lock:
+        _http_transport_entry_by_access_token.pop(access_token, None)
+
+
+@atexit.register
+def clear_notion_http_transport_pool():
+    with _http_transport_lock:
+        http_transport_list = [
+            http_transport
+            for http_transport, _ in _http_transport_entry_by_access_token.values()
+        ]
+        _http_transport_entry_by_access_token.clear()
+    for http_transport in http_transport_list:
+        try:
+            http_transport.close()
+        except Exception:
+            logger.exception("Failed to close pooled Notion http transport.")
@@ -0,0 +1,28 @@
+# Generated by Django 3.2 on 2026-10-18 11:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notion_database", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="notiondatabase",
+            name="last_edited_time",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="notiondatabase",
+            name="schema_fetched_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="notiondatabase",
+            name="schema_refresh_started_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
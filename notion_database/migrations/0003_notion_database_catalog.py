@@ -0,0 +1,127 @@
+# Generated by Django 3.2 on 2026-10-18 12:02
+
+import logging
+
+import django.db.models.deletion
+from django.db import DatabaseError, migrations, models, transaction
+
+logger = logging.getLogger(__name__)
+
+CATALOG_ENTRY_NAME_TRIGRAM_INDEX_NAME = "notion_database_catalog_entry_name_trgm"
+
+
+def create_trigram_extension(schema_editor):
+    # Creating an extension needs the CREATE privilege on the database, without
+    # it the catalog search keeps working as a plain icontains scan
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        if cursor.fetchone() is not None:
+            return True
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    except DatabaseError:
+        logger.warning(
+            "Could not create the pg_trgm extension, skipped the trigram index on "
+            "database catalog names. Searching them scans the catalog instead."
+        )
+        return False
+    return True
+
+
+def create_catalog_entry_name_trigram_index(apps, schema_editor):
+    # icontains lookups compare UPPER(name) on Postgres, which a trigram index can serve
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    if not create_trigram_extension(schema_editor):
+        return
+    schema_editor.execute(
+        f"CREATE INDEX IF NOT EXISTS {CATALOG_ENTRY_NAME_TRIGRAM_INDEX_NAME} "
+        'ON notion_database_notiondatabasecatalogentry USING gin (UPPER("name"::text) gin_trgm_ops)'
+    )
+
+
+def drop_catalog_entry_name_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        f"DROP INDEX IF EXISTS {CATALOG_ENTRY_NAME_TRIGRAM_INDEX_NAME}"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("workspaces", "0002_alter_notionworkspace_icon_url"),
+        ("notion_database", "0002_notion_database_schema_cache"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="NotionDatabaseCatalog",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("refreshed_at", models.DateTimeField(blank=True, null=True)),
+                ("fully_refreshed_at", models.DateTimeField(blank=True, null=True)),
+                ("refresh_started_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "workspace_access",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="database_catalog",
+                        to="workspaces.notionworkspaceaccess",
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="NotionDatabaseCatalogEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("database_id", models.CharField(max_length=255)),
+                ("name", models.CharField(max_length=255)),
+                ("icon", models.CharField(blank=True, max_length=2048, null=True)),
+                ("last_edited_time", models.DateTimeField(blank=True, null=True)),
+                (
+                    "catalog",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="entries",
+                        to="notion_database.notiondatabasecatalog",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="notiondatabasecatalogentry",
+            index=models.Index(
+                fields=["catalog", "name"], name="notion_data_catalog_479681_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="notiondatabasecatalogentry",
+            constraint=models.UniqueConstraint(
+                fields=("catalog", "database_id"), name="unique_catalog_database_id"
+            ),
+        ),
+        migrations.RunPython(
+            create_catalog_entry_name_trigram_index,
+            drop_catalog_entry_name_trigram_index,
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-18 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notion_database", "0003_notion_database_catalog"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="notiondatabase",
+            name="schema_hash",
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
@@ -6,6 +6,7 @@ from notion_properties.dto import NotionPropertyDto
 from notion_properties.service import (
     get_list_of_premium_property_names_in_notion_property_dto_list,
 )
+from workspaces.models import NotionWorkspaceAccess
 
 
 class NotionDatabase(models.Model):
@@ -15,6 +16,12 @@ class NotionDatabase(models.Model):
     )
     database_name = models.CharField(max_length=255, null=None, blank=None)
     properties_schema_json = models.JSONField(encoder=DjangoJSONEncoder, default=dict)
+    # Hash of properties_schema_json, so an unchanged schema is not written again
+    schema_hash = models.CharField(max_length=64, null=True, blank=True)
+    # Used to tell whether the stored schema can be used instead of asking Notion
+    last_edited_time = models.DateTimeField(null=True, blank=True)
+    schema_fetched_at = models.DateTimeField(null=True, blank=True)
+    schema_refresh_started_at = models.DateTimeField(null=True, blank=True)
 
     def get_list_of_premium_property_names(self):
         if self.properties_schema_json is None:
@@ -28,3 +35,36 @@ class NotionDatabase(models.Model):
         return get_list_of_premium_property_names_in_notion_property_dto_list(
             property_dto_list
         )
+
+
+class NotionDatabaseCatalog(models.Model):
+    # Databases a workspace access can see, so the database picker can search them without asking Notion
+    workspace_access = models.OneToOneField(
+        NotionWorkspaceAccess,
+        on_delete=models.CASCADE,
+        related_name="database_catalog",
+    )
+    refreshed_at = models.DateTimeField(null=True, blank=True)
+    # A full refresh also removes databases that are not shared anymore
+    fully_refreshed_at = models.DateTimeField(null=True, blank=True)
+    refresh_started_at = models.DateTimeField(null=True, blank=True)
+
+
+class NotionDatabaseCatalogEntry(models.Model):
+    catalog = models.ForeignKey(
+        NotionDatabaseCatalog, on_delete=models.CASCADE, related_name="entries"
+    )
+    database_id = models.CharField(max_length=255)
+    name = models.CharField(max_length=255)
+    # Emoji or image url of the database icon
+    icon = models.CharField(max_length=2048, null=True, blank=True)
+    last_edited_time = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["catalog", "database_id"],
+                name="unique_catalog_database_id",
+            )
+        ]
+        indexes = [models.Index(fields=["catalog", "name"])]
@@ -1,4 +1,5 @@
 import os
+import uuid
 
 VALID_DATABASE_ID = os.environ.get("TEST_DATABASE_ID")
 VALID_DATABASE_NAME = "Todo"
@@ -565,7 +566,7 @@ def create_or_get_mocked_oauth_notion_client(*args, **kwargs):
 
         def create(self, properties, parent):
             # TODO: Check for specifics?
-            pass
+            return {"object": "page", "id": str(uuid.uuid4())}
 
     class MockClient:
         def __init__(self, token):
@@ -591,7 +592,7 @@ def create_or_get_mocked_oauth_notion_client(*args, **kwargs):
             self.page_api_mock = MockPagesApi(is_valid_token=self.client_token_is_valid)
             return self.page_api_mock
 
-        def search(self, filter, page_size, query=None):
+        def search(self, filter, page_size, query=None, start_cursor=None, sort=None):
             if not self.client_token_is_valid:
                 raise Exception("Invalid client token!")
             if "property" not in filter or "value" not in filter:
@@ -602,3 +603,28 @@ def create_or_get_mocked_oauth_notion_client(*args, **kwargs):
 
     access_token = kwargs["auth"]
     return MockClient(access_token)
+
+
+def create_or_get_mocked_async_oauth_notion_client(*args, **kwargs):
+    mocked_client = create_or_get_mocked_oauth_notion_client(*args, **kwargs)
+
+    class MockAsyncDatabasesApi:
+        async def retrieve(self, database_id):
+            return mocked_client.databases.retrieve(database_id=database_id)
+
+    class MockAsyncPagesApi:
+        async def create(self, properties, parent):
+            return mocked_client.pages.create(properties=properties, parent=parent)
+
+    class MockAsyncClient:
+        def __init__(self):
+            self.databases = MockAsyncDatabasesApi()
+            self.pages = MockAsyncPagesApi()
+
+        async def search(self, **search_kwargs):
+            return mocked_client.search(**search_kwargs)
+
+        async def aclose(self):
+            pass
+
+    return MockAsyncClient()
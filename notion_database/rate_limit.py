@@ -0,0 +1,83 @@
+import asyncio
+import fcntl
+import hashlib
+import logging
+import os
+import struct
+import time
+
+from config.settings import (
+    NOTION_RATE_LIMIT_BURST,
+    NOTION_RATE_LIMIT_DIRECTORY,
+    NOTION_RATE_LIMIT_REQUESTS_PER_SECOND,
+)
+
+logger = logging.getLogger(__name__)
+
+# Each bucket file holds the number of available tokens and the time they were counted
+BUCKET_STATE_FORMAT = "dd"
+BUCKET_STATE_SIZE = struct.calcsize(BUCKET_STATE_FORMAT)
+
+
+def get_bucket_file_path(access_token):
+    # never put the raw token on disk
+    token_hash = hashlib.sha256(access_token.encode("utf-8")).hexdigest()
+    return os.path.join(NOTION_RATE_LIMIT_DIRECTORY, f"{token_hash}.bucket")
+
+
+def reserve_notion_request_slot(access_token):
+    """
+    Takes a token from the bucket of the access token and returns the number of
+    seconds the caller has to wait before sending its request. The bucket is
+    allowed to go negative, so callers are queued behind each other instead of
+    being rejected.
+    """
+    os.makedirs(NOTION_RATE_LIMIT_DIRECTORY, exist_ok=True)
+    file_descriptor = os.open(
+        get_bucket_file_path(access_token), os.O_RDWR | os.O_CREAT, 0o600
+    )
+    try:
+        # the lock is shared by every process on the node that opens the same file
+        fcntl.flock(file_descriptor, fcntl.LOCK_EX)
+        current_time = time.time()
+        bucket_state_bytes = os.pread(file_descriptor, BUCKET_STATE_SIZE, 0)
+        if len(bucket_state_bytes) == BUCKET_STATE_SIZE:
+            available_tokens, last_refill_time = struct.unpack(
+                BUCKET_STATE_FORMAT, bucket_state_bytes
+            )
+            available_tokens = min(
+                NOTION_RATE_LIMIT_BURST,
+                available_tokens
+                + max(current_time - last_refill_time, 0)
+                * NOTION_RATE_LIMIT_REQUESTS_PER_SECOND,
+            )
+        else:
+            available_tokens = NOTION_RATE_LIMIT_BURST
+        available_tokens -= 1
+        os.pwrite(
+            file_descriptor,
+            struct.pack(BUCKET_STATE_FORMAT, available_tokens, current_time),
+            0,
+        )
+    finally:
+        fcntl.flock(file_descriptor, fcntl.LOCK_UN)
+        os.close(file_descriptor)
+    if available_tokens >= 0:
+        return 0
+    return -available_tokens / NOTION_RATE_LIMIT_REQUESTS_PER_SECOND
+
+
+def wait_for_notion_request_slot(access_token):
+    wait_seconds = reserve_notion_request_slot(access_token)
+    if wait_seconds > 0:
+        logger.info(f"Waiting {wait_seconds:.3f}s for Notion rate limit.")
+        time.sleep(wait_seconds)
+    return wait_seconds
+
+
+async def wait_for_notion_request_slot_async(access_token):
+    wait_seconds = reserve_notion_request_slot(access_token)
+    if wait_seconds > 0:
+        logger.info(f"Waiting {wait_seconds:.3f}s for Notion rate limit.")
+        await asyncio.sleep(wait_seconds)
+    return wait_seconds
@@ -1,13 +1,45 @@
+import functools
+import hashlib
+import json
 import logging
+import operator
+from datetime import timedelta
 
+import httpx
 import notion_client
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.db.models import Max, Q
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import now
+from django_q.tasks import async_task
+from notion_client import APIResponseError
+from notion_client.errors import APIErrorCode, HTTPResponseError, RequestTimeoutError
 
-from notion_database.models import NotionDatabase
+from config.settings import (
+    NOTION_ASYNC_MAX_CONCURRENCY_PER_WORKSPACE,
+    NOTION_DATABASE_CATALOG_FULL_REFRESH_SECONDS,
+    NOTION_DATABASE_CATALOG_REFRESH_LOCK_SECONDS,
+    NOTION_DATABASE_CATALOG_TTL_SECONDS,
+    NOTION_DATABASE_SCHEMA_REFRESH_LOCK_SECONDS,
+    NOTION_DATABASE_SCHEMA_TTL_SECONDS,
+)
+from notion_database.models import (
+    NotionDatabase,
+    NotionDatabaseCatalog,
+    NotionDatabaseCatalogEntry,
+)
+from notion_properties.dto import NotionPropertyDto
 from notion_properties.service import (
     get_list_of_property_dtos_from_notion_database_resp_dict,
 )
 from workspaces.models import NotionWorkspaceAccess
 
+from .client_pool import create_notion_http_client
+from .rate_limit import wait_for_notion_request_slot_async
+from .single_flight import arun_single_flight_notion_read, run_single_flight_notion_read
+
 # Get an instance of a logger
 logger = logging.getLogger(__name__)
 
@@ -16,7 +48,70 @@ class NotionApiException(Exception):
     pass
 
 
-def load_user_notion_client(user_model):
+# Everything the Notion client raises when a request fails
+NOTION_REQUEST_EXCEPTIONS = (HTTPResponseError, RequestTimeoutError, httpx.HTTPError)
+
+
+def is_transient_notion_error(error):
+    # Failures that go away by themselves, so the request should be sent again
+    if isinstance(error, APIResponseError):
+        return error.code in (
+            APIErrorCode.RateLimited,
+            APIErrorCode.ConflictError,
+            APIErrorCode.InternalServerError,
+            APIErrorCode.ServiceUnavailable,
+        )
+    if isinstance(error, HTTPResponseError):
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, (RequestTimeoutError, httpx.TransportError))
+
+
+def is_retryable_notion_error(error):
+    # A validation error on page creation means the stored schema went stale,
+    # the page payload is compiled again on the next attempt
+    return is_transient_notion_error(error) or (
+        isinstance(error, APIResponseError)
+        and error.code == APIErrorCode.ValidationError
+    )
+
+
+def is_missing_notion_object_error(error):
+    return (
+        isinstance(error, APIResponseError)
+        and error.code == APIErrorCode.ObjectNotFound
+    )
+
+
+def get_notion_retry_after_seconds(error):
+    headers = getattr(error, "headers", None)
+    if headers is None:
+        return None
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def create_notion_client(access_token):
+    return notion_client.Client(
+        auth=access_token, client=create_notion_http_client(access_token)
+    )
+
+
+def create_async_notion_client(access_token, max_connections):
+    async def wait_for_rate_limit(request):
+        await wait_for_notion_request_slot_async(access_token)
+
+    return notion_client.AsyncClient(
+        auth=access_token,
+        client=httpx.AsyncClient(
+            event_hooks={"request": [wait_for_rate_limit]},
+            limits=httpx.Limits(max_connections=max_connections),
+        ),
+    )
+
+
+def get_user_notion_access_token(user_model):
     notion_workspace_access_grant_model = NotionWorkspaceAccess.objects.filter(
         owner=user_model
     ).first()
@@ -27,32 +122,137 @@ def load_user_notion_client(user_model):
     logger.info(
         f"Fetching Notion Database with Access Token {notion_workspace_access_grant_model.access_token}"
     )
-    return notion_client.Client(auth=notion_workspace_access_grant_model.access_token)
+    return notion_workspace_access_grant_model.access_token
 
 
-def query_user_notion_databases_list(user_model, query_string=None):
-    logger.info(f"Fetching workspace pages")
+def load_user_notion_client(user_model):
+    return create_notion_client(
+        access_token=get_user_notion_access_token(user_model=user_model)
+    )
+
+
+def create_database_search_request_dict(query_string=None, start_cursor=None):
     request_filter_dict = {
         "filter": {"property": "object", "value": "database"},
         "page_size": 100,
     }
     if query_string is not None and len(query_string) > 0:
         request_filter_dict["query"] = query_string
-    response_dict = load_user_notion_client(user_model=user_model).search(
-        **request_filter_dict
-    )
+    if start_cursor:
+        request_filter_dict["start_cursor"] = start_cursor
+    return request_filter_dict
+
+
+def convert_database_search_response_dict(response_dict):
     if "results" not in response_dict:
         raise NotionApiException("Unable to retrieve Database data!")
     notion_db_response_dict_list = response_dict.get("results")
-    return [
+    simple_database_dict_list = [
         convert_notion_database_resp_dict_to_simple_database_dict(db_response_dict)
         for db_response_dict in notion_db_response_dict_list
     ]
+    next_cursor = (
+        response_dict.get("next_cursor") if response_dict.get("has_more") else None
+    )
+    return simple_database_dict_list, next_cursor
+
+
+def query_user_notion_databases_page(
+    user_model, query_string=None, start_cursor=None, access_token=None
+):
+    logger.info(f"Fetching workspace pages")
+    if access_token is None:
+        access_token = get_user_notion_access_token(user_model=user_model)
+    response_dict = run_single_flight_notion_read(
+        access_token=access_token,
+        method_name="search",
+        func=create_notion_client(access_token=access_token).search,
+        **create_database_search_request_dict(
+            query_string=query_string, start_cursor=start_cursor
+        ),
+    )
+    return convert_database_search_response_dict(response_dict)
+
+
+async def arequest_notion(access_token, method_name, **request_kwargs):
+    # An async client is bound to the event loop it was created on, so it is not pooled
+    client = create_async_notion_client(
+        access_token=access_token,
+        max_connections=NOTION_ASYNC_MAX_CONCURRENCY_PER_WORKSPACE,
+    )
+    try:
+        return await operator.attrgetter(method_name)(client)(**request_kwargs)
+    finally:
+        await client.aclose()
+
+
+async def aquery_user_notion_databases_page(
+    user_model, query_string=None, start_cursor=None
+):
+    logger.info("Fetching workspace pages")
+    access_token = await sync_to_async(get_user_notion_access_token)(
+        user_model=user_model
+    )
+    response_dict = await arun_single_flight_notion_read(
+        access_token,
+        "search",
+        functools.partial(arequest_notion, access_token, "search"),
+        **create_database_search_request_dict(
+            query_string=query_string, start_cursor=start_cursor
+        ),
+    )
+    return convert_database_search_response_dict(response_dict)
+
+
+def iterate_user_notion_database_pages(user_model, query_string=None):
+    # Yields the databases of every search page, following the cursor Notion hands out
+    access_token = get_user_notion_access_token(user_model=user_model)
+    start_cursor = None
+    while True:
+        simple_database_dict_list, start_cursor = query_user_notion_databases_page(
+            user_model=user_model,
+            query_string=query_string,
+            start_cursor=start_cursor,
+            access_token=access_token,
+        )
+        yield simple_database_dict_list
+        if start_cursor is None:
+            return
+
+
+def query_user_notion_databases_list(user_model, query_string=None):
+    return [
+        simple_database_dict
+        for simple_database_dict_list in iterate_user_notion_database_pages(
+            user_model=user_model, query_string=query_string
+        )
+        for simple_database_dict in simple_database_dict_list
+    ]
 
 
 def query_user_notion_database_with_api_by_id_as_dict(user_model, database_id_str):
-    database_dict = load_user_notion_client(user_model=user_model).databases.retrieve(
-        database_id=database_id_str
+    access_token = get_user_notion_access_token(user_model=user_model)
+    # Task views opened at the same time share one request for the database
+    database_dict = run_single_flight_notion_read(
+        access_token=access_token,
+        method_name="databases.retrieve",
+        func=create_notion_client(access_token=access_token).databases.retrieve,
+        database_id=database_id_str,
+    )
+    return convert_notion_database_resp_dict_to_simple_database_dict(database_dict)
+
+
+async def aquery_user_notion_database_with_api_by_id_as_dict(
+    user_model, database_id_str
+):
+    access_token = await sync_to_async(get_user_notion_access_token)(
+        user_model=user_model
+    )
+    database_dict = await arun_single_flight_notion_read(
+        access_token,
+        "databases.retrieve",
+        functools.partial(arequest_notion, access_token, "databases.retrieve"),
+        database_id=database_id_str,
     )
     return convert_notion_database_resp_dict_to_simple_database_dict(database_dict)
 
@@ -63,27 +263,379 @@ def convert_notion_database_resp_dict_to_simple_database_dict(notion_db_dict):
         if len(notion_db_dict["title"]) > 0
         else ""
     )
+    last_edited_time = notion_db_dict.get("last_edited_time")
     return {
         "name": title,
         "id": notion_db_dict["id"],
         "properties": get_list_of_property_dtos_from_notion_database_resp_dict(
             notion_db_dict=notion_db_dict
         ),
+        "last_edited_time": None
+        if last_edited_time is None
+        else parse_datetime(last_edited_time),
+    }
+
+
+def calculate_database_schema_hash(properties_schema_json):
+    return hashlib.sha256(
+        json.dumps(
+            properties_schema_json, sort_keys=True, cls=DjangoJSONEncoder
+        ).encode("utf-8")
+    ).hexdigest()
+
+
+def upsert_database_from_simple_database_dict(simple_database_dict):
+    """
+    Stores the database and returns it with whether its schema changed. The
+    row is only written when its name, edit time or schema hash differ from
+    the stored ones.
+    """
+    db_id_str = simple_database_dict["id"]
+    properties_schema_json = [
+        properties_dto.dto_dict()
+        for properties_dto in simple_database_dict["properties"]
+    ]
+    database_field_dict = {
+        "database_name": simple_database_dict["name"],
+        "last_edited_time": simple_database_dict.get("last_edited_time"),
+        "schema_hash": calculate_database_schema_hash(properties_schema_json),
     }
+    notion_database_model = NotionDatabase.objects.filter(database_id=db_id_str).first()
+    if notion_database_model is None:
+        try:
+            with transaction.atomic():
+                notion_database_model = NotionDatabase.objects.create(
+                    database_id=db_id_str,
+                    properties_schema_json=properties_schema_json,
+                    schema_fetched_at=now(),
+                    **database_field_dict,
+                )
+            return notion_database_model, True
+        except IntegrityError:
+            # created by a concurrent request in the meantime
+            notion_database_model = NotionDatabase.objects.get(database_id=db_id_str)
+    if all(
+        getattr(notion_database_model, field_name) == field_value
+        for field_name, field_value in database_field_dict.items()
+    ):
+        return notion_database_model, False
+    stored_schema_hash = notion_database_model.schema_hash
+    if stored_schema_hash is None:
+        stored_schema_hash = calculate_database_schema_hash(
+            notion_database_model.properties_schema_json
+        )
+    schema_was_changed = stored_schema_hash != database_field_dict["schema_hash"]
+    update_field_dict = {
+        **database_field_dict,
+        "schema_fetched_at": now(),
+        "schema_refresh_started_at": None,
+    }
+    if schema_was_changed:
+        update_field_dict["properties_schema_json"] = properties_schema_json
+    NotionDatabase.objects.filter(pk=notion_database_model.pk).update(
+        **update_field_dict
+    )
+    for field_name, field_value in update_field_dict.items():
+        setattr(notion_database_model, field_name, field_value)
+    if schema_was_changed:
+        # page payloads compiled against the old schema have to be rebuilt
+        notion_database_model.recurringtask_set.update(create_page_payload_json=None)
+    return notion_database_model, schema_was_changed
 
 
 def get_or_update_database_from_simple_database_dict_returning_model(
     simple_database_dict,
 ):
-    db_id_str = simple_database_dict["id"]
-    notion_database_model, was_created = NotionDatabase.objects.get_or_create(
-        database_id=db_id_str
+    return upsert_database_from_simple_database_dict(simple_database_dict)[0]
+
+
+def get_stored_simple_database_dict(notion_database_model):
+    if isinstance(notion_database_model.properties_schema_json, list) is False:
+        return None
+    return {
+        "name": notion_database_model.database_name,
+        "id": notion_database_model.database_id,
+        "properties": [
+            NotionPropertyDto.from_dto_dict(property_dict)
+            for property_dict in notion_database_model.properties_schema_json
+        ],
+        "last_edited_time": notion_database_model.last_edited_time,
+    }
+
+
+def is_database_schema_fresh(notion_database_model):
+    return (
+        notion_database_model.schema_fetched_at is not None
+        and now() - notion_database_model.schema_fetched_at
+        < timedelta(seconds=NOTION_DATABASE_SCHEMA_TTL_SECONDS)
     )
-    notion_database_model.database_name = simple_database_dict["name"]
-    notion_database_model.database_id = db_id_str
-    notion_database_model.properties_schema_json = [
-        properties_dto.dto_dict()
-        for properties_dto in simple_database_dict["properties"]
+
+
+def claim_database_schema_refresh(notion_database_model):
+    # Only one process gets to refresh an expired schema, the others keep using
+    # the stored one until the refresh is done or the claim has timed out.
+    refresh_lock_expired_datetime = now() - timedelta(
+        seconds=NOTION_DATABASE_SCHEMA_REFRESH_LOCK_SECONDS
+    )
+    return (
+        NotionDatabase.objects.filter(
+            Q(schema_refresh_started_at__isnull=True)
+            | Q(schema_refresh_started_at__lt=refresh_lock_expired_datetime),
+            pk=notion_database_model.pk,
+        ).update(schema_refresh_started_at=now())
+        > 0
+    )
+
+
+def release_database_schema_refresh(notion_database_model):
+    NotionDatabase.objects.filter(pk=notion_database_model.pk).update(
+        schema_refresh_started_at=None
+    )
+
+
+def expire_database_schema(notion_database_model):
+    NotionDatabase.objects.filter(pk=notion_database_model.pk).update(
+        schema_fetched_at=None
+    )
+
+
+def get_cached_simple_database_dict(notion_database_model):
+    """
+    Returns the stored schema of the database if it can be used instead of
+    retrieving it from Notion, otherwise None.
+    """
+    stored_database_dict = get_stored_simple_database_dict(notion_database_model)
+    if stored_database_dict is None:
+        return None
+    if is_database_schema_fresh(notion_database_model):
+        return stored_database_dict
+    if claim_database_schema_refresh(notion_database_model):
+        return None
+    return stored_database_dict
+
+
+def save_refreshed_simple_database_dict(notion_database_model, simple_database_dict):
+    if (
+        notion_database_model.last_edited_time is not None
+        and notion_database_model.last_edited_time
+        == simple_database_dict["last_edited_time"]
+        and isinstance(notion_database_model.properties_schema_json, list)
+    ):
+        # the database has not been edited since, so the stored schema stays
+        NotionDatabase.objects.filter(pk=notion_database_model.pk).update(
+            schema_fetched_at=now(), schema_refresh_started_at=None
+        )
+        return
+    _, schema_was_changed = upsert_database_from_simple_database_dict(
+        simple_database_dict=simple_database_dict
+    )
+    if not schema_was_changed:
+        NotionDatabase.objects.filter(pk=notion_database_model.pk).update(
+            schema_fetched_at=now(), schema_refresh_started_at=None
+        )
+
+
+def get_simple_database_dict_with_schema_cache(client, notion_database_model):
+    """
+    Returns the simple database dict and whether it had to be retrieved from Notion.
+    """
+    simple_database_dict = get_cached_simple_database_dict(notion_database_model)
+    if simple_database_dict is not None:
+        return simple_database_dict, False
+    try:
+        notion_db_schema_resp_dict = client.databases.retrieve(
+            database_id=notion_database_model.database_id
+        )
+    except Exception:
+        release_database_schema_refresh(notion_database_model)
+        raise
+    simple_database_dict = convert_notion_database_resp_dict_to_simple_database_dict(
+        notion_db_schema_resp_dict
+    )
+    save_refreshed_simple_database_dict(
+        notion_database_model=notion_database_model,
+        simple_database_dict=simple_database_dict,
+    )
+    return simple_database_dict, True
+
+
+NOTION_DATABASE_CATALOG_REFRESH_JOB_FUNC = (
+    "notion_database.service.refresh_notion_database_catalog"
+)
+
+
+def get_notion_database_icon(notion_db_dict):
+    icon_dict = notion_db_dict.get("icon") or {}
+    if icon_dict.get("type") == "emoji":
+        return icon_dict.get("emoji")
+    if icon_dict.get("type") in ("external", "file"):
+        return icon_dict[icon_dict["type"]].get("url")
+    return None
+
+
+def convert_notion_database_resp_dict_to_catalog_entry(catalog, notion_db_dict):
+    simple_database_dict = convert_notion_database_resp_dict_to_simple_database_dict(
+        notion_db_dict
+    )
+    return NotionDatabaseCatalogEntry(
+        catalog=catalog,
+        database_id=simple_database_dict["id"],
+        name=simple_database_dict["name"][:255],
+        icon=get_notion_database_icon(notion_db_dict),
+        last_edited_time=simple_database_dict["last_edited_time"],
+    )
+
+
+def get_or_create_user_notion_database_catalog(user_model):
+    notion_workspace_access_grant_model = NotionWorkspaceAccess.objects.filter(
+        owner=user_model
+    ).first()
+    if notion_workspace_access_grant_model is None:
+        raise NotionApiException(
+            f"User {user_model.username} does not have any access grants!"
+        )
+    return NotionDatabaseCatalog.objects.get_or_create(
+        workspace_access=notion_workspace_access_grant_model
+    )[0]
+
+
+def is_notion_database_catalog_fresh(catalog):
+    return (
+        catalog.refreshed_at is not None
+        and now() - catalog.refreshed_at
+        < timedelta(seconds=NOTION_DATABASE_CATALOG_TTL_SECONDS)
+    )
+
+
+def claim_notion_database_catalog_refresh(catalog):
+    refresh_lock_expired_datetime = now() - timedelta(
+        seconds=NOTION_DATABASE_CATALOG_REFRESH_LOCK_SECONDS
+    )
+    return (
+        NotionDatabaseCatalog.objects.filter(
+            Q(refresh_started_at__isnull=True)
+            | Q(refresh_started_at__lt=refresh_lock_expired_datetime),
+            pk=catalog.pk,
+        ).update(refresh_started_at=now())
+        > 0
+    )
+
+
+def enqueue_notion_database_catalog_refresh_if_stale(catalog):
+    if is_notion_database_catalog_fresh(catalog):
+        return False
+    if not claim_notion_database_catalog_refresh(catalog):
+        return False
+    async_task(NOTION_DATABASE_CATALOG_REFRESH_JOB_FUNC, catalog.pk)
+    return True
+
+
+def save_notion_database_catalog_entries(catalog, catalog_entry_list):
+    stored_catalog_entry_by_database_id = {
+        catalog_entry.database_id: catalog_entry
+        for catalog_entry in catalog.entries.filter(
+            database_id__in=[
+                catalog_entry.database_id for catalog_entry in catalog_entry_list
+            ]
+        )
+    }
+    updated_catalog_entry_list = []
+    created_catalog_entry_list = []
+    for catalog_entry in catalog_entry_list:
+        stored_catalog_entry = stored_catalog_entry_by_database_id.get(
+            catalog_entry.database_id
+        )
+        if stored_catalog_entry is None:
+            created_catalog_entry_list.append(catalog_entry)
+            continue
+        catalog_entry.pk = stored_catalog_entry.pk
+        updated_catalog_entry_list.append(catalog_entry)
+    NotionDatabaseCatalogEntry.objects.bulk_create(created_catalog_entry_list)
+    NotionDatabaseCatalogEntry.objects.bulk_update(
+        updated_catalog_entry_list, ["name", "icon", "last_edited_time"]
+    )
+
+
+def refresh_notion_database_catalog(catalog_pk):
+    """
+    Walks the databases of the workspace access from the most recently edited
+    one. An incremental refresh stops at the first database that was not edited
+    since the last refresh, a full refresh reads all of them and removes the
+    ones that are not shared anymore.
+    """
+    catalog = (
+        NotionDatabaseCatalog.objects.filter(pk=catalog_pk)
+        .select_related("workspace_access")
+        .first()
+    )
+    if catalog is None:
+        return
+    refresh_datetime = now()
+    is_full_refresh = (
+        catalog.fully_refreshed_at is None
+        or refresh_datetime - catalog.fully_refreshed_at
+        > timedelta(seconds=NOTION_DATABASE_CATALOG_FULL_REFRESH_SECONDS)
+    )
+    last_edited_datetime = (
+        None
+        if is_full_refresh
+        else catalog.entries.aggregate(Max("last_edited_time"))["last_edited_time__max"]
+    )
+    client = create_notion_client(access_token=catalog.workspace_access.access_token)
+    request_filter_dict = {
+        "filter": {"property": "object", "value": "database"},
+        "sort": {"direction": "descending", "timestamp": "last_edited_time"},
+        "page_size": 100,
+    }
+    seen_database_id_set = set()
+    try:
+        while True:
+            response_dict = client.search(**request_filter_dict)
+            catalog_entry_list = [
+                convert_notion_database_resp_dict_to_catalog_entry(
+                    catalog=catalog, notion_db_dict=notion_db_dict
+                )
+                for notion_db_dict in response_dict.get("results", [])
+            ]
+            save_notion_database_catalog_entries(
+                catalog=catalog, catalog_entry_list=catalog_entry_list
+            )
+            seen_database_id_set.update(
+                catalog_entry.database_id for catalog_entry in catalog_entry_list
+            )
+            # Notion rounds last_edited_time to the minute, equal times might still be new
+            reached_unchanged_databases = last_edited_datetime is not None and any(
+                catalog_entry.last_edited_time is not None
+                and catalog_entry.last_edited_time < last_edited_datetime
+                for catalog_entry in catalog_entry_list
+            )
+            if reached_unchanged_databases or not response_dict.get("has_more"):
+                break
+            request_filter_dict["start_cursor"] = response_dict["next_cursor"]
+    except Exception:
+        NotionDatabaseCatalog.objects.filter(pk=catalog.pk).update(
+            refresh_started_at=None
+        )
+        raise
+    catalog_update_dict = {"refreshed_at": refresh_datetime, "refresh_started_at": None}
+    if is_full_refresh:
+        catalog.entries.exclude(database_id__in=seen_database_id_set).delete()
+        catalog_update_dict["fully_refreshed_at"] = refresh_datetime
+    NotionDatabaseCatalog.objects.filter(pk=catalog.pk).update(**catalog_update_dict)
+    logger.info(
+        f"Refreshed {len(seen_database_id_set)} databases of catalog {catalog.pk}."
+    )
+
+
+def search_notion_database_catalog(catalog, query_string=None):
+    catalog_entry_queryset = catalog.entries.order_by("-last_edited_time", "name")
+    if query_string:
+        catalog_entry_queryset = catalog_entry_queryset.filter(
+            name__icontains=query_string
+        )
+    return [
+        {"name": name, "id": database_id, "icon": icon}
+        for name, database_id, icon in catalog_entry_queryset.values_list(
+            "name", "database_id", "icon"
+        )
     ]
-    notion_database_model.save()
-    return notion_database_model
@@ -0,0 +1,141 @@
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from django.core.cache import cache
+
+from config.settings import (
+    NOTION_SINGLE_FLIGHT_ACROSS_PROCESSES,
+    NOTION_SINGLE_FLIGHT_LOCK_SECONDS,
+    NOTION_SINGLE_FLIGHT_POLL_SECONDS,
+    NOTION_SINGLE_FLIGHT_RESULT_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+_in_flight_call_by_key = {}
+_in_flight_call_lock = threading.Lock()
+# Futures can only be awaited on their own event loop, so they are kept per loop
+_in_flight_future_by_loop_and_key = {}
+
+
+class InFlightCall:
+    def __init__(self):
+        self.done_event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def get_single_flight_key(access_token, method_name, request_kwargs):
+    # never put the raw token into a cache key
+    request_str = json.dumps(
+        [access_token, method_name, request_kwargs], sort_keys=True, default=str
+    )
+    return hashlib.sha256(request_str.encode("utf-8")).hexdigest()
+
+
+def run_across_processes(key, func):
+    """
+    The first process to add the lock row sends the request and shares its
+    result for a few seconds, the others wait for it. If the holder fails or
+    takes too long, a waiting process sends the request itself.
+    """
+    lock_cache_key = f"notion-single-flight-lock:{key}"
+    result_cache_key = f"notion-single-flight-result:{key}"
+    deadline_time = time.monotonic() + NOTION_SINGLE_FLIGHT_LOCK_SECONDS
+    while not cache.add(
+        lock_cache_key, True, timeout=NOTION_SINGLE_FLIGHT_LOCK_SECONDS
+    ):
+        shared_result = cache.get(result_cache_key)
+        if shared_result is not None:
+            return shared_result
+        if time.monotonic() >= deadline_time:
+            logger.info(f"Gave up waiting on single flight {key}.")
+            return func()
+        time.sleep(NOTION_SINGLE_FLIGHT_POLL_SECONDS)
+    try:
+        result = func()
+        cache.set(result_cache_key, result, timeout=NOTION_SINGLE_FLIGHT_RESULT_SECONDS)
+        return result
+    finally:
+        cache.delete(lock_cache_key)
+
+
+def run_single_flight(key, func):
+    """
+    Concurrent calls with the same key share one call of func and its result
+    or error, threads of this process through an event. Other processes only
+    wait for it through a lock row in the cache when
+    NOTION_SINGLE_FLIGHT_ACROSS_PROCESSES is enabled.
+    """
+    with _in_flight_call_lock:
+        in_flight_call = _in_flight_call_by_key.get(key)
+        is_leader = in_flight_call is None
+        if is_leader:
+            in_flight_call = InFlightCall()
+            _in_flight_call_by_key[key] = in_flight_call
+    if not is_leader:
+        in_flight_call.done_event.wait()
+        if in_flight_call.error is not None:
+            raise in_flight_call.error
+        return in_flight_call.result
+    try:
+        if NOTION_SINGLE_FLIGHT_ACROSS_PROCESSES:
+            in_flight_call.result = run_across_processes(key, func)
+        else:
+            in_flight_call.result = func()
+        return in_flight_call.result
+    except Exception as error:
+        in_flight_call.error = error
+        raise
+    finally:
+        with _in_flight_call_lock:
+            del _in_flight_call_by_key[key]
+        in_flight_call.done_event.set()
+
+
+def run_single_flight_notion_read(access_token, method_name, func, **request_kwargs):
+    return run_single_flight(
+        key=get_single_flight_key(access_token, method_name, request_kwargs),
+        func=lambda: func(**request_kwargs),
+    )
+
+
+async def arun_single_flight(key, coroutine_func):
+    """
+    Concurrent coroutines of the same event loop with the same key share one
+    call of coroutine_func and its result or error.
+    """
+    loop = asyncio.get_running_loop()
+    loop_and_key = (loop, key)
+    in_flight_future = _in_flight_future_by_loop_and_key.get(loop_and_key)
+    if in_flight_future is not None:
+        return await asyncio.shield(in_flight_future)
+    in_flight_future = loop.create_future()
+    _in_flight_future_by_loop_and_key[loop_and_key] = in_flight_future
+    try:
+        result = await coroutine_func()
+        in_flight_future.set_result(result)
+        return result
+    except asyncio.CancelledError:
+        in_flight_future.cancel()
+        raise
+    except Exception as error:
+        in_flight_future.set_exception(error)
+        # the error is raised here, followers might not be there to retrieve it
+        in_flight_future.exception()
+        raise
+    finally:
+        del _in_flight_future_by_loop_and_key[loop_and_key]
+
+
+async def arun_single_flight_notion_read(
+    access_token, method_name, coroutine_func, **request_kwargs
+):
+    return await arun_single_flight(
+        key=get_single_flight_key(access_token, method_name, request_kwargs),
+        coroutine_func=lambda: coroutine_func(**request_kwargs),
+    )
@@ -1,27 +1,80 @@
+import asyncio
+import tempfile
+import threading
+import time
+from datetime import timedelta
 from unittest import mock
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
 from django.urls import reverse_lazy
+from django.utils.timezone import now
 
+from config.testing import CacheIsolatedTestCase
 from notion_properties.constants import IGNORED_PROPERTIES_SET
 from notion_properties.dto import NotionPropertyDto
 from workspaces.models import NotionWorkspace, NotionWorkspaceAccess
 
+from .client_pool import (
+    clear_notion_http_transport_pool,
+    create_notion_http_client,
+    discard_pooled_notion_http_transport,
+    get_pooled_notion_http_transport,
+)
+from .models import NotionDatabase, NotionDatabaseCatalog, NotionDatabaseCatalogEntry
 from .notion_mock_api import (
+    MOCK_DATABASE_RESPONSE,
     VALID_ACCESS_TOKEN,
     VALID_DATABASE_ID,
+    create_or_get_mocked_async_oauth_notion_client,
     create_or_get_mocked_oauth_notion_client,
 )
+from .rate_limit import reserve_notion_request_slot
 from .service import (
+    NotionApiException,
+    convert_notion_database_resp_dict_to_simple_database_dict,
+    create_notion_client,
     get_or_update_database_from_simple_database_dict_returning_model,
+    get_simple_database_dict_with_schema_cache,
     query_user_notion_database_with_api_by_id_as_dict,
     query_user_notion_databases_list,
+    refresh_notion_database_catalog,
+    upsert_database_from_simple_database_dict,
 )
+from .single_flight import arun_single_flight, run_single_flight
+
+
+def create_paginated_search_notion_client(*args, **kwargs):
+    # Splits the mocked search response into one page per database
+    notion_client_mock = mock.Mock()
+    database_response_dict_list = MOCK_DATABASE_RESPONSE["results"]
+
+    def search(start_cursor=None, **search_kwargs):
+        page_index = int(start_cursor or 0)
+        has_more = page_index + 1 < len(database_response_dict_list)
+        return {
+            "object": "list",
+            "results": [database_response_dict_list[page_index]],
+            "next_cursor": str(page_index + 1) if has_more else None,
+            "has_more": has_more,
+        }
+
+    notion_client_mock.search.side_effect = search
+    return notion_client_mock
+
+
+def create_paginated_search_async_notion_client(*args, **kwargs):
+    notion_client_mock = create_paginated_search_notion_client(*args, **kwargs)
+    async_notion_client_mock = mock.Mock()
+    async_notion_client_mock.search = mock.AsyncMock(
+        side_effect=notion_client_mock.search
+    )
+    async_notion_client_mock.aclose = mock.AsyncMock()
+    return async_notion_client_mock
 
 
 # Create your tests here.
-class TestDatabaseResponseConversion(TestCase):
+class TestDatabaseResponseConversion(CacheIsolatedTestCase):
     def setUp(self):
         self.user = get_user_model().objects.create_user(
             username="testuser", email="test@email.com", password="secret"
@@ -42,8 +95,8 @@ class TestGetAllUserNotionDatabaseProperties(TestDatabaseResponseConversion):
         self.request_url = reverse_lazy("search-workspace-databases-for-task-db-change")
 
     @mock.patch(
-        "notion_database.service.notion_client.Client",
-        side_effect=create_or_get_mocked_oauth_notion_client,
+        "notion_database.service.notion_client.AsyncClient",
+        side_effect=create_or_get_mocked_async_oauth_notion_client,
     )
     def test_only_logged_in_user_can_query_their_databases(self, m):
         response = self.client.post(
@@ -52,8 +105,8 @@ class TestGetAllUserNotionDatabaseProperties(TestDatabaseResponseConversion):
         self.assertEqual(response.status_code, 302)
 
     @mock.patch(
-        "notion_database.service.notion_client.Client",
-        side_effect=create_or_get_mocked_oauth_notion_client,
+        "notion_database.service.notion_client.AsyncClient",
+        side_effect=create_or_get_mocked_async_oauth_notion_client,
     )
     def test_logged_in_user_successfully_queries_their_databases(self, m):
         self.client.force_login(
@@ -85,6 +138,34 @@ class TestGetAllUserNotionDatabaseProperties(TestDatabaseResponseConversion):
                     "Invalid conversion of a dictioanry, proeprties are missing!"
                 )
 
+    @mock.patch(
+        "notion_database.service.notion_client.Client",
+        side_effect=create_paginated_search_notion_client,
+    )
+    def test_databases_of_every_search_page_are_listed(self, m):
+        db_dict_list = query_user_notion_databases_list(user_model=self.user)
+        self.assertEqual(
+            [db_dict["id"] for db_dict in db_dict_list],
+            [db_dict["id"] for db_dict in MOCK_DATABASE_RESPONSE["results"]],
+        )
+
+    @mock.patch(
+        "notion_database.service.notion_client.AsyncClient",
+        side_effect=create_paginated_search_async_notion_client,
+    )
+    def test_search_result_requests_next_page(self, m):
+        self.client.force_login(self.user)
+        response = self.client.post(self.request_url, {"taskPk": 1})
+        self.assertContains(response, "database-search-result", count=1)
+        self.assertContains(response, '"startCursor": "1"')
+        response = self.client.post(
+            self.request_url,
+            {"taskPk": 1, "startCursor": len(MOCK_DATABASE_RESPONSE["results"]) - 1},
+        )
+        self.assertContains(response, "database-search-result", count=1)
+        self.assertNotContains(response, "startCursor")
+        self.assertNotContains(response, "No Databases found")
+
 
 class TestGetSingleDatabaseProperties(TestDatabaseResponseConversion):
     def setUp(self):
@@ -96,16 +177,16 @@ class TestGetSingleDatabaseProperties(TestDatabaseResponseConversion):
         }
 
     @mock.patch(
-        "notion_database.service.notion_client.Client",
-        side_effect=create_or_get_mocked_oauth_notion_client,
+        "notion_database.service.notion_client.AsyncClient",
+        side_effect=create_or_get_mocked_async_oauth_notion_client,
     )
     def test_only_logged_in_user_can_query_database_by_id(self, m):
         response = self.client.post(self.request_url, self.valid_db_request_body)
         self.assertEqual(response.status_code, 302)
 
     @mock.patch(
-        "notion_database.service.notion_client.Client",
-        side_effect=create_or_get_mocked_oauth_notion_client,
+        "notion_database.service.notion_client.AsyncClient",
+        side_effect=create_or_get_mocked_async_oauth_notion_client,
     )
     def test_logged_in_user_queries_db_their_databases(self, m):
         self.client.force_login(
@@ -216,3 +297,386 @@ class TestIgnoredPropertiesHandling(TestDatabaseResponseConversion):
         self.assertEqual(
             len(generated_db_model.get_list_of_premium_property_names()), 0
         )
+
+
+class TestNotionRateLimit(CacheIsolatedTestCase):
+    def setUp(self):
+        patcher = mock.patch(
+            "notion_database.rate_limit.NOTION_RATE_LIMIT_DIRECTORY",
+            tempfile.mkdtemp(),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @mock.patch("notion_database.rate_limit.NOTION_RATE_LIMIT_BURST", 3)
+    @mock.patch("notion_database.rate_limit.NOTION_RATE_LIMIT_REQUESTS_PER_SECOND", 3)
+    def test_requests_within_burst_do_not_wait(self):
+        for _ in range(3):
+            self.assertEqual(reserve_notion_request_slot("token"), 0)
+
+    @mock.patch("notion_database.rate_limit.NOTION_RATE_LIMIT_BURST", 3)
+    @mock.patch("notion_database.rate_limit.NOTION_RATE_LIMIT_REQUESTS_PER_SECOND", 3)
+    def test_requests_over_burst_are_queued(self):
+        for _ in range(3):
+            reserve_notion_request_slot("token")
+        first_wait_seconds = reserve_notion_request_slot("token")
+        second_wait_seconds = reserve_notion_request_slot("token")
+        self.assertAlmostEqual(first_wait_seconds, 1 / 3, delta=0.05)
+        self.assertAlmostEqual(second_wait_seconds, 2 / 3, delta=0.05)
+
+    @mock.patch("notion_database.rate_limit.NOTION_RATE_LIMIT_BURST", 1)
+    def test_buckets_are_separate_for_each_access_token(self):
+        self.assertEqual(reserve_notion_request_slot("token"), 0)
+        self.assertEqual(reserve_notion_request_slot("other_token"), 0)
+        self.assertGreater(reserve_notion_request_slot("token"), 0)
+
+
+class TestNotionClientPool(CacheIsolatedTestCase):
+    def setUp(self):
+        clear_notion_http_transport_pool()
+        self.addCleanup(clear_notion_http_transport_pool)
+
+    def test_transport_is_reused_for_same_access_token(self):
+        http_transport = get_pooled_notion_http_transport("token")
+        self.assertIs(get_pooled_notion_http_transport("token"), http_transport)
+        self.assertIsNot(
+            get_pooled_notion_http_transport("other_token"), http_transport
+        )
+
+    @mock.patch("notion_database.client_pool.NOTION_CLIENT_POOL_MAX_SIZE", 2)
+    def test_least_recently_used_transport_is_dropped_without_closing(self):
+        first_http_transport = get_pooled_notion_http_transport("first_token")
+        second_http_transport = get_pooled_notion_http_transport("second_token")
+        get_pooled_notion_http_transport("first_token")
+        with mock.patch.object(second_http_transport, "close") as close_mock:
+            get_pooled_notion_http_transport("third_token")
+        close_mock.assert_not_called()
+        self.assertIs(
+            get_pooled_notion_http_transport("first_token"), first_http_transport
+        )
+        self.assertIsNot(
+            get_pooled_notion_http_transport("second_token"), second_http_transport
+        )
+
+    @mock.patch("notion_database.client_pool.NOTION_CLIENT_POOL_IDLE_SECONDS", 60)
+    def test_idle_transport_is_replaced(self):
+        with mock.patch("notion_database.client_pool.time.monotonic", return_value=0):
+            http_transport = get_pooled_notion_http_transport("token")
+        with mock.patch("notion_database.client_pool.time.monotonic", return_value=61):
+            self.assertIsNot(get_pooled_notion_http_transport("token"), http_transport)
+
+    def test_discarded_transport_is_replaced(self):
+        http_transport = get_pooled_notion_http_transport("token")
+        discard_pooled_notion_http_transport("token")
+        self.assertIsNot(get_pooled_notion_http_transport("token"), http_transport)
+
+    def test_closing_notion_client_keeps_pooled_transport_open(self):
+        http_transport = get_pooled_notion_http_transport("token")
+        client = create_notion_client("token")
+        self.assertEqual(client.client.headers["Authorization"], "Bearer token")
+        with mock.patch.object(http_transport, "close") as close_mock:
+            client.close()
+            create_notion_http_client("token").close()
+        close_mock.assert_not_called()
+        with mock.patch.object(http_transport, "close") as close_mock:
+            clear_notion_http_transport_pool()
+        close_mock.assert_called_once()
+
+
+class TestSingleFlight(CacheIsolatedTestCase):
+    def test_concurrent_calls_share_one_call(self):
+        release_event = threading.Event()
+        call_counter = mock.Mock(return_value={"object": "database"})
+
+        def retrieve():
+            release_event.wait(timeout=5)
+            return call_counter()
+
+        result_list = []
+        thread_list = [
+            threading.Thread(
+                target=lambda: result_list.append(run_single_flight("key", retrieve))
+            )
+            for _ in range(5)
+        ]
+        for thread in thread_list:
+            thread.start()
+        time.sleep(0.1)
+        release_event.set()
+        for thread in thread_list:
+            thread.join(timeout=5)
+        self.assertEqual(call_counter.call_count, 1)
+        self.assertEqual(result_list, [{"object": "database"}] * 5)
+
+    def test_followers_receive_error_of_call(self):
+        release_event = threading.Event()
+
+        def retrieve():
+            release_event.wait(timeout=5)
+            raise NotionApiException("failed")
+
+        error_list = []
+
+        def run():
+            try:
+                run_single_flight("key", retrieve)
+            except NotionApiException as error:
+                error_list.append(error)
+
+        thread_list = [threading.Thread(target=run) for _ in range(3)]
+        for thread in thread_list:
+            thread.start()
+        time.sleep(0.1)
+        release_event.set()
+        for thread in thread_list:
+            thread.join(timeout=5)
+        self.assertEqual(len(error_list), 3)
+        self.assertIs(error_list[0], error_list[1])
+
+    def test_concurrent_coroutines_share_one_call(self):
+        call_counter = mock.Mock(return_value={"object": "database"})
+
+        async def retrieve():
+            await asyncio.sleep(0.01)
+            return call_counter()
+
+        async def retrieve_concurrently():
+            return await asyncio.gather(
+                *[arun_single_flight("key", retrieve) for _ in range(5)]
+            )
+
+        result_list = asyncio.run(retrieve_concurrently())
+        self.assertEqual(call_counter.call_count, 1)
+        self.assertEqual(result_list, [{"object": "database"}] * 5)
+
+    @mock.patch(
+        "notion_database.single_flight.NOTION_SINGLE_FLIGHT_ACROSS_PROCESSES", True
+    )
+    def test_waits_for_result_of_other_process(self):
+        cache.add("notion-single-flight-lock:key", True)
+        cache.set("notion-single-flight-result:key", {"object": "database"})
+        func = mock.Mock()
+        self.assertEqual(run_single_flight("key", func), {"object": "database"})
+        func.assert_not_called()
+
+    @mock.patch(
+        "notion_database.single_flight.NOTION_SINGLE_FLIGHT_ACROSS_PROCESSES", True
+    )
+    @mock.patch("notion_database.single_flight.NOTION_SINGLE_FLIGHT_LOCK_SECONDS", 0)
+    def test_calls_itself_when_other_process_takes_too_long(self):
+        cache.add("notion-single-flight-lock:key", True, timeout=60)
+        func = mock.Mock(return_value={"object": "database"})
+        self.assertEqual(run_single_flight("key", func), {"object": "database"})
+        func.assert_called_once()
+
+    @mock.patch(
+        "notion_database.single_flight.NOTION_SINGLE_FLIGHT_ACROSS_PROCESSES", True
+    )
+    def test_lock_is_released_after_call(self):
+        run_single_flight("key", mock.Mock(return_value={}))
+        self.assertIsNone(cache.get("notion-single-flight-lock:key"))
+
+    def test_other_processes_are_not_waited_for_by_default(self):
+        cache.add("notion-single-flight-lock:key", True)
+        func = mock.Mock(return_value={"object": "database"})
+        with self.assertNumQueries(0):
+            self.assertEqual(run_single_flight("key", func), {"object": "database"})
+        func.assert_called_once()
+
+
+class TestDatabaseSchemaUpsert(CacheIsolatedTestCase):
+    def setUp(self):
+        self.simple_database_dict = (
+            convert_notion_database_resp_dict_to_simple_database_dict(
+                MOCK_DATABASE_RESPONSE["results"][0]
+            )
+        )
+        (
+            self.database_model,
+            schema_was_changed,
+        ) = upsert_database_from_simple_database_dict(self.simple_database_dict)
+        self.assertTrue(schema_was_changed)
+
+    def test_unchanged_schema_is_not_written(self):
+        with self.assertNumQueries(1):
+            (
+                database_model,
+                schema_was_changed,
+            ) = upsert_database_from_simple_database_dict(self.simple_database_dict)
+        self.assertFalse(schema_was_changed)
+        self.assertEqual(database_model.schema_hash, self.database_model.schema_hash)
+
+    def test_changed_schema_is_written(self):
+        self.simple_database_dict["properties"] = self.simple_database_dict[
+            "properties"
+        ][1:]
+        database_model, schema_was_changed = upsert_database_from_simple_database_dict(
+            self.simple_database_dict
+        )
+        self.assertTrue(schema_was_changed)
+        database_model.refresh_from_db()
+        self.assertNotEqual(database_model.schema_hash, self.database_model.schema_hash)
+        self.assertEqual(
+            len(database_model.properties_schema_json),
+            len(self.database_model.properties_schema_json) - 1,
+        )
+
+    def test_renamed_database_keeps_schema(self):
+        self.simple_database_dict["name"] = "Renamed"
+        database_model, schema_was_changed = upsert_database_from_simple_database_dict(
+            self.simple_database_dict
+        )
+        self.assertFalse(schema_was_changed)
+        database_model.refresh_from_db()
+        self.assertEqual(database_model.database_name, "Renamed")
+
+
+class TestDatabaseSchemaCache(CacheIsolatedTestCase):
+    def setUp(self):
+        self.database_model = get_or_update_database_from_simple_database_dict_returning_model(
+            simple_database_dict=convert_notion_database_resp_dict_to_simple_database_dict(
+                MOCK_DATABASE_RESPONSE["results"][0]
+            )
+        )
+        self.client = mock.MagicMock()
+        self.client.databases.retrieve.return_value = MOCK_DATABASE_RESPONSE["results"][
+            0
+        ]
+
+    def expire_stored_schema(self):
+        NotionDatabase.objects.filter(pk=self.database_model.pk).update(
+            schema_fetched_at=now() - timedelta(days=1)
+        )
+        self.database_model.refresh_from_db()
+
+    def test_fresh_schema_is_not_retrieved(self):
+        database_dict, was_retrieved = get_simple_database_dict_with_schema_cache(
+            client=self.client, notion_database_model=self.database_model
+        )
+        self.assertFalse(was_retrieved)
+        self.client.databases.retrieve.assert_not_called()
+        self.assertEqual(
+            len(database_dict["properties"]),
+            len(self.database_model.properties_schema_json),
+        )
+
+    def test_stale_schema_is_retrieved(self):
+        self.expire_stored_schema()
+        get_simple_database_dict_with_schema_cache(
+            client=self.client, notion_database_model=self.database_model
+        )
+        self.client.databases.retrieve.assert_called_once()
+        self.database_model.refresh_from_db()
+        self.assertGreater(
+            self.database_model.schema_fetched_at, now() - timedelta(minutes=1)
+        )
+        self.assertIsNone(self.database_model.schema_refresh_started_at)
+
+    def test_missing_schema_is_retrieved(self):
+        NotionDatabase.objects.filter(pk=self.database_model.pk).update(
+            properties_schema_json=dict(), schema_fetched_at=None
+        )
+        self.database_model.refresh_from_db()
+        get_simple_database_dict_with_schema_cache(
+            client=self.client, notion_database_model=self.database_model
+        )
+        self.client.databases.retrieve.assert_called_once()
+
+    def test_only_one_process_refreshes_stale_schema(self):
+        self.expire_stored_schema()
+        NotionDatabase.objects.filter(pk=self.database_model.pk).update(
+            schema_refresh_started_at=now()
+        )
+        get_simple_database_dict_with_schema_cache(
+            client=self.client, notion_database_model=self.database_model
+        )
+        self.client.databases.retrieve.assert_not_called()
+
+    def test_failed_refresh_releases_claim(self):
+        self.expire_stored_schema()
+        self.client.databases.retrieve.side_effect = Exception("Notion is down")
+        with self.assertRaises(Exception):
+            get_simple_database_dict_with_schema_cache(
+                client=self.client, notion_database_model=self.database_model
+            )
+        self.database_model.refresh_from_db()
+        self.assertIsNone(self.database_model.schema_refresh_started_at)
+
+
+class TestNotionDatabaseCatalog(TestDatabaseResponseConversion):
+    def setUp(self):
+        super().setUp()
+        self.catalog = NotionDatabaseCatalog.objects.create(
+            workspace_access=self.init_workspace_access
+        )
+        self.request_url = reverse_lazy("search-workspace-databases-for-task-db-change")
+
+    @mock.patch(
+        "notion_database.service.notion_client.Client",
+        side_effect=create_paginated_search_notion_client,
+    )
+    def test_full_refresh_stores_every_database(self, m):
+        NotionDatabaseCatalogEntry.objects.create(
+            catalog=self.catalog, database_id="unshared-database-id", name="Unshared"
+        )
+        refresh_notion_database_catalog(self.catalog.pk)
+        self.catalog.refresh_from_db()
+        self.assertIsNotNone(self.catalog.refreshed_at)
+        self.assertIsNotNone(self.catalog.fully_refreshed_at)
+        self.assertEqual(
+            set(self.catalog.entries.values_list("database_id", flat=True)),
+            {db_dict["id"] for db_dict in MOCK_DATABASE_RESPONSE["results"]},
+        )
+        self.assertEqual(
+            self.catalog.entries.get(database_id=VALID_DATABASE_ID).icon, "✅"
+        )
+
+    @mock.patch(
+        "notion_database.service.notion_client.Client",
+        side_effect=create_paginated_search_notion_client,
+    )
+    def test_incremental_refresh_stops_at_unchanged_databases(self, m):
+        refresh_notion_database_catalog(self.catalog.pk)
+        notion_client_mock = mock.Mock(wraps=create_paginated_search_notion_client())
+        m.side_effect = lambda *args, **kwargs: notion_client_mock
+        refresh_notion_database_catalog(self.catalog.pk)
+        # the newest database is read again because Notion rounds edit times
+        self.assertEqual(notion_client_mock.search.call_count, 2)
+        self.assertEqual(
+            self.catalog.entries.count(), len(MOCK_DATABASE_RESPONSE["results"])
+        )
+
+    @mock.patch("notion_database.service.async_task")
+    @mock.patch("notion_database.service.notion_client.Client")
+    def test_picker_searches_refreshed_catalog(self, notion_client_mock, async_task):
+        NotionDatabaseCatalogEntry.objects.create(
+            catalog=self.catalog, database_id="expenses-id", name="Expenses"
+        )
+        NotionDatabaseCatalogEntry.objects.create(
+            catalog=self.catalog, database_id="todo-id", name="Todo"
+        )
+        NotionDatabaseCatalog.objects.filter(pk=self.catalog.pk).update(
+            refreshed_at=now()
+        )
+        self.client.force_login(self.user)
+        response = self.client.post(
+            self.request_url, {"taskPk": 1, "database-search-query": "expen"}
+        )
+        self.assertContains(response, "Expenses")
+        self.assertNotContains(response, "Todo")
+        notion_client_mock.assert_not_called()
+        async_task.assert_not_called()
+
+    @mock.patch("notion_database.service.async_task")
+    @mock.patch(
+        "notion_database.service.notion_client.AsyncClient",
+        side_effect=create_or_get_mocked_async_oauth_notion_client,
+    )
+    def test_picker_refreshes_stale_catalog_once(self, m, async_task):
+        self.client.force_login(self.user)
+        self.client.post(self.request_url, {"taskPk": 1})
+        self.client.post(self.request_url, {"taskPk": 1})
+        async_task.assert_called_once_with(
+            "notion_database.service.refresh_notion_database_catalog",
+            self.catalog.pk,
+        )
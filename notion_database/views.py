@@ -1,20 +1,48 @@
-from django.contrib.auth.decorators import login_required
+from asgiref.sync import sync_to_async
 from django.shortcuts import render
-from django.views.decorators.http import require_http_methods
 
-from .service import query_user_notion_databases_list
+from security.security_decorator import async_login_required, async_require_http_methods
+
+from .service import (
+    aquery_user_notion_databases_page,
+    enqueue_notion_database_catalog_refresh_if_stale,
+    get_or_create_user_notion_database_catalog,
+    search_notion_database_catalog,
+)
 
 
 # Create your views here.
-@login_required
-@require_http_methods(["POST"])
-def search_workspace_databases_for_task_db_change(request):
+@async_login_required
+@async_require_http_methods(["POST"])
+async def search_workspace_databases_for_task_db_change(request):
     query_string = request.POST.get("database-search-query", "")
-    databases_list = query_user_notion_databases_list(
-        user_model=request.user, query_string=query_string
+    start_cursor = request.POST.get("startCursor") or None
+    catalog = await sync_to_async(get_or_create_user_notion_database_catalog)(
+        user_model=request.user
     )
-    return render(
+    if start_cursor is None:
+        await sync_to_async(enqueue_notion_database_catalog_refresh_if_stale)(catalog)
+    if start_cursor is None and catalog.refreshed_at is not None:
+        databases_list = await sync_to_async(search_notion_database_catalog)(
+            catalog=catalog, query_string=query_string
+        )
+        next_cursor = None
+    else:
+        # Search Notion itself until the catalog has been built once
+        databases_list, next_cursor = await aquery_user_notion_databases_page(
+            user_model=request.user,
+            query_string=query_string,
+            start_cursor=start_cursor,
+        )
+    # Every page swaps in its rows and asks for the next one, until the cursor runs out
+    return await sync_to_async(render)(
         request,
         "tasks/partials/notion-databases-search-result.html",
-        {"databases": databases_list, "task_pk": request.POST.get("taskPk")},
+        {
+            "databases": databases_list,
+            "task_pk": request.POST.get("taskPk"),
+            "query_string": query_string,
+            "next_cursor": next_cursor,
+            "is_first_page": start_cursor is None,
+        },
     )
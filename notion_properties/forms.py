@@ -1,10 +1,17 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
 from crispy_forms.bootstrap import Alert, PrependedText
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import HTML, Div, Layout
 from django import forms
+from django.core.serializers.json import DjangoJSONEncoder
 from django.template.loader import render_to_string
 from django.urls import reverse
 
+from config.settings import NOTION_PROPERTY_FORM_CLASS_CACHE_SIZE
 from notion_properties.constants import (
     IGNORED_PROPERTIES_SET,
     NOTION_SELECT_PROPERTIES,
@@ -14,118 +21,203 @@ from notion_properties.dto import NotionPropertyDto
 from notion_properties.template_tags import icon_by_property_type
 from pages.template_tags import bootstrap_icon_by_icon_name
 
+# Least recently used first, keyed by the hash of the schema the class was built from
+_form_class_by_schema_hash = OrderedDict()
+_form_class_lock = threading.Lock()
+
 
 class NotionPropertyForm(forms.Form):
+    # Built together with the fields by create_notion_property_form_class and
+    # only read afterwards, so every instance of a class can share it
+    property_layout = None
+
     def __init__(self, *args, **kwargs):
         task_model = kwargs.pop("task_model")
-        show_save_notification = False
-        if "show_save_notification" in kwargs:
-            show_save_notification = kwargs.pop("show_save_notification")
-
         super().__init__(*args, **kwargs)
 
-        self.helper = FormHelper
+        self.helper = FormHelper()
         self.helper.form_action = reverse(
             "update-recurring-task-properties", kwargs={"pk": task_model.pk}
         )
         self.helper.form_method = "POST"
+        self.helper.layout = self.property_layout
 
-        properties_dict_list = task_model.properties_json
-        if isinstance(properties_dict_list, list) is False:
-            return
-        properties_dto_list = [
-            NotionPropertyDto.from_dto_dict(property_dict)
-            for property_dict in properties_dict_list
-        ]
-        properties_dto_list = [
-            property_dto
-            for property_dto in properties_dto_list
-            if property_dto.notion_type != "title"
-            and property_dto.notion_type not in IGNORED_PROPERTIES_SET
-        ]
 
-        notion_property_dto_by_id = {}
-        for i, property_dto in enumerate(properties_dto_list):
-            field_name = property_dto.id
-            if property_dto.notion_type in NOTION_SELECT_PROPERTIES:
-                self.fields[field_name] = forms.ChoiceField(
-                    required=False,
-                    choices=[
-                        (option["id"], option["name"])
-                        for option in property_dto.options_list
-                    ],
-                )
-            elif property_dto.notion_type == "checkbox":
-                self.fields[field_name] = forms.BooleanField(required=False)
-            elif property_dto.notion_type == "number":
-                self.fields[field_name] = forms.DecimalField(required=False)
-            elif property_dto.notion_type in NOTION_TEXT_PROPERTIES_SET:
-                self.fields[field_name] = forms.CharField(required=False)
-            else:
-                raise Exception("Unexpected Notion property type for Form!")
-            self.fields[field_name].initial = property_dto.value
-            self.fields[field_name].label = property_dto.name
-
-            notion_property_dto_by_id[field_name] = property_dto
-
-        unsupported_properties_alert = None
-        if (
-            task_model.database is not None
-            and len(task_model.database.get_list_of_premium_property_names()) > 0
-        ):
-            alert_message = f'{bootstrap_icon_by_icon_name(icon_name="info-circle")} '
-            alert_message += "The following properties are currently are not supported in the Free Tier: "
-            alert_message += ", ".join(
-                task_model.database.get_list_of_premium_property_names()
-            )
-            alert_message += render_to_string("widgets/upgrade-popup.html")
-            unsupported_properties_alert = Alert(
-                content=alert_message,
-                css_class="hide-internal-buttons alert-warning mt-2 mb-0",
-            )
+def get_form_property_dto_list(task_model):
+    properties_dict_list = task_model.properties_json
+    if isinstance(properties_dict_list, list) is False:
+        return None
+    properties_dto_list = [
+        NotionPropertyDto.from_dto_dict(property_dict)
+        for property_dict in properties_dict_list
+    ]
+    return [
+        property_dto
+        for property_dto in properties_dto_list
+        if property_dto.notion_type != "title"
+        and property_dto.notion_type not in IGNORED_PROPERTIES_SET
+    ]
 
-        submit_btn = HTML(
-            """
-            <button type="submit"
-                class="btn btn-success mt-2"
-                x-bind:disabled="loading || !changed">
-                <span class="spinner-border spinner-border-sm"
-                  role="status"
-                  aria-hidden="true"
-                  x-show="loading"></span>
-                &nbsp;Save Properties
-            </button>'
-        """
+
+def create_property_form_field(property_dto):
+    if property_dto.notion_type in NOTION_SELECT_PROPERTIES:
+        form_field = forms.ChoiceField(
+            required=False,
+            choices=[
+                (option["id"], option["name"]) for option in property_dto.options_list
+            ],
         )
+    elif property_dto.notion_type == "checkbox":
+        form_field = forms.BooleanField(required=False)
+    elif property_dto.notion_type == "number":
+        form_field = forms.DecimalField(required=False)
+    elif property_dto.notion_type in NOTION_TEXT_PROPERTIES_SET:
+        form_field = forms.CharField(required=False)
+    else:
+        raise Exception("Unexpected Notion property type for Form!")
+    form_field.label = property_dto.name
+    return form_field
 
-        saved_notification_text = (
-            ""
-            if show_save_notification is False
-            else f'<span class="text-success">{bootstrap_icon_by_icon_name(icon_name="check-circle-fill")}</span> '
-            f'<span class="text-dark">Changes Saved!</span>'
+
+def create_property_form_layout(
+    property_dto_list, premium_property_name_list, show_save_notification
+):
+    unsupported_properties_alert = None
+    if len(premium_property_name_list) > 0:
+        alert_message = f'{bootstrap_icon_by_icon_name(icon_name="info-circle")} '
+        alert_message += "The following properties are currently are not supported in the Free Tier: "
+        alert_message += ", ".join(premium_property_name_list)
+        alert_message += render_to_string("widgets/upgrade-popup.html")
+        unsupported_properties_alert = Alert(
+            content=alert_message,
+            css_class="hide-internal-buttons alert-warning mt-2 mb-0",
         )
 
-        self.helper.layout = Layout(
-            Div(
-                *[
-                    PrependedText(
-                        field,
-                        ""
-                        if notion_property_dto_by_id[field].notion_type == "checkbox"
-                        else icon_by_property_type(
-                            notion_property_dto_by_id[field].notion_type
-                        ),
-                        wrapper_class="col-md-6 mt-1",
-                        css_class="properties-input",
-                        **{"@keyup": "changed=true", "@change": "changed=true"},
-                    )
-                    for field in self.fields
-                ],
-                css_class="d-flex row",
-            ),
-            unsupported_properties_alert,
-            submit_btn,
-            HTML(
-                f'<p class="text-muted mt-2 mb-0" x-show="!changed">{saved_notification_text} No Unsaved Changes.</p>'
-            ),
+    submit_btn = HTML(
+        """
+        <button type="submit"
+            class="btn btn-success mt-2"
+            x-bind:disabled="loading || !changed">
+            <span class="spinner-border spinner-border-sm"
+              role="status"
+              aria-hidden="true"
+              x-show="loading"></span>
+            &nbsp;Save Properties
+        </button>'
+    """
+    )
+
+    saved_notification_text = (
+        ""
+        if show_save_notification is False
+        else f'<span class="text-success">{bootstrap_icon_by_icon_name(icon_name="check-circle-fill")}</span> '
+        f'<span class="text-dark">Changes Saved!</span>'
+    )
+
+    return Layout(
+        Div(
+            *[
+                PrependedText(
+                    property_dto.id,
+                    ""
+                    if property_dto.notion_type == "checkbox"
+                    else icon_by_property_type(property_dto.notion_type),
+                    wrapper_class="col-md-6 mt-1",
+                    css_class="properties-input",
+                    **{"@keyup": "changed=true", "@change": "changed=true"},
+                )
+                for property_dto in property_dto_list
+            ],
+            css_class="d-flex row",
+        ),
+        unsupported_properties_alert,
+        submit_btn,
+        HTML(
+            f'<p class="text-muted mt-2 mb-0" x-show="!changed">{saved_notification_text} No Unsaved Changes.</p>'
+        ),
+    )
+
+
+def create_notion_property_form_class(
+    property_dto_list, premium_property_name_list, show_save_notification
+):
+    class_attribute_dict = {"property_layout": None}
+    if property_dto_list is not None:
+        for property_dto in property_dto_list:
+            class_attribute_dict[property_dto.id] = create_property_form_field(
+                property_dto
+            )
+        class_attribute_dict["property_layout"] = create_property_form_layout(
+            property_dto_list, premium_property_name_list, show_save_notification
         )
+    return type("NotionPropertyForm", (NotionPropertyForm,), class_attribute_dict)
+
+
+def calculate_property_form_schema_hash(
+    property_dto_list, premium_property_name_list, show_save_notification
+):
+    property_schema_list = (
+        None
+        if property_dto_list is None
+        else [
+            [
+                property_dto.id,
+                property_dto.notion_type,
+                property_dto.name,
+                property_dto.options_list,
+            ]
+            for property_dto in property_dto_list
+        ]
+    )
+    return hashlib.sha256(
+        json.dumps(
+            [property_schema_list, premium_property_name_list, show_save_notification],
+            cls=DjangoJSONEncoder,
+        ).encode("utf-8")
+    ).hexdigest()
+
+
+def get_notion_property_form_class(
+    property_dto_list, premium_property_name_list, show_save_notification=False
+):
+    """
+    Returns the form class for the property schema, building its fields and
+    layout only if this process has not built it for the same schema yet.
+    """
+    schema_hash = calculate_property_form_schema_hash(
+        property_dto_list, premium_property_name_list, show_save_notification
+    )
+    with _form_class_lock:
+        form_class = _form_class_by_schema_hash.get(schema_hash)
+        if form_class is not None:
+            _form_class_by_schema_hash.move_to_end(schema_hash)
+            return form_class
+    form_class = create_notion_property_form_class(
+        property_dto_list, premium_property_name_list, show_save_notification
+    )
+    with _form_class_lock:
+        _form_class_by_schema_hash[schema_hash] = form_class
+        while len(_form_class_by_schema_hash) > NOTION_PROPERTY_FORM_CLASS_CACHE_SIZE:
+            _form_class_by_schema_hash.popitem(last=False)
+    return form_class
+
+
+def clear_notion_property_form_class_cache():
+    with _form_class_lock:
+        _form_class_by_schema_hash.clear()
+
+
+def create_notion_property_form(task_model, data=None, show_save_notification=False):
+    property_dto_list = get_form_property_dto_list(task_model)
+    premium_property_name_list = (
+        []
+        if task_model.database is None
+        else task_model.database.get_list_of_premium_property_names()
+    )
+    form_class = get_notion_property_form_class(
+        property_dto_list, premium_property_name_list, show_save_notification
+    )
+    initial_value_by_id = {
+        property_dto.id: property_dto.value for property_dto in property_dto_list or []
+    }
+    return form_class(data, initial=initial_value_by_id, task_model=task_model)
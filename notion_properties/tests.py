@@ -1,6 +1,8 @@
-from django.test import TestCase
+from config.testing import CacheIsolatedTestCase
+from tasks.models import RecurringTask
 
 from .dto import NotionPropertyDto
+from .forms import clear_notion_property_form_class_cache, create_notion_property_form
 
 TEST_NOTION_API_RESP_PROPERTIES_DICT = {
     "Comment": {"id": "!vXu", "type": "rich_text", "rich_text": []},
@@ -45,7 +47,7 @@ TEST_NOTION_API_RESP_PROPERTIES_DICT = {
 
 
 # Create your tests here.
-class TestNotionPropertiesDtoConversions(TestCase):
+class TestNotionPropertiesDtoConversions(CacheIsolatedTestCase):
     def setUp(self):
         self.id = "helloworld"
         self.notion_type = "checkbox"
@@ -140,3 +142,62 @@ class TestNotionPropertiesDtoConversions(TestCase):
             property_dto.get_notion_property_api_dict_for_create_page_request(),
             [{"text": {"content": "Rent"}}],
         )
+
+
+def create_property_dict(property_id, notion_type, value, name):
+    return NotionPropertyDto(
+        id_str=property_id,
+        notion_type_str=notion_type,
+        name_str=name,
+        assign_default_value=False,
+        value=value,
+    ).dto_dict()
+
+
+class TestNotionPropertyForm(CacheIsolatedTestCase):
+    def setUp(self):
+        clear_notion_property_form_class_cache()
+        self.first_task = RecurringTask(
+            pk=1,
+            properties_json=[
+                create_property_dict("done", "checkbox", True, "Done"),
+                create_property_dict("amount", "number", 5, "Amount"),
+            ],
+        )
+        self.second_task = RecurringTask(
+            pk=2,
+            properties_json=[
+                create_property_dict("done", "checkbox", False, "Done"),
+                create_property_dict("amount", "number", 7, "Amount"),
+            ],
+        )
+
+    def test_form_class_is_shared_by_same_schema(self):
+        first_form = create_notion_property_form(self.first_task)
+        second_form = create_notion_property_form(self.second_task)
+        self.assertIs(type(first_form), type(second_form))
+        self.assertIsNot(first_form.helper, second_form.helper)
+        self.assertEqual(
+            first_form.helper.form_action, "/update-recurring-task-properties/1"
+        )
+        self.assertEqual(
+            second_form.helper.form_action, "/update-recurring-task-properties/2"
+        )
+        self.assertEqual(first_form["amount"].value(), 5)
+        self.assertEqual(second_form["amount"].value(), 7)
+
+    def test_form_class_is_rebuilt_for_changed_schema(self):
+        first_form = create_notion_property_form(self.first_task)
+        self.second_task.properties_json[1]["name"] = "Price"
+        second_form = create_notion_property_form(self.second_task)
+        self.assertIsNot(type(first_form), type(second_form))
+        self.assertEqual(second_form.fields["amount"].label, "Price")
+        self.assertEqual(first_form.fields["amount"].label, "Amount")
+
+    def test_bound_form_cleans_posted_values(self):
+        property_form = create_notion_property_form(
+            self.first_task, data={"amount": "12"}, show_save_notification=True
+        )
+        self.assertTrue(property_form.is_valid())
+        self.assertEqual(property_form.cleaned_data["amount"], 12)
+        self.assertFalse(property_form.cleaned_data["done"])
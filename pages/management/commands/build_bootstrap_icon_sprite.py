@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+import config.settings as settings
+from pages.template_tags import (
+    BOOTSTRAP_ICON_BY_ICON_NAME,
+    BOOTSTRAP_ICON_SPRITE_STATIC_PATH,
+    render_bootstrap_icon_sprite,
+)
+
+
+class Command(BaseCommand):
+    help = "Writes every registered Bootstrap Icon into the static sprite sheet."
+
+    def handle(self, *args, **options):
+        sprite_path = settings.BASE_DIR.joinpath(
+            "static", BOOTSTRAP_ICON_SPRITE_STATIC_PATH
+        )
+        sprite_path.write_text(render_bootstrap_icon_sprite())
+        self.stdout.write(
+            f"Wrote {len(BOOTSTRAP_ICON_BY_ICON_NAME)} icons to {sprite_path}."
+        )
@@ -1,3 +1,43 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.test import override_settings
+
+import config.settings as settings
+from config.testing import CacheIsolatedTestCase
+
+from .template_tags import (
+    BOOTSTRAP_ICON_SPRITE_STATIC_PATH,
+    bootstrap_icon_by_icon_name,
+    render_bootstrap_icon_sprite,
+)
+
+
+class TestBootstrapIcons(CacheIsolatedTestCase):
+    def test_inline_icon_has_requested_size(self):
+        icon_html = bootstrap_icon_by_icon_name("send", width=24, height=24)
+        self.assertIn('width="24" height="24"', icon_html)
+        self.assertIn('class="bi bi-send-fill"', icon_html)
+        self.assertIs(icon_html, bootstrap_icon_by_icon_name("send", 24, 24))
+
+    def test_unknown_icon_renders_empty_wrapper(self):
+        self.assertEqual(
+            bootstrap_icon_by_icon_name("unknown"), '<span class="icon-wrapper"></span>'
+        )
+
+    @override_settings(
+        STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage"
+    )
+    @mock.patch("pages.template_tags.settings.BOOTSTRAP_ICON_SPRITE_ENABLED", True)
+    def test_sprite_icon_references_symbol(self):
+        icon_html = bootstrap_icon_by_icon_name("trash")
+        self.assertIn(
+            f'<use href="/static/{BOOTSTRAP_ICON_SPRITE_STATIC_PATH}#trash"/>',
+            icon_html,
+        )
+        self.assertNotIn("<path", icon_html)
+
+    def test_static_sprite_contains_every_icon(self):
+        sprite_path = settings.BASE_DIR.joinpath(
+            "static", BOOTSTRAP_ICON_SPRITE_STATIC_PATH
+        )
+        self.assertEqual(sprite_path.read_text(), render_bootstrap_icon_sprite())
@@ -0,0 +1,96 @@
+import asyncio
+
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+
+import config.settings as settings
+from accounts.models import CustomUser
+from workspaces.models import NotionWorkspaceAccess
+
+
+class AuthorizationContext:
+    def __init__(self, has_workspace_access, recurring_task_count):
+        self.has_workspace_access = has_workspace_access
+        self.recurring_task_count = recurring_task_count
+        self.recurring_task_limit = settings.NUM_FREE_RECURRING_TASKS
+
+    @property
+    def can_create_recurring_task(self):
+        return self.recurring_task_count < self.recurring_task_limit
+
+    @property
+    def num_remaining_recurring_tasks(self):
+        return max(self.recurring_task_limit - self.recurring_task_count, 0)
+
+
+def get_authorization_context_cache_key(user_id):
+    return f"authorization-context:{user_id}"
+
+
+def get_authorization_context(user_model):
+    """
+    Returns what the user is allowed to do, from the cache if it was built for
+    an earlier request. Code that adds or removes tasks or workspace accesses
+    has to call invalidate_authorization_context.
+    """
+    cache_key = get_authorization_context_cache_key(user_model.pk)
+    context_dict = cache.get(cache_key)
+    if context_dict is None:
+        context_dict = {
+            "has_workspace_access": NotionWorkspaceAccess.objects.filter(
+                owner=user_model
+            ).exists(),
+            "recurring_task_count": CustomUser.objects.values_list(
+                "recurring_task_count", flat=True
+            ).get(pk=user_model.pk),
+        }
+        cache.set(
+            cache_key,
+            context_dict,
+            timeout=settings.AUTHORIZATION_CONTEXT_CACHE_SECONDS,
+        )
+    return AuthorizationContext(**context_dict)
+
+
+def invalidate_authorization_context(user_id):
+    cache.delete(get_authorization_context_cache_key(user_id))
+
+
+def get_request_authorization_context(request):
+    authorization_context = getattr(request, "authorization_context", None)
+    if authorization_context is None:
+        authorization_context = get_authorization_context(request.user)
+    return authorization_context
+
+
+class AuthorizationContextMiddleware:
+    """
+    Adds the authorization context of the logged in user to the request. It is
+    loaded on first use, so requests that do not check permissions skip it.
+    Async views have to load it outside of the event loop, like the security
+    decorators do.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Lets Django call this middleware without switching to a thread
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def add_authorization_context(self, request):
+        request.authorization_context = SimpleLazyObject(
+            lambda: get_authorization_context(request.user)
+        )
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        self.add_authorization_context(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        self.add_authorization_context(request)
+        return await self.get_response(request)
@@ -1,64 +1,116 @@
+import asyncio
 from functools import wraps
 from urllib.parse import urlparse
 
+from asgiref.sync import sync_to_async
 from django.contrib import messages
 from django.contrib.auth import REDIRECT_FIELD_NAME
 from django.contrib.auth.views import redirect_to_login
+from django.http import HttpResponseNotAllowed
 from django.shortcuts import resolve_url
 from django.urls import reverse_lazy
 
 import config.settings as settings
-from tasks.models import RecurringTask
-from workspaces.models import NotionWorkspaceAccess
 
+from .authorization_context import get_request_authorization_context
 
-def user_passes_test(
+
+def request_passes_test(
     test_func,
     on_failure_redirect_url=None,
     redirect_field_name=REDIRECT_FIELD_NAME,
     message="",
 ):
     """
-    Decorator for views that checks that the user passes the given test,
+    Decorator for views that checks that the request passes the given test,
     redirecting to the log-in page if necessary. The test should be a callable
-    that takes the user object and returns True if the user passes.
+    that takes the request and returns True if the request passes.
     """
 
+    def redirect_failed_request(request):
+        if len(message) > 0:
+            messages.add_message(
+                request, messages.ERROR, message, extra_tags="alert alert-danger"
+            )
+        path = request.build_absolute_uri()
+        resolved_login_url = resolve_url(on_failure_redirect_url or settings.LOGIN_URL)
+        # If the login url is the same scheme and net location then just
+        # use the path as the "next" url.
+        login_scheme, login_netloc = urlparse(resolved_login_url)[:2]
+        current_scheme, current_netloc = urlparse(path)[:2]
+        if (not login_scheme or login_scheme == current_scheme) and (
+            not login_netloc or login_netloc == current_netloc
+        ):
+            path = request.get_full_path()
+        return redirect_to_login(path, resolved_login_url, redirect_field_name)
+
     def decorator(view_func):
+        if asyncio.iscoroutinefunction(view_func):
+            # the user is loaded lazily from the session and the database,
+            # which can only be done outside of the event loop
+            @wraps(view_func)
+            async def _wrapped_async_view(request, *args, **kwargs):
+                if await sync_to_async(test_func)(request):
+                    return await view_func(request, *args, **kwargs)
+                return await sync_to_async(redirect_failed_request)(request)
+
+            return _wrapped_async_view
+
         @wraps(view_func)
         def _wrapped_view(request, *args, **kwargs):
-            if not test_func(request.user) and len(message) > 0:
-                messages.add_message(
-                    request, messages.ERROR, message, extra_tags="alert alert-danger"
-                )
-            if test_func(request.user):
+            if test_func(request):
                 return view_func(request, *args, **kwargs)
-            path = request.build_absolute_uri()
-            resolved_login_url = resolve_url(
-                on_failure_redirect_url or settings.LOGIN_URL
-            )
-            # If the login url is the same scheme and net location then just
-            # use the path as the "next" url.
-            login_scheme, login_netloc = urlparse(resolved_login_url)[:2]
-            current_scheme, current_netloc = urlparse(path)[:2]
-            if (not login_scheme or login_scheme == current_scheme) and (
-                not login_netloc or login_netloc == current_netloc
-            ):
-                path = request.get_full_path()
-            return redirect_to_login(path, resolved_login_url, redirect_field_name)
+            return redirect_failed_request(request)
 
         return _wrapped_view
 
     return decorator
 
 
+def user_passes_test(test_func, **decorator_kwargs):
+    """
+    Like request_passes_test, for tests that take the user object.
+    """
+    return request_passes_test(
+        lambda request: test_func(request.user), **decorator_kwargs
+    )
+
+
+def async_login_required(view_func=None):
+    """
+    Decorator for async views that require a logged in user, Django's
+    login_required only supports sync views in this version.
+    """
+    actual_decorator = user_passes_test(lambda u: u.is_authenticated)
+    if view_func:
+        return actual_decorator(view_func)
+    return actual_decorator
+
+
+def async_require_http_methods(request_method_list):
+    """
+    Decorator for async views that only accept the given request methods.
+    """
+
+    def decorator(view_func):
+        @wraps(view_func)
+        async def _wrapped_async_view(request, *args, **kwargs):
+            if request.method not in request_method_list:
+                return HttpResponseNotAllowed(request_method_list)
+            return await view_func(request, *args, **kwargs)
+
+        return _wrapped_async_view
+
+    return decorator
+
+
 def notion_workspace_authorization_required(view_func=None):
     """
     Decorator for views that require that the user has an active Workspace.
     """
-    actual_decorator = user_passes_test(
-        lambda u: u.is_authenticated
-        and NotionWorkspaceAccess.objects.filter(owner=u).count() > 0,
+    actual_decorator = request_passes_test(
+        lambda request: request.user.is_authenticated
+        and get_request_authorization_context(request).has_workspace_access,
         on_failure_redirect_url=reverse_lazy("notion-access-prompt"),
         redirect_field_name="",
         message="",
@@ -72,10 +124,9 @@ def check_free_tasks_usage_limit(view_func=None):
     """
     Decorator for views that require to check for Workspace Tasks limit.
     """
-    actual_decorator = user_passes_test(
-        lambda u: u.is_authenticated
-        and RecurringTask.objects.filter(owner=u).count()
-        < settings.NUM_FREE_RECURRING_TASKS,
+    actual_decorator = request_passes_test(
+        lambda request: request.user.is_authenticated
+        and get_request_authorization_context(request).can_create_recurring_task,
         on_failure_redirect_url=reverse_lazy("recurring-tasks-view"),
         redirect_field_name="",
         message=f"You exceeded the limit for the free plan!",
@@ -1 +1,7 @@
-gunicorn -w 4 config.wsgi:application
+# SERVER_INTERFACE=asgi serves config/asgi.py through uvicorn workers, so the async
+# views can wait on Notion without holding a worker for every request
+if [ "$SERVER_INTERFACE" = "asgi" ]; then
+  gunicorn -w 4 -k uvicorn.workers.UvicornWorker config.asgi:application
+else
+  gunicorn -w 4 config.wsgi:application
+fi
@@ -0,0 +1,206 @@
+import asyncio
+import logging
+
+from asgiref.sync import async_to_sync, sync_to_async
+from notion_client import APIResponseError
+from notion_client.errors import APIErrorCode
+
+from config.settings import (
+    NOTION_ASYNC_MAX_CONCURRENCY,
+    NOTION_ASYNC_MAX_CONCURRENCY_PER_WORKSPACE,
+)
+from notion_database.service import (
+    NOTION_REQUEST_EXCEPTIONS,
+    convert_notion_database_resp_dict_to_simple_database_dict,
+    create_async_notion_client,
+    expire_database_schema,
+    get_cached_simple_database_dict,
+    is_missing_notion_object_error,
+    is_transient_notion_error,
+    release_database_schema_refresh,
+    save_refreshed_simple_database_dict,
+)
+
+from .service import (
+    get_or_compile_create_page_payload_for_task,
+    save_created_recurring_task_run,
+    save_recurring_task_run_results,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# The ORM can't be used from within the event loop, so everything the tasks need
+# is loaded before it. Created pages are recorded through sync_to_async, which
+# async_to_sync runs in the calling thread, and all other writes happen after.
+def create_recurring_task_run_groups_in_notion_async(task_runs_by_group_key):
+    cached_database_dict_by_group_key = {
+        group_key: get_cached_simple_database_dict(task_run_model_list[0].task.database)
+        for group_key, task_run_model_list in task_runs_by_group_key.items()
+    }
+    group_result_dict_list = async_to_sync(
+        create_recurring_task_run_groups_in_notion_concurrently
+    )(
+        task_runs_by_group_key=task_runs_by_group_key,
+        cached_database_dict_by_group_key=cached_database_dict_by_group_key,
+    )
+    missing_database_task_pk_list = []
+    compiled_task_model_list = []
+    failed_task_run_error_list = []
+    for group_result_dict in group_result_dict_list:
+        notion_database_model = group_result_dict["notion_database_model"]
+        if group_result_dict["refreshed_database_dict"] is not None:
+            save_refreshed_simple_database_dict(
+                notion_database_model=notion_database_model,
+                simple_database_dict=group_result_dict["refreshed_database_dict"],
+            )
+        elif group_result_dict["failed_to_retrieve_database"]:
+            release_database_schema_refresh(notion_database_model)
+        if group_result_dict["schema_expired"]:
+            expire_database_schema(notion_database_model)
+        missing_database_task_pk_list += group_result_dict[
+            "missing_database_task_pk_list"
+        ]
+        compiled_task_model_list += group_result_dict["compiled_task_model_list"]
+        failed_task_run_error_list += group_result_dict["failed_task_run_error_list"]
+    save_recurring_task_run_results(
+        compiled_task_model_list=compiled_task_model_list,
+        missing_database_task_pk_list=missing_database_task_pk_list,
+        failed_task_run_error_list=failed_task_run_error_list,
+    )
+
+
+async def create_recurring_task_run_groups_in_notion_concurrently(
+    task_runs_by_group_key, cached_database_dict_by_group_key
+):
+    semaphore = asyncio.Semaphore(NOTION_ASYNC_MAX_CONCURRENCY)
+    workspace_semaphore_by_workspace_pk = {}
+    group_coroutine_list = []
+    for group_key, task_run_model_list in task_runs_by_group_key.items():
+        workspace_pk = task_run_model_list[0].task.workspace_id
+        if workspace_pk not in workspace_semaphore_by_workspace_pk:
+            workspace_semaphore_by_workspace_pk[workspace_pk] = asyncio.Semaphore(
+                NOTION_ASYNC_MAX_CONCURRENCY_PER_WORKSPACE
+            )
+        access_token, _ = group_key
+        group_coroutine_list.append(
+            create_recurring_task_run_group_in_notion_async(
+                access_token=access_token,
+                task_run_model_list=task_run_model_list,
+                cached_database_dict=cached_database_dict_by_group_key[group_key],
+                semaphore=semaphore,
+                workspace_semaphore=workspace_semaphore_by_workspace_pk[workspace_pk],
+            )
+        )
+    return await asyncio.gather(*group_coroutine_list)
+
+
+async def create_recurring_task_run_group_in_notion_async(
+    access_token,
+    task_run_model_list,
+    cached_database_dict,
+    semaphore,
+    workspace_semaphore,
+):
+    notion_database_model = task_run_model_list[0].task.database
+    group_result_dict = {
+        "notion_database_model": notion_database_model,
+        "refreshed_database_dict": None,
+        "failed_to_retrieve_database": False,
+        "schema_expired": False,
+        "missing_database_task_pk_list": [],
+        "compiled_task_model_list": [],
+        "failed_task_run_error_list": [],
+    }
+    client = create_async_notion_client(
+        access_token=access_token,
+        max_connections=NOTION_ASYNC_MAX_CONCURRENCY_PER_WORKSPACE,
+    )
+    try:
+        database_dict = cached_database_dict
+        if database_dict is None:
+            # Fetch the schema once for every task in the group
+            try:
+                async with workspace_semaphore, semaphore:
+                    notion_db_schema_resp_dict = await client.databases.retrieve(
+                        database_id=notion_database_model.database_id
+                    )
+            except NOTION_REQUEST_EXCEPTIONS as error:
+                group_result_dict["failed_to_retrieve_database"] = True
+                group_result_dict["failed_task_run_error_list"] = [
+                    (task_run_model, error) for task_run_model in task_run_model_list
+                ]
+                if (
+                    isinstance(error, APIResponseError)
+                    and error.code == APIErrorCode.Unauthorized
+                ):
+                    logger.error(
+                        f"Invalid api token for tasks {[task_run.task_id for task_run in task_run_model_list]}."
+                    )
+                elif not is_transient_notion_error(error):
+                    logger.info(
+                        f"Failed to retrieve Database {notion_database_model.database_id} for Tasks!"
+                    )
+                    group_result_dict["missing_database_task_pk_list"] = [
+                        task_run_model.task_id for task_run_model in task_run_model_list
+                    ]
+                return group_result_dict
+            database_dict = convert_notion_database_resp_dict_to_simple_database_dict(
+                notion_db_schema_resp_dict
+            )
+            group_result_dict["refreshed_database_dict"] = database_dict
+        await asyncio.gather(
+            *[
+                create_page_for_recurring_task_run_async(
+                    client=client,
+                    task_run_model=task_run_model,
+                    database_dict=database_dict,
+                    group_result_dict=group_result_dict,
+                    semaphore=semaphore,
+                    workspace_semaphore=workspace_semaphore,
+                )
+                for task_run_model in task_run_model_list
+            ]
+        )
+        return group_result_dict
+    finally:
+        await client.aclose()
+
+
+async def create_page_for_recurring_task_run_async(
+    client,
+    task_run_model,
+    database_dict,
+    group_result_dict,
+    semaphore,
+    workspace_semaphore,
+):
+    task_model = task_run_model.task
+    page_payload_dict, was_compiled = get_or_compile_create_page_payload_for_task(
+        task_model=task_model,
+        database_dict=database_dict,
+        schema_was_retrieved=group_result_dict["refreshed_database_dict"] is not None,
+    )
+    if was_compiled:
+        group_result_dict["compiled_task_model_list"].append(task_model)
+    try:
+        # A global slot is only taken once the workspace has room, so runs of
+        # one busy workspace can't hold slots the other workspaces need
+        async with workspace_semaphore, semaphore:
+            created_page_dict = await client.pages.create(**page_payload_dict)
+    except Exception as error:
+        if is_missing_notion_object_error(error):
+            group_result_dict["missing_database_task_pk_list"].append(task_model.pk)
+        elif (
+            isinstance(error, APIResponseError)
+            and error.code == APIErrorCode.ValidationError
+        ):
+            # the stored schema might not match the database anymore
+            group_result_dict["schema_expired"] = True
+        group_result_dict["failed_task_run_error_list"].append((task_run_model, error))
+        logger.exception(f"Failed to create recurring task {task_model.pk}.")
+        return
+    await sync_to_async(save_created_recurring_task_run)(
+        task_run_model=task_run_model, notion_page_id=created_page_dict["id"]
+    )
+    logger.debug(f"Created recurring task with id {task_model.pk} successfully.")
@@ -1,28 +1,101 @@
 import logging
+from datetime import timedelta
 
-import httpx
-import notion_client
+from django.db import transaction
+from django.db.models import Count, Min, OuterRef, Q, Subquery
+from django.utils.timezone import now
+from django_q.tasks import async_task
 from notion_client import APIResponseError
+from notion_client.errors import APIErrorCode
 
+from config.settings import (
+    NOTION_ASYNC_JOB_RUNNER_ENABLED,
+    RECURRING_TASK_BATCH_WINDOW_SECONDS,
+    RECURRING_TASK_CATCH_UP_CHUNK_SIZE,
+    RECURRING_TASK_CATCH_UP_GRACE_SECONDS,
+    RECURRING_TASK_RUN_LEASE_SECONDS,
+    RECURRING_TASK_RUN_RETENTION_DAYS,
+    RECURRING_TASK_SCAN_CHUNK_SIZE,
+)
+from notion_database.client_pool import discard_pooled_notion_http_transport
 from notion_database.service import (
-    convert_notion_database_resp_dict_to_simple_database_dict,
+    NOTION_REQUEST_EXCEPTIONS,
+    create_notion_client,
+    expire_database_schema,
+    get_simple_database_dict_with_schema_cache,
+    is_missing_notion_object_error,
+    is_transient_notion_error,
 )
-from notion_properties.dto import NotionPropertyDto
-from notion_properties.service import (
-    create_properties_dict_for_create_page_api_request_from_property_dto_list,
+from tasks.service import (
+    get_or_compile_create_page_payload_for_task,
+    save_created_recurring_task_run,
+    save_recurring_task_run_results,
+    schedule_recurring_task_run_retries,
 )
-from tasks.service import create_notion_task_property_list_from_db_schema
+from workspaces.models import NotionWorkspaceAccess
 
-from .models import RecurringTask
+from .async_jobs import create_recurring_task_run_groups_in_notion_async
+from .models import RecurringTask, RecurringTaskRun
 
 logger = logging.getLogger(__name__)
 
+RECURRING_TASK_BATCH_JOB_FUNC = "tasks.jobs.create_recurring_tasks_in_notion_batch"
+
+
+def annotate_owner_workspace_access(queryset, owner_field_name):
+    # Adds the token and workspace of the first access of the task owner
+    owner_workspace_access_queryset = NotionWorkspaceAccess.objects.filter(
+        owner_id=OuterRef(owner_field_name)
+    ).order_by("pk")
+    return queryset.annotate(
+        owner_access_token=Subquery(
+            owner_workspace_access_queryset.values("access_token")[:1]
+        ),
+        owner_workspace_pk=Subquery(
+            owner_workspace_access_queryset.values("workspace_id")[:1]
+        ),
+    )
+
+
+def query_recurring_task_for_job(task_pk):
+    return (
+        annotate_owner_workspace_access(
+            RecurringTask.objects.select_related("database"), "owner_id"
+        )
+        .filter(pk=task_pk)
+        .first()
+    )
+
+
+def get_database_dict_for_task_job(client, task_model):
+    """
+    Returns the database of the task and whether its schema was retrieved, or
+    None if the database is gone and was unset. Uses the stored schema of the
+    database unless it has gone stale.
+    """
+    try:
+        return get_simple_database_dict_with_schema_cache(
+            client=client, notion_database_model=task_model.database
+        )
+    except NOTION_REQUEST_EXCEPTIONS as error:
+        if (
+            isinstance(error, APIResponseError)
+            and error.code == APIErrorCode.Unauthorized
+        ):
+            discard_pooled_notion_http_transport(task_model.owner_access_token)
+            raise Exception("invalid api token")
+        if is_transient_notion_error(error):
+            # the database is still there, let the cluster retry the job
+            raise
+        logger.info("Failed to retrieve Database for Task!")
+        RecurringTask.objects.filter(pk=task_model.pk).update(database=None)
+        return None, False
+
 
 def create_recurring_task_in_notion(task_pk):
     logger.info(f"Creating new task for PK: {task_pk}")
-    try:
-        task_model = RecurringTask.objects.all().filter(pk=task_pk)[0]
-    except IndexError:
+    task_model = query_recurring_task_for_job(task_pk)
+    if task_model is None:
         raise Exception(
             f"Task with id {task_pk} be created because it did not exist in Database anymore."
         )
@@ -36,57 +109,385 @@ def create_recurring_task_in_notion(task_pk):
             f"Database id was not set for Recurring Task with PK {task_pk}! Cannot handle request."
         )
         return
-    user = task_model.owner
-    workspace_access_queryset = user.workspace_access.all()
-    if workspace_access_queryset.count == 0:
-        raise Exception("User did not have a workspace access.")
-    workspace_access_queried = list(workspace_access_queryset)[0]
-    if task_model.workspace is None:
-        task_model.workspace = workspace_access_queried.workspace
-        task_model.save()
-    elif task_model.workspace.pk != workspace_access_queried.workspace.pk:
-        raise Exception("Users workspace does not match the one they have access to")
-    try:
-        client = notion_client.Client(auth=workspace_access_queried.access_token)
-    except IndexError:
+    if task_model.owner_access_token is None:
         logger.error("User did not have a workspace access")
         raise Exception("User did not have a workspace access.")
-    # Fetch the given database from Notion
+    if task_model.workspace_id is None:
+        task_model.workspace_id = task_model.owner_workspace_pk
+        RecurringTask.objects.filter(pk=task_model.pk).update(
+            workspace_id=task_model.workspace_id
+        )
+    elif task_model.workspace_id != task_model.owner_workspace_pk:
+        raise Exception("Users workspace does not match the one they have access to")
+    client = create_notion_client(access_token=task_model.owner_access_token)
+    database_dict, schema_was_retrieved = get_database_dict_for_task_job(
+        client=client, task_model=task_model
+    )
+    if database_dict is None:
+        return
+    page_payload_dict, was_compiled = get_or_compile_create_page_payload_for_task(
+        task_model=task_model,
+        database_dict=database_dict,
+        schema_was_retrieved=schema_was_retrieved,
+    )
+    if was_compiled:
+        RecurringTask.objects.filter(pk=task_model.pk).update(
+            create_page_payload_json=page_payload_dict
+        )
     try:
-        notion_db_schema_resp_dict = client.databases.retrieve(
-            database_id=notion_db_model.database_id
+        client.pages.create(**page_payload_dict)
+    except APIResponseError as error:
+        if error.code == APIErrorCode.ObjectNotFound:
+            logger.info("Database of Task does not exist anymore!")
+            RecurringTask.objects.filter(pk=task_model.pk).update(database=None)
+            return
+        if error.code == APIErrorCode.ValidationError:
+            # the stored schema might not match the database anymore
+            expire_database_schema(notion_db_model)
+        raise
+    # Don't save any models within the task - will cause back-to-back chains of jobs going off
+    RecurringTask.objects.filter(pk=task_model.pk).update(last_run_at=now())
+    logger.debug(f"Created recurring task with id {task_model.pk} successfully.")
+
+
+def get_runs_to_create_for_due_runs(task_model, due_run_list, missed_before_datetime):
+    if len(due_run_list) == 0:
+        return []
+    if task_model.catch_up_policy == RecurringTask.CatchUpPolicies.RUN_ALL:
+        return due_run_list
+    if (
+        task_model.catch_up_policy == RecurringTask.CatchUpPolicies.SKIP
+        and due_run_list[-1] < missed_before_datetime
+    ):
+        return []
+    return due_run_list[-1:]
+
+
+def claim_due_recurring_task_runs(
+    window_end_datetime,
+    missed_before_datetime,
+    catching_up,
+    chunk_size,
+    leased_until_datetime,
+):
+    # Moving next_run forward inside the lock means no other scan will pick the
+    # same tasks up again, locked rows are left to the scan holding them. The
+    # runs are added to the ledger leased in the same transaction, so they are
+    # retried if the job creating them never finishes.
+    due_task_queryset = RecurringTask.objects.select_for_update(skip_locked=True)
+    if catching_up:
+        due_task_queryset = due_task_queryset.filter(
+            next_run__lt=missed_before_datetime
         )
-    except (httpx.HTTPStatusError, APIResponseError) as error:
-        if error.code == "unauthorized":
-            raise Exception("invalid api token")
-        logger.info("Failed to retrieve Database for Task!")
-        task_model.database = None
-        task_model.save()
+    else:
+        due_task_queryset = due_task_queryset.filter(
+            next_run__gte=missed_before_datetime, next_run__lt=window_end_datetime
+        )
+    with transaction.atomic():
+        due_task_model_list = list(
+            due_task_queryset.only(
+                "pk", "next_run", "interval", "catch_up_policy"
+            ).order_by("next_run", "pk")[:chunk_size]
+        )
+        due_task_run_list = []
+        for task_model in due_task_model_list:
+            due_run_list = task_model.advance_next_run_past(window_end_datetime)
+            due_task_run_list += [
+                (task_model.pk, occurrence)
+                for occurrence in get_runs_to_create_for_due_runs(
+                    task_model=task_model,
+                    due_run_list=due_run_list,
+                    missed_before_datetime=missed_before_datetime,
+                )
+            ]
+        RecurringTask.objects.bulk_update(due_task_model_list, ["next_run"])
+        RecurringTaskRun.objects.bulk_create(
+            [
+                RecurringTaskRun(
+                    task_id=task_pk,
+                    occurrence=occurrence,
+                    next_attempt_at=leased_until_datetime,
+                )
+                for task_pk, occurrence in due_task_run_list
+            ],
+            ignore_conflicts=True,
+        )
+    return due_task_model_list, due_task_run_list
+
+
+def claim_recurring_task_runs_to_retry(chunk_size):
+    """
+    Leases the due retries until the job creating them has timed out, and
+    returns them with the end of the lease, which the job uses to recognize
+    its runs. Runs of a lost job are claimed again once the lease ran out.
+    """
+    leased_until_datetime = now() + timedelta(seconds=RECURRING_TASK_RUN_LEASE_SECONDS)
+    with transaction.atomic():
+        retry_task_run_model_list = list(
+            RecurringTaskRun.objects.select_for_update(skip_locked=True)
+            .filter(next_attempt_at__lte=now(), notion_page_id="")
+            .order_by("next_attempt_at")[:chunk_size]
+        )
+        RecurringTaskRun.objects.filter(
+            pk__in=[task_run_model.pk for task_run_model in retry_task_run_model_list]
+        ).update(next_attempt_at=leased_until_datetime)
+    return [
+        (task_run_model.task_id, task_run_model.occurrence)
+        for task_run_model in retry_task_run_model_list
+    ], leased_until_datetime
+
+
+def log_catch_up_progress(missed_before_datetime):
+    overdue_task_dict = RecurringTask.objects.filter(
+        next_run__lt=missed_before_datetime
+    ).aggregate(overdue_task_count=Count("pk"), oldest_next_run=Min("next_run"))
+    if overdue_task_dict["overdue_task_count"] == 0:
         return
-    database_dict = convert_notion_database_resp_dict_to_simple_database_dict(
-        notion_db_schema_resp_dict
+    logger.warning(
+        f"Catching up on {overdue_task_dict['overdue_task_count']} overdue recurring tasks, "
+        f"{now() - overdue_task_dict['oldest_next_run']} behind."
     )
-    current_task_properties_value_by_id_dict = {
-        property_dict["id"]: property_dict["value"]
-        for property_dict in task_model.properties_json
-    }
-    # Check which properties are still in the Database
-    property_dict_list = create_notion_task_property_list_from_db_schema(
-        db_schema_dict_list=[
-            property_dto.dto_dict() for property_dto in database_dict["properties"]
+
+
+def create_due_recurring_tasks_in_notion():
+    window_end_datetime = now() + timedelta(seconds=RECURRING_TASK_BATCH_WINDOW_SECONDS)
+    missed_before_datetime = now() - timedelta(
+        seconds=RECURRING_TASK_CATCH_UP_GRACE_SECONDS
+    )
+    leased_until_datetime = now() + timedelta(seconds=RECURRING_TASK_RUN_LEASE_SECONDS)
+    due_task_run_count = 0
+    while True:
+        due_task_model_list, due_task_run_list = claim_due_recurring_task_runs(
+            window_end_datetime=window_end_datetime,
+            missed_before_datetime=missed_before_datetime,
+            catching_up=False,
+            chunk_size=RECURRING_TASK_SCAN_CHUNK_SIZE,
+            leased_until_datetime=leased_until_datetime,
+        )
+        if len(due_task_run_list) > 0:
+            async_task(
+                RECURRING_TASK_BATCH_JOB_FUNC, due_task_run_list, leased_until_datetime
+            )
+            due_task_run_count += len(due_task_run_list)
+        if len(due_task_model_list) < RECURRING_TASK_SCAN_CHUNK_SIZE:
+            break
+    logger.info(
+        f"Found {due_task_run_count} recurring task runs due before {window_end_datetime}."
+    )
+    # Tasks missed while the cluster was down are drained a chunk per scan, so
+    # recovering from downtime doesn't exhaust the Notion rate limits.
+    _, missed_task_run_list = claim_due_recurring_task_runs(
+        window_end_datetime=window_end_datetime,
+        missed_before_datetime=missed_before_datetime,
+        catching_up=True,
+        chunk_size=RECURRING_TASK_CATCH_UP_CHUNK_SIZE,
+        leased_until_datetime=leased_until_datetime,
+    )
+    if len(missed_task_run_list) > 0:
+        async_task(
+            RECURRING_TASK_BATCH_JOB_FUNC, missed_task_run_list, leased_until_datetime
+        )
+    retry_task_run_list, leased_until_datetime = claim_recurring_task_runs_to_retry(
+        chunk_size=RECURRING_TASK_CATCH_UP_CHUNK_SIZE
+    )
+    if len(retry_task_run_list) > 0:
+        async_task(
+            RECURRING_TASK_BATCH_JOB_FUNC, retry_task_run_list, leased_until_datetime
+        )
+    log_catch_up_progress(missed_before_datetime=missed_before_datetime)
+
+
+def prune_recurring_task_runs():
+    # Runs with a page or without a pending attempt can't be created again,
+    # their tasks have moved on to later occurrences long ago
+    pruned_task_run_count, _ = (
+        RecurringTaskRun.objects.filter(
+            created_at__lt=now() - timedelta(days=RECURRING_TASK_RUN_RETENTION_DAYS)
+        )
+        .filter(Q(next_attempt_at__isnull=True) | ~Q(notion_page_id=""))
+        .delete()
+    )
+    logger.info(f"Pruned {pruned_task_run_count} recurring task runs.")
+
+
+def get_or_create_recurring_task_runs(task_run_list):
+    existing_task_pk_set = set(
+        RecurringTask.objects.filter(
+            pk__in={task_pk for task_pk, _ in task_run_list}
+        ).values_list("pk", flat=True)
+    )
+    RecurringTaskRun.objects.bulk_create(
+        [
+            RecurringTaskRun(task_id=task_pk, occurrence=occurrence)
+            for task_pk, occurrence in task_run_list
+            if task_pk in existing_task_pk_set
         ],
-        property_value_by_id_dict=current_task_properties_value_by_id_dict,
+        ignore_conflicts=True,
     )
-    # check if the provided property type is that in the schema
-    request_properties_dict = (
-        create_properties_dict_for_create_page_api_request_from_property_dto_list(
-            [
-                NotionPropertyDto.from_dto_dict(property_dict)
-                for property_dict in property_dict_list
-            ]
+    task_run_key_set = set(task_run_list)
+    # the runs come with their task, its database and the access of its owner
+    task_run_queryset = annotate_owner_workspace_access(
+        RecurringTaskRun.objects.filter(
+            task_id__in=existing_task_pk_set,
+            occurrence__in={occurrence for _, occurrence in task_run_list},
+        ).select_related("task__database"),
+        "task__owner_id",
+    )
+    return [
+        task_run_model
+        for task_run_model in task_run_queryset.order_by("occurrence", "task_id")
+        if (task_run_model.task_id, task_run_model.occurrence) in task_run_key_set
+    ]
+
+
+def group_recurring_task_runs_by_access_token_and_database(task_run_model_list):
+    task_runs_by_group_key = {}
+    tasks_without_workspace_by_workspace_pk = {}
+    for task_run_model in task_run_model_list:
+        task_model = task_run_model.task
+        if task_model.database_id is None or task_model.database_id == "":
+            logger.info(
+                f"Database id was not set for Recurring Task with PK {task_model.pk}! Cannot handle request."
+            )
+            continue
+        if task_run_model.owner_access_token is None:
+            logger.error(f"Owner of task {task_model.pk} has no workspace access.")
+            continue
+        if task_model.workspace_id is None:
+            task_model.workspace_id = task_run_model.owner_workspace_pk
+            tasks_without_workspace_by_workspace_pk.setdefault(
+                task_run_model.owner_workspace_pk, []
+            ).append(task_model.pk)
+        elif task_model.workspace_id != task_run_model.owner_workspace_pk:
+            logger.error(
+                f"Workspace of task {task_model.pk} does not match the one its owner has access to."
+            )
+            continue
+        group_key = (task_run_model.owner_access_token, task_model.database_id)
+        task_runs_by_group_key.setdefault(group_key, []).append(task_run_model)
+    for workspace_pk, task_pk_list in tasks_without_workspace_by_workspace_pk.items():
+        RecurringTask.objects.filter(pk__in=task_pk_list).update(
+            workspace_id=workspace_pk
+        )
+    return task_runs_by_group_key
+
+
+def create_recurring_tasks_in_notion_batch(task_run_list, leased_until_datetime=None):
+    """
+    Creates a page for every (task pk, occurrence) pair, skipping runs the
+    ledger already has a page for or that are waiting for a retry, unless the
+    retry is leased to this job. Failed runs are scheduled for a retry or moved
+    to the dead letters.
+    """
+    pending_task_run_model_list = [
+        task_run_model
+        for task_run_model in get_or_create_recurring_task_runs(task_run_list)
+        if task_run_model.notion_page_id == ""
+        and (
+            task_run_model.next_attempt_at is None
+            or task_run_model.next_attempt_at <= now()
+            or task_run_model.next_attempt_at == leased_until_datetime
         )
+    ]
+    if len(pending_task_run_model_list) < len(task_run_list):
+        logger.info(
+            f"Skipping {len(task_run_list) - len(pending_task_run_model_list)} runs that were already created, deleted or are waiting for a retry."
+        )
+    task_runs_by_group_key = group_recurring_task_runs_by_access_token_and_database(
+        pending_task_run_model_list
+    )
+    grouped_task_run_pk_set = {
+        task_run_model.pk
+        for task_run_model_list in task_runs_by_group_key.values()
+        for task_run_model in task_run_model_list
+    }
+    # runs that can't be created release their lease instead of being retried
+    RecurringTaskRun.objects.filter(
+        pk__in=[
+            task_run_model.pk
+            for task_run_model in pending_task_run_model_list
+            if task_run_model.pk not in grouped_task_run_pk_set
+        ]
+    ).update(next_attempt_at=None)
+    if NOTION_ASYNC_JOB_RUNNER_ENABLED:
+        create_recurring_task_run_groups_in_notion_async(task_runs_by_group_key)
+        return
+    for (
+        access_token,
+        database_id,
+    ), task_run_model_list in task_runs_by_group_key.items():
+        create_recurring_task_run_group_in_notion(
+            access_token=access_token,
+            notion_database_model=task_run_model_list[0].task.database,
+            task_run_model_list=task_run_model_list,
+        )
+
+
+def create_recurring_task_run_group_in_notion(
+    access_token, notion_database_model, task_run_model_list
+):
+    client = create_notion_client(access_token=access_token)
+    # Fetch the schema once for every task in the group, if it has gone stale
+    try:
+        (
+            database_dict,
+            schema_was_retrieved,
+        ) = get_simple_database_dict_with_schema_cache(
+            client=client, notion_database_model=notion_database_model
+        )
+    except NOTION_REQUEST_EXCEPTIONS as error:
+        if (
+            isinstance(error, APIResponseError)
+            and error.code == APIErrorCode.Unauthorized
+        ):
+            discard_pooled_notion_http_transport(access_token)
+            logger.error(
+                f"Invalid api token for tasks {[task_run.task_id for task_run in task_run_model_list]}."
+            )
+        elif not is_transient_notion_error(error):
+            logger.info(
+                f"Failed to retrieve Database {notion_database_model.database_id} for Tasks!"
+            )
+            RecurringTask.objects.filter(
+                pk__in=[
+                    task_run_model.task_id for task_run_model in task_run_model_list
+                ]
+            ).update(database=None)
+        schedule_recurring_task_run_retries(
+            [(task_run_model, error) for task_run_model in task_run_model_list]
+        )
+        return
+    missing_database_task_pk_list = []
+    compiled_task_model_list = []
+    failed_task_run_error_list = []
+    for task_run_model in task_run_model_list:
+        task_model = task_run_model.task
+        page_payload_dict, was_compiled = get_or_compile_create_page_payload_for_task(
+            task_model=task_model,
+            database_dict=database_dict,
+            schema_was_retrieved=schema_was_retrieved,
+        )
+        if was_compiled:
+            compiled_task_model_list.append(task_model)
+        try:
+            created_page_dict = client.pages.create(**page_payload_dict)
+        except Exception as error:
+            if is_missing_notion_object_error(error):
+                missing_database_task_pk_list.append(task_model.pk)
+            elif (
+                isinstance(error, APIResponseError)
+                and error.code == APIErrorCode.ValidationError
+            ):
+                expire_database_schema(notion_database_model)
+            failed_task_run_error_list.append((task_run_model, error))
+            logger.exception(f"Failed to create recurring task {task_model.pk}.")
+            continue
+        save_created_recurring_task_run(
+            task_run_model=task_run_model, notion_page_id=created_page_dict["id"]
+        )
+        logger.debug(f"Created recurring task with id {task_model.pk} successfully.")
+    save_recurring_task_run_results(
+        compiled_task_model_list=compiled_task_model_list,
+        missing_database_task_pk_list=missing_database_task_pk_list,
+        failed_task_run_error_list=failed_task_run_error_list,
     )
-    page_parent_dict = {"database_id": notion_db_model.database_id}
-    client.pages.create(parent=page_parent_dict, properties=request_properties_dict)
-    # Don't save any models within the task - will cause back-to-back chains of jobs going off
-    logger.debug(f"Created recurring task with id {task_model.pk} successfully.")
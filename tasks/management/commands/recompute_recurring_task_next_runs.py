@@ -0,0 +1,71 @@
+from datetime import datetime
+
+import pytz
+from django.core.management.base import BaseCommand
+
+from tasks.models import RecurringTask, calculate_next_run
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the next run of every recurring task from its start time and "
+        "interval, then levels the tasks that have a schedule tolerance."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        # Every task is computed against the same instant, like one run of the scheduler
+        now_datetime = datetime.now(pytz.utc)
+        task_column_iterator = (
+            RecurringTask.objects.order_by("pk")
+            .values_list("pk", "start_time", "interval")
+            .iterator(chunk_size=batch_size)
+        )
+        updated_task_count = 0
+        task_model_batch = []
+        for task_pk, start_time, interval in task_column_iterator:
+            task_model_batch.append(
+                RecurringTask(
+                    pk=task_pk,
+                    next_run=calculate_next_run(
+                        start_time=start_time,
+                        interval=interval,
+                        now_datetime=now_datetime,
+                    ),
+                )
+            )
+            if len(task_model_batch) == batch_size:
+                RecurringTask.objects.bulk_update(task_model_batch, ["next_run"])
+                updated_task_count += len(task_model_batch)
+                task_model_batch = []
+        RecurringTask.objects.bulk_update(task_model_batch, ["next_run"])
+        updated_task_count += len(task_model_batch)
+        leveled_task_count = self.level_tolerant_task_next_runs(batch_size)
+        self.stdout.write(
+            f"Recomputed next run of {updated_task_count} recurring tasks, "
+            f"{leveled_task_count} of them were moved within their tolerance."
+        )
+
+    def level_tolerant_task_next_runs(self, batch_size):
+        # Runs after every exact next run is written, so each tolerant task is
+        # leveled against the recomputed schedule and the tasks leveled before it
+        leveled_task_count = 0
+        tolerant_task_iterator = (
+            RecurringTask.objects.filter(schedule_tolerance_minutes__gt=0)
+            .order_by("pk")
+            .only("pk", "next_run", "schedule_tolerance_minutes")
+            .iterator(chunk_size=batch_size)
+        )
+        for task_model in tolerant_task_iterator:
+            leveled_next_run = task_model.calculate_leveled_next_run(
+                task_model.next_run
+            )
+            if leveled_next_run != task_model.next_run:
+                RecurringTask.objects.filter(pk=task_model.pk).update(
+                    next_run=leveled_next_run
+                )
+                leveled_task_count += 1
+        return leveled_task_count
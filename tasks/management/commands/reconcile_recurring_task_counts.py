@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from accounts.models import CustomUser
+from security.authorization_context import invalidate_authorization_context
+
+
+class Command(BaseCommand):
+    help = "Recounts the recurring tasks of every user and fixes stored counts that drifted."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        user_count_iterator = (
+            CustomUser.objects.order_by("pk")
+            .annotate(actual_task_count=Count("tasks"))
+            .values_list("pk", "recurring_task_count", "actual_task_count")
+            .iterator(chunk_size=batch_size)
+        )
+        fixed_user_count = 0
+        user_model_batch = []
+        for user_pk, stored_task_count, actual_task_count in user_count_iterator:
+            if stored_task_count == actual_task_count:
+                continue
+            user_model_batch.append(
+                CustomUser(pk=user_pk, recurring_task_count=actual_task_count)
+            )
+            if len(user_model_batch) == batch_size:
+                fixed_user_count += self.save_user_batch(user_model_batch)
+                user_model_batch = []
+        fixed_user_count += self.save_user_batch(user_model_batch)
+        self.stdout.write(f"Fixed recurring task count of {fixed_user_count} users.")
+
+    def save_user_batch(self, user_model_batch):
+        CustomUser.objects.bulk_update(user_model_batch, ["recurring_task_count"])
+        for user_model in user_model_batch:
+            invalidate_authorization_context(user_model.pk)
+        return len(user_model_batch)
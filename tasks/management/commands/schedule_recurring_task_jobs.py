@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django_q.models import Schedule
+
+DUE_RECURRING_TASKS_JOB_FUNC = "tasks.jobs.create_due_recurring_tasks_in_notion"
+PRUNE_RECURRING_TASK_RUNS_JOB_FUNC = "tasks.jobs.prune_recurring_task_runs"
+
+
+class Command(BaseCommand):
+    help = (
+        "Registers the django-q schedules that run due recurring tasks in batches "
+        "and prune the run ledger."
+    )
+
+    def handle(self, *args, **options):
+        for func, schedule_defaults in [
+            (
+                DUE_RECURRING_TASKS_JOB_FUNC,
+                {
+                    "name": "create-due-recurring-tasks",
+                    "schedule_type": Schedule.MINUTES,
+                    "minutes": 1,
+                    "repeats": -1,
+                },
+            ),
+            (
+                PRUNE_RECURRING_TASK_RUNS_JOB_FUNC,
+                {
+                    "name": "prune-recurring-task-runs",
+                    "schedule_type": Schedule.DAILY,
+                    "repeats": -1,
+                },
+            ),
+        ]:
+            schedule, was_created = Schedule.objects.get_or_create(
+                func=func, defaults=schedule_defaults
+            )
+            if was_created:
+                self.stdout.write(f"Created schedule for {func}.")
+            else:
+                self.stdout.write(f"Schedule for {func} exists.")
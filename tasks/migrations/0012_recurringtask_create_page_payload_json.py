@@ -0,0 +1,24 @@
+# Generated by Django 3.2 on 2026-10-18 11:40
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0011_alter_recurringtask_start_time"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recurringtask",
+            name="create_page_payload_json",
+            field=models.JSONField(
+                blank=True,
+                default=None,
+                encoder=django.core.serializers.json.DjangoJSONEncoder,
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 3.2 on 2026-10-18 11:43
+
+from django.db import migrations, models
+
+RECURRING_TASK_JOB_FUNC = "tasks.jobs.create_recurring_task_in_notion"
+
+
+def copy_next_run_from_scheduler_job(apps, schema_editor):
+    RecurringTask = apps.get_model("tasks", "RecurringTask")
+    task_model_list = list(
+        RecurringTask.objects.filter(scheduler_job__isnull=False).select_related(
+            "scheduler_job"
+        )
+    )
+    for task_model in task_model_list:
+        task_model.next_run = task_model.scheduler_job.next_run
+    RecurringTask.objects.bulk_update(task_model_list, ["next_run"], batch_size=1000)
+
+
+def delete_recurring_task_schedules(apps, schema_editor):
+    Schedule = apps.get_model("django_q", "Schedule")
+    Schedule.objects.filter(func=RECURRING_TASK_JOB_FUNC).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("django_q", "0014_schedule_cluster"),
+        ("tasks", "0012_recurringtask_create_page_payload_json"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recurringtask",
+            name="next_run",
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(
+            copy_next_run_from_scheduler_job, migrations.RunPython.noop
+        ),
+        migrations.RemoveField(
+            model_name="recurringtask",
+            name="scheduler_job",
+        ),
+        migrations.RunPython(
+            delete_recurring_task_schedules, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.2 on 2026-10-18 11:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0013_recurringtask_next_run"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recurringtask",
+            name="catch_up_policy",
+            field=models.CharField(
+                choices=[
+                    ("skip", "Skip Missed Pages"),
+                    ("once", "Create One Page"),
+                    ("all", "Create Every Missed Page"),
+                ],
+                default="once",
+                max_length=10,
+            ),
+        ),
+        migrations.AddField(
+            model_name="recurringtask",
+            name="last_run_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2 on 2026-10-18 11:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0014_recurringtask_catch_up_policy"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recurringtask",
+            name="schedule_tolerance_minutes",
+            field=models.PositiveSmallIntegerField(
+                choices=[
+                    (0, "Exactly On Time"),
+                    (5, "Up To 5 Minutes Early"),
+                    (15, "Up To 15 Minutes Early"),
+                    (30, "Up To 30 Minutes Early"),
+                    (60, "Up To An Hour Early"),
+                ],
+                default=0,
+            ),
+        ),
+    ]
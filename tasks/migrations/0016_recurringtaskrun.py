@@ -0,0 +1,48 @@
+# Generated by Django 3.2 on 2026-10-18 11:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0015_recurringtask_schedule_tolerance_minutes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RecurringTaskRun",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("occurrence", models.DateTimeField()),
+                (
+                    "notion_page_id",
+                    models.CharField(blank=True, default="", max_length=255),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "task",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="runs",
+                        to="tasks.recurringtask",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="recurringtaskrun",
+            constraint=models.UniqueConstraint(
+                fields=("task", "occurrence"), name="unique_task_run_occurrence"
+            ),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 3.2 on 2026-10-18 11:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0016_recurringtaskrun"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recurringtaskrun",
+            name="attempt_count",
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="recurringtaskrun",
+            name="last_error",
+            field=models.TextField(blank=True, default=""),
+        ),
+        migrations.AddField(
+            model_name="recurringtaskrun",
+            name="next_attempt_at",
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.CreateModel(
+            name="RecurringTaskDeadLetter",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("occurrence", models.DateTimeField()),
+                ("attempt_count", models.PositiveSmallIntegerField()),
+                ("last_error", models.TextField(blank=True, default="")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "task",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="dead_letters",
+                        to="tasks.recurringtask",
+                    ),
+                ),
+            ],
+        ),
+    ]
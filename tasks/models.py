@@ -1,19 +1,64 @@
 from datetime import datetime, timedelta
 
+import arrow
 import pytz
 from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.db.models import Count
+from django.db.models.functions import TruncMinute
 from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
 from django_q.models import Schedule
 
 from accounts.models import CustomUser
+from config.settings import RECURRING_TASK_MAX_DUE_TASKS_PER_MINUTE
 
 # Create your models here.
 from notion_database.models import NotionDatabase
 from workspaces.models import NotionWorkspace
 
 
+def calculate_days_till_next_run(start_time, interval, now_datetime):
+    date_difference = (now_datetime - start_time).days
+    if now_datetime < start_time:
+        return abs(date_difference)
+    if date_difference == 0:
+        return 0
+    return (int(interval) - 1) - (date_difference % int(interval))
+
+
+def calculate_next_run(start_time, interval, now_datetime):
+    """
+    Takes plain column values so that next runs can be recomputed for many
+    tasks at once without loading the models.
+    """
+    if now_datetime < start_time:
+        return start_time
+    next_run_datetime_without_day_translation = datetime(
+        year=now_datetime.year,
+        month=now_datetime.month,
+        minute=start_time.minute,
+        hour=start_time.hour,
+        second=start_time.second,
+        day=now_datetime.day,
+        tzinfo=pytz.utc,
+    )
+    # days till next task only translates
+    next_run_datetime_with_translation = (
+        next_run_datetime_without_day_translation
+        + timedelta(
+            days=calculate_days_till_next_run(
+                start_time=start_time, interval=interval, now_datetime=now_datetime
+            )
+        )
+    )
+    return (
+        next_run_datetime_with_translation
+        if next_run_datetime_with_translation > now_datetime
+        else next_run_datetime_with_translation + timedelta(days=1)
+    )
+
+
 class RecurringTask(models.Model):
     class TaskIntervals(models.TextChoices):
         EVERY_DAY = "1", _("Every Day")
@@ -21,6 +66,18 @@ class RecurringTask(models.Model):
         EVERY_30_DAYS = "30", _("Every 30 Days")
         EVERY_365_DAYS = "365", _("Every 365 Days")
 
+    class CatchUpPolicies(models.TextChoices):
+        SKIP = "skip", _("Skip Missed Pages")
+        RUN_ONCE = "once", _("Create One Page")
+        RUN_ALL = "all", _("Create Every Missed Page")
+
+    class ScheduleTolerances(models.IntegerChoices):
+        EXACT = 0, _("Exactly On Time")
+        FIVE_MINUTES = 5, _("Up To 5 Minutes Early")
+        FIFTEEN_MINUTES = 15, _("Up To 15 Minutes Early")
+        THIRTY_MINUTES = 30, _("Up To 30 Minutes Early")
+        SIXTY_MINUTES = 60, _("Up To An Hour Early")
+
     name = models.CharField(max_length=255, default="New Page")
     # ID used to find original task this one is being cloned from
     database = models.ForeignKey(
@@ -42,37 +99,39 @@ class RecurringTask(models.Model):
     )
     start_time = models.DateTimeField(default=now() + timedelta(days=1))
     properties_json = models.JSONField(encoder=DjangoJSONEncoder, default=dict)
-    scheduler_job = models.OneToOneField(
-        Schedule,
-        on_delete=models.CASCADE,
-        blank=True,
-        null=True,
-        default=None,
-        related_name="related_recurring_task",
+    # Arguments for the Notion create page request, rebuilt whenever the name,
+    # the properties or the schema of the database change
+    create_page_payload_json = models.JSONField(
+        encoder=DjangoJSONEncoder, null=True, blank=True, default=None
     )
+    # When the page is created next, scanned by the due recurring tasks job
+    next_run = models.DateTimeField(null=True, blank=True, db_index=True)
     interval = models.CharField(
         max_length=30,
         choices=TaskIntervals.choices,
         default=TaskIntervals.EVERY_DAY,
     )
+    # What to do with runs that were missed while the job cluster was down
+    catch_up_policy = models.CharField(
+        max_length=10,
+        choices=CatchUpPolicies.choices,
+        default=CatchUpPolicies.RUN_ONCE,
+    )
+    last_run_at = models.DateTimeField(null=True, blank=True)
+    # Lets the scheduler move the run earlier to minutes with fewer tasks due
+    schedule_tolerance_minutes = models.PositiveSmallIntegerField(
+        choices=ScheduleTolerances.choices, default=ScheduleTolerances.EXACT
+    )
 
     @property
     def starting_date_is_in_future(self):
-        return now() < datetime.fromisoformat(self.start_time.isoformat())
+        return now() < self.start_time
 
     @property
     def days_till_next_task(self):
-        date_difference = (
-            now() - datetime.fromisoformat(self.start_time.isoformat())
-        ).days
-        if self.starting_date_is_in_future:
-            return abs(date_difference)
-        if date_difference == 0:
-            return 0
-        days_till_task_is_posted = (int(self.interval) - 1) - (
-            date_difference % int(self.interval)
+        return calculate_days_till_next_run(
+            start_time=self.start_time, interval=self.interval, now_datetime=now()
         )
-        return days_till_task_is_posted
 
     @property
     def days_till_schedule_preview_text(self):
@@ -99,50 +158,115 @@ class RecurringTask(models.Model):
         )
 
     def calculate_next_start_time_for_job(self):
-        start_time_as_datetime = datetime.fromisoformat(self.start_time.isoformat())
-        timezone_aware_now = datetime.now(start_time_as_datetime.tzinfo)
-        if timezone_aware_now < start_time_as_datetime:
-            return start_time_as_datetime
-        next_run_datetime_without_day_translation = datetime(
-            year=timezone_aware_now.year,
-            month=timezone_aware_now.month,
-            minute=start_time_as_datetime.minute,
-            hour=start_time_as_datetime.hour,
-            second=start_time_as_datetime.second,
-            day=timezone_aware_now.day,
-            tzinfo=pytz.utc,
-        )
-        # days till next task only translates
-        next_run_datetime_with_translation = (
-            next_run_datetime_without_day_translation
-            + timedelta(days=self.days_till_next_task)
-        )
-        return (
-            next_run_datetime_with_translation
-            if next_run_datetime_with_translation > timezone_aware_now
-            else next_run_datetime_with_translation + timedelta(days=1)
+        return calculate_next_run(
+            start_time=self.start_time,
+            interval=self.interval,
+            now_datetime=datetime.now(self.start_time.tzinfo),
         )
 
-    def save(self, *args, **kwargs):
-        is_scheduler_job_created_from_save = self.scheduler_job is None
-
-        next_start_time_for_job_datetime = self.calculate_next_start_time_for_job()
-        if is_scheduler_job_created_from_save:
-            self.scheduler_job = Schedule.objects.create(
-                func="tasks.jobs.create_recurring_task_in_notion",
-                next_run=next_start_time_for_job_datetime,
-                schedule_type=self.get_interval_as_djangoq_schedule_type(),
+    def shift_run_by_interval(self, run_datetime):
+        # Moves the run forward the same way the django-q scheduler used to
+        schedule_type = self.get_interval_as_djangoq_schedule_type()
+        if schedule_type == Schedule.DAILY:
+            return run_datetime.shift(days=+1)
+        if schedule_type == Schedule.WEEKLY:
+            return run_datetime.shift(weeks=+1)
+        if schedule_type == Schedule.MONTHLY:
+            return run_datetime.shift(months=+1)
+        return run_datetime.shift(years=+1)
+
+    def advance_next_run_past(self, end_datetime):
+        """
+        Moves next_run to the first run at or after end_datetime and returns
+        every run that was passed over on the way.
+        """
+        passed_run_list = []
+        next_run = arrow.get(self.next_run)
+        while next_run < arrow.get(end_datetime):
+            passed_run_list.append(next_run.datetime)
+            next_run = self.shift_run_by_interval(next_run)
+        self.next_run = next_run.datetime
+        return passed_run_list
+
+    def calculate_leveled_next_run(self, next_run):
+        """
+        Picks the latest minute within the tolerance window that has fewer than
+        RECURRING_TASK_MAX_DUE_TASKS_PER_MINUTE tasks due, or the least busy one
+        if every minute is full.
+        """
+        candidate_run_list = [
+            next_run - timedelta(minutes=minutes_early)
+            for minutes_early in range(self.schedule_tolerance_minutes + 1)
+            if next_run - timedelta(minutes=minutes_early) > now()
+        ]
+        if len(candidate_run_list) == 0:
+            return next_run
+        due_task_count_by_minute = dict(
+            RecurringTask.objects.filter(
+                next_run__gte=candidate_run_list[-1].replace(second=0, microsecond=0),
+                next_run__lt=next_run.replace(second=0, microsecond=0)
+                + timedelta(minutes=1),
             )
-        else:
-            Schedule.objects.filter(id=self.scheduler_job_id).update(
-                next_run=next_start_time_for_job_datetime,
-                schedule_type=self.get_interval_as_djangoq_schedule_type(),
+            .exclude(pk=self.pk)
+            .annotate(due_minute=TruncMinute("next_run"))
+            .values("due_minute")
+            .annotate(due_task_count=Count("pk"))
+            .values_list("due_minute", "due_task_count")
+        )
+
+        def get_due_task_count(candidate_run):
+            return due_task_count_by_minute.get(
+                candidate_run.replace(second=0, microsecond=0), 0
             )
+
+        for candidate_run in candidate_run_list:
+            if (
+                get_due_task_count(candidate_run)
+                < RECURRING_TASK_MAX_DUE_TASKS_PER_MINUTE
+            ):
+                return candidate_run
+        return min(candidate_run_list, key=get_due_task_count)
+
+    def reschedule(self):
+        # Has to be called after changing the start time, interval or tolerance
+        self.next_run = self.calculate_next_start_time_for_job()
+        if self.schedule_tolerance_minutes > 0:
+            self.next_run = self.calculate_leveled_next_run(self.next_run)
+
+    def save(self, *args, **kwargs):
+        if self.next_run is None:
+            self.reschedule()
         super().save(*args, **kwargs)
-        if is_scheduler_job_created_from_save:
-            Schedule.objects.filter(id=self.scheduler_job_id).update(args=f"{self.pk}")
 
-    def delete(self, *args, **kwargs):
-        super().delete(*args, **kwargs)
-        if self.scheduler_job:
-            self.scheduler_job.delete()
+
+class RecurringTaskRun(models.Model):
+    # Ledger of the pages created for every run of a task, checked before a page
+    # is created so retried jobs don't create the same page twice
+    task = models.ForeignKey(
+        RecurringTask, on_delete=models.CASCADE, related_name="runs"
+    )
+    occurrence = models.DateTimeField()
+    notion_page_id = models.CharField(max_length=255, blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Failed runs are retried from the ledger with exponential backoff
+    attempt_count = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    last_error = models.TextField(blank=True, default="")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["task", "occurrence"], name="unique_task_run_occurrence"
+            )
+        ]
+
+
+class RecurringTaskDeadLetter(models.Model):
+    # Runs that still failed after every retry, moved out of the run ledger
+    task = models.ForeignKey(
+        RecurringTask, on_delete=models.CASCADE, related_name="dead_letters"
+    )
+    occurrence = models.DateTimeField()
+    attempt_count = models.PositiveSmallIntegerField()
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
@@ -1,23 +1,57 @@
+import json
 import logging
-from datetime import datetime, timezone
+import random
+from datetime import datetime, timedelta, timezone
 
 import pytz
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import F
+from django.utils.timezone import now
 from notion_client import APIResponseError
+from notion_client.errors import APIErrorCode
 
 import notion_properties
+from accounts.models import CustomUser
+from config.settings import (
+    RECURRING_TASK_RUN_MAX_ATTEMPTS,
+    RECURRING_TASK_RUN_RETRY_BASE_SECONDS,
+    RECURRING_TASK_RUN_RETRY_MAX_SECONDS,
+)
 from notion_database.service import (
+    NOTION_REQUEST_EXCEPTIONS,
+    aquery_user_notion_database_with_api_by_id_as_dict,
+    get_notion_retry_after_seconds,
     get_or_update_database_from_simple_database_dict_returning_model,
+    get_stored_simple_database_dict,
+    is_missing_notion_object_error,
+    is_retryable_notion_error,
+    is_transient_notion_error,
     query_user_notion_database_with_api_by_id_as_dict,
+    upsert_database_from_simple_database_dict,
 )
 from notion_properties.constants import IGNORED_PROPERTIES_SET
 from notion_properties.dto import NotionPropertyDto
+from notion_properties.service import (
+    create_properties_dict_for_create_page_api_request_from_property_dto_list,
+)
+from security.authorization_context import invalidate_authorization_context
 from workspaces.service import NotionAccessTokenInvalidException
 
-from .models import RecurringTask
+from .models import RecurringTask, RecurringTaskDeadLetter, RecurringTaskRun
 
 # Get an instance of a logger
 logger = logging.getLogger(__name__)
 
+# Tasks are loaded before the Notion request that refreshes their database, only
+# these columns are written so a next run the scanner advanced meanwhile is kept
+TASK_DATABASE_UPDATE_FIELDS = [
+    "database",
+    "properties_json",
+    "create_page_payload_json",
+]
+
 
 class RecurringTaskNotFoundException(Exception):
     pass
@@ -55,9 +89,55 @@ def query_task_by_user_and_pk(user, task_pk):
         )
 
 
+def create_recurring_task_for_owner(owner_user_model, **task_field_dict):
+    with transaction.atomic():
+        created_task = RecurringTask.objects.create(
+            owner=owner_user_model, **task_field_dict
+        )
+        CustomUser.objects.filter(pk=owner_user_model.pk).update(
+            recurring_task_count=F("recurring_task_count") + 1
+        )
+    invalidate_authorization_context(owner_user_model.pk)
+    return created_task
+
+
+def delete_recurring_task_of_owner(recurring_task_model):
+    with transaction.atomic():
+        recurring_task_model.delete()
+        # a count that drifted to zero is left for the reconcile command
+        CustomUser.objects.filter(
+            pk=recurring_task_model.owner_id, recurring_task_count__gt=0
+        ).update(recurring_task_count=F("recurring_task_count") - 1)
+    invalidate_authorization_context(recurring_task_model.owner_id)
+
+
 def update_recurring_task_interval(user, task_pk, interval_value_str):
     updated_recurring_task = query_task_by_user_and_pk(user, task_pk)
     updated_recurring_task.interval = interval_value_str
+    updated_recurring_task.reschedule()
+    updated_recurring_task.save()
+    return updated_recurring_task
+
+
+def update_recurring_task_catch_up_policy(user, task_pk, catch_up_policy_str):
+    if catch_up_policy_str not in RecurringTask.CatchUpPolicies.values:
+        raise RecurringTaskBadFormData()
+    updated_recurring_task = query_task_by_user_and_pk(user, task_pk)
+    updated_recurring_task.catch_up_policy = catch_up_policy_str
+    updated_recurring_task.save()
+    return updated_recurring_task
+
+
+def update_recurring_task_schedule_tolerance(user, task_pk, tolerance_minutes_str):
+    try:
+        tolerance_minutes = int(tolerance_minutes_str)
+    except ValueError:
+        raise RecurringTaskBadFormData()
+    if tolerance_minutes not in RecurringTask.ScheduleTolerances.values:
+        raise RecurringTaskBadFormData()
+    updated_recurring_task = query_task_by_user_and_pk(user, task_pk)
+    updated_recurring_task.schedule_tolerance_minutes = tolerance_minutes
+    updated_recurring_task.reschedule()
     updated_recurring_task.save()
     return updated_recurring_task
 
@@ -68,6 +148,7 @@ def update_recurring_task_name(user, task_pk, new_task_name_str):
     update_recurring_task_property_title_from_name(
         recurring_task=updated_recurring_task
     )
+    update_recurring_task_create_page_payload(recurring_task=updated_recurring_task)
     updated_recurring_task.save()
     return updated_recurring_task
 
@@ -93,36 +174,37 @@ def update_recurring_task_start_time(
     )
     updated_recurring_task.start_time = start_date_utc_datetime
     updated_recurring_task.start_date = start_date_utc_datetime
+    updated_recurring_task.reschedule()
     updated_recurring_task.save()
     return updated_recurring_task
 
 
-def update_task_notion_database(user, database_id, task_pk):
-    try:
-        recurring_task_model_to_be_updated = RecurringTask.objects.filter(
-            owner=user, pk=task_pk
-        ).prefetch_related("database")[0]
-    except IndexError:
+def get_recurring_task_for_database_update(user, task_pk):
+    recurring_task_model = (
+        RecurringTask.objects.filter(owner=user, pk=task_pk)
+        .select_related("database")
+        .first()
+    )
+    if recurring_task_model is None:
         raise RecurringTaskNotFoundException(
             f"Could not find recurring task that was updated with pk {task_pk}"
         )
-    notion_db_id_str = database_id
-    try:
-        task_database_dict = query_user_notion_database_with_api_by_id_as_dict(
-            user_model=user, database_id_str=notion_db_id_str
-        )
+    return recurring_task_model
+
+
+def save_recurring_task_database(recurring_task_model, task_database_dict):
+    # task_database_dict is None if the database could not be retrieved from Notion
+    if task_database_dict is None:
+        recurring_task_model.database = None
+    else:
         task_database = (
             get_or_update_database_from_simple_database_dict_returning_model(
                 simple_database_dict=task_database_dict
             )
         )
-        recurring_task_model_to_be_updated.database = task_database
-        current_task_property_dict_list = (
-            recurring_task_model_to_be_updated.properties_json
-        )
-        if current_task_property_dict_list is None:
-            recurring_task_model_to_be_updated.properties_json = dict()
-        recurring_task_model_to_be_updated.properties_json = (
+        recurring_task_model.database = task_database
+        current_task_property_dict_list = recurring_task_model.properties_json or []
+        recurring_task_model.properties_json = (
             create_notion_task_property_list_from_db_schema(
                 db_schema_dict_list=task_database.properties_schema_json,
                 property_value_by_id_dict={
@@ -131,12 +213,45 @@ def update_task_notion_database(user, database_id, task_pk):
                 },
             )
         )
+    update_recurring_task_create_page_payload(recurring_task=recurring_task_model)
+    recurring_task_model.save(update_fields=TASK_DATABASE_UPDATE_FIELDS)
+    return recurring_task_model
+
+
+def update_task_notion_database(user, database_id, task_pk):
+    recurring_task_model = get_recurring_task_for_database_update(
+        user=user, task_pk=task_pk
+    )
+    try:
+        task_database_dict = query_user_notion_database_with_api_by_id_as_dict(
+            user_model=user, database_id_str=database_id
+        )
     except APIResponseError as error:
         if error.code == "unauthorized":
             raise NotionAccessTokenInvalidException()
-        recurring_task_model_to_be_updated.database = None
-    recurring_task_model_to_be_updated.save()
-    return recurring_task_model_to_be_updated
+        task_database_dict = None
+    return save_recurring_task_database(
+        recurring_task_model=recurring_task_model,
+        task_database_dict=task_database_dict,
+    )
+
+
+async def aupdate_task_notion_database(user, database_id, task_pk):
+    recurring_task_model = await sync_to_async(get_recurring_task_for_database_update)(
+        user=user, task_pk=task_pk
+    )
+    try:
+        task_database_dict = await aquery_user_notion_database_with_api_by_id_as_dict(
+            user_model=user, database_id_str=database_id
+        )
+    except NOTION_REQUEST_EXCEPTIONS as error:
+        if not is_task_database_missing_after_refresh_error(error):
+            return recurring_task_model, False
+        task_database_dict = None
+    return await sync_to_async(save_recurring_task_database)(
+        recurring_task_model=recurring_task_model,
+        task_database_dict=task_database_dict,
+    )
 
 
 def update_task_notion_properties_from_request_dict(
@@ -152,29 +267,120 @@ def update_task_notion_properties_from_request_dict(
         property_value_by_id_dict=property_value_by_id_dict,
     )
     update_recurring_task_property_title_from_name(recurring_task=task_model)
-    task_model.save()
+    update_recurring_task_create_page_payload(recurring_task=task_model)
+    task_model.save(update_fields=["properties_json", "create_page_payload_json"])
     return task_model
 
 
-def get_recurring_task_with_properties_update(task_pk, owner_user_model):
-    try:
-        recurring_task_model = RecurringTask.objects.filter(
-            pk=task_pk, owner=owner_user_model
-        )[0]
-    except IndexError:
+def get_recurring_task(task_pk, owner_user_model):
+    recurring_task_model = (
+        RecurringTask.objects.filter(pk=task_pk, owner=owner_user_model)
+        .select_related("database")
+        .first()
+    )
+    if recurring_task_model is None:
         raise RecurringTaskNotFoundException(
             f"Could not find a recurring task for pk {task_pk}"
         )
+    return recurring_task_model
+
+
+def save_refreshed_recurring_task_properties(recurring_task_model, task_database_dict):
+    """
+    Rebuilds the task properties from the retrieved database schema and returns
+    the task and whether its properties changed, so the page rendered from the
+    stored properties only has to be updated if they did.
+    """
+    if task_database_dict is None:
+        recurring_task_model.database = None
+        update_recurring_task_create_page_payload(recurring_task=recurring_task_model)
+        recurring_task_model.save(update_fields=TASK_DATABASE_UPDATE_FIELDS)
+        return recurring_task_model, True
+    task_database, _ = upsert_database_from_simple_database_dict(
+        simple_database_dict=task_database_dict
+    )
+    current_task_property_dict_list = recurring_task_model.properties_json or []
+    refreshed_task_property_dict_list = create_notion_task_property_list_from_db_schema(
+        db_schema_dict_list=task_database.properties_schema_json,
+        property_value_by_id_dict={
+            property_dict["id"]: property_dict["value"]
+            for property_dict in current_task_property_dict_list
+        },
+    )
+    # compare the serialized lists, the stored ones went through a JSON round trip
+    if json.dumps(
+        refreshed_task_property_dict_list, sort_keys=True, cls=DjangoJSONEncoder
+    ) == json.dumps(
+        current_task_property_dict_list, sort_keys=True, cls=DjangoJSONEncoder
+    ):
+        return recurring_task_model, False
+    recurring_task_model.database = task_database
+    recurring_task_model.properties_json = refreshed_task_property_dict_list
+    update_recurring_task_create_page_payload(recurring_task=recurring_task_model)
+    recurring_task_model.save(update_fields=TASK_DATABASE_UPDATE_FIELDS)
+    return recurring_task_model, True
+
+
+def is_task_database_missing_after_refresh_error(error):
+    """
+    Raises if the access token is invalid. Only a database Notion reports as
+    missing is unlinked from the task, the refresh runs on every page load and
+    a rate limit or timeout must not cost the user their database.
+    """
+    if isinstance(error, APIResponseError) and error.code == APIErrorCode.Unauthorized:
+        raise NotionAccessTokenInvalidException()
+    if is_transient_notion_error(error):
+        logger.info(f"Kept task properties after a transient Notion error: {error}")
+        return False
+    return is_missing_notion_object_error(error)
+
+
+def refresh_recurring_task_properties_from_notion(task_pk, owner_user_model):
+    recurring_task_model = get_recurring_task(
+        task_pk=task_pk, owner_user_model=owner_user_model
+    )
+    if (
+        recurring_task_model.database is None
+        or recurring_task_model.database.database_id is None
+    ):
+        return recurring_task_model, False
+    try:
+        task_database_dict = query_user_notion_database_with_api_by_id_as_dict(
+            user_model=owner_user_model,
+            database_id_str=recurring_task_model.database.database_id,
+        )
+    except NOTION_REQUEST_EXCEPTIONS as error:
+        if not is_task_database_missing_after_refresh_error(error):
+            return recurring_task_model, False
+        task_database_dict = None
+    return save_refreshed_recurring_task_properties(
+        recurring_task_model=recurring_task_model,
+        task_database_dict=task_database_dict,
+    )
+
+
+async def arefresh_recurring_task_properties_from_notion(task_pk, owner_user_model):
+    recurring_task_model = await sync_to_async(get_recurring_task)(
+        task_pk=task_pk, owner_user_model=owner_user_model
+    )
     if (
-        recurring_task_model.database is not None
-        and recurring_task_model.database.database_id is not None
+        recurring_task_model.database is None
+        or recurring_task_model.database.database_id is None
     ):
-        return update_task_notion_database(
-            user=owner_user_model,
-            task_pk=task_pk,
-            database_id=recurring_task_model.database.database_id,
+        return recurring_task_model, False
+    try:
+        task_database_dict = await aquery_user_notion_database_with_api_by_id_as_dict(
+            user_model=owner_user_model,
+            database_id_str=recurring_task_model.database.database_id,
         )
-    return recurring_task_model
+    except NOTION_REQUEST_EXCEPTIONS as error:
+        if not is_task_database_missing_after_refresh_error(error):
+            return recurring_task_model, False
+        task_database_dict = None
+    return await sync_to_async(save_refreshed_recurring_task_properties)(
+        recurring_task_model=recurring_task_model,
+        task_database_dict=task_database_dict,
+    )
 
 
 def create_notion_task_property_list_from_db_schema(
@@ -229,3 +435,147 @@ def create_notion_task_property_list_from_db_schema(
             )
         notion_properties_as_dict_list.append(notion_property_container_dto.dto_dict())
     return notion_properties_as_dict_list
+
+
+def create_page_properties_dict_for_task(task_model, database_dict):
+    current_task_properties_value_by_id_dict = {
+        property_dict["id"]: property_dict["value"]
+        for property_dict in task_model.properties_json
+    }
+    # Check which properties are still in the Database
+    property_dict_list = create_notion_task_property_list_from_db_schema(
+        db_schema_dict_list=[
+            property_dto.dto_dict() for property_dto in database_dict["properties"]
+        ],
+        property_value_by_id_dict=current_task_properties_value_by_id_dict,
+    )
+    # check if the provided property type is that in the schema
+    return create_properties_dict_for_create_page_api_request_from_property_dto_list(
+        [
+            NotionPropertyDto.from_dto_dict(property_dict)
+            for property_dict in property_dict_list
+        ]
+    )
+
+
+def compile_create_page_payload_for_task(task_model, database_dict):
+    return {
+        "parent": {"database_id": task_model.database_id},
+        "properties": create_page_properties_dict_for_task(
+            task_model=task_model, database_dict=database_dict
+        ),
+    }
+
+
+def update_recurring_task_create_page_payload(recurring_task):
+    # Compiled in the edit path so the job only has to send the stored payload
+    database_dict = (
+        None
+        if recurring_task.database is None
+        else get_stored_simple_database_dict(recurring_task.database)
+    )
+    recurring_task.create_page_payload_json = (
+        None
+        if database_dict is None
+        else compile_create_page_payload_for_task(
+            task_model=recurring_task, database_dict=database_dict
+        )
+    )
+
+
+def get_or_compile_create_page_payload_for_task(
+    task_model, database_dict, schema_was_retrieved
+):
+    """
+    Returns the payload for the create page request of the task and whether it had
+    to be compiled because it was missing or the schema was retrieved again.
+    """
+    if task_model.create_page_payload_json is not None and not schema_was_retrieved:
+        return task_model.create_page_payload_json, False
+    task_model.create_page_payload_json = compile_create_page_payload_for_task(
+        task_model=task_model, database_dict=database_dict
+    )
+    return task_model.create_page_payload_json, True
+
+
+def calculate_recurring_task_run_retry_delay_seconds(
+    attempt_count, retry_after_seconds=None
+):
+    backoff_seconds = min(
+        RECURRING_TASK_RUN_RETRY_MAX_SECONDS,
+        RECURRING_TASK_RUN_RETRY_BASE_SECONDS * 2 ** (attempt_count - 1),
+    )
+    # jitter keeps the retries of a failed burst from arriving all at once
+    retry_delay_seconds = random.uniform(backoff_seconds / 2, backoff_seconds)
+    if retry_after_seconds is not None:
+        return max(retry_delay_seconds, retry_after_seconds)
+    return retry_delay_seconds
+
+
+def schedule_recurring_task_run_retries(failed_task_run_error_list):
+    """
+    Schedules another attempt for every failed run, or moves it to the dead
+    letters if the error can't go away or it ran out of attempts.
+    """
+    retried_task_run_model_list = []
+    dead_letter_model_list = []
+    dead_task_run_pk_list = []
+    for task_run_model, error in failed_task_run_error_list:
+        task_run_model.attempt_count += 1
+        task_run_model.last_error = str(error)
+        if (
+            not is_retryable_notion_error(error)
+            or task_run_model.attempt_count >= RECURRING_TASK_RUN_MAX_ATTEMPTS
+        ):
+            logger.error(
+                f"Giving up on run {task_run_model.occurrence} of task {task_run_model.task_id} after {task_run_model.attempt_count} attempts."
+            )
+            dead_letter_model_list.append(
+                RecurringTaskDeadLetter(
+                    task_id=task_run_model.task_id,
+                    occurrence=task_run_model.occurrence,
+                    attempt_count=task_run_model.attempt_count,
+                    last_error=task_run_model.last_error,
+                )
+            )
+            dead_task_run_pk_list.append(task_run_model.pk)
+            continue
+        task_run_model.next_attempt_at = now() + timedelta(
+            seconds=calculate_recurring_task_run_retry_delay_seconds(
+                attempt_count=task_run_model.attempt_count,
+                retry_after_seconds=get_notion_retry_after_seconds(error),
+            )
+        )
+        retried_task_run_model_list.append(task_run_model)
+    RecurringTaskRun.objects.bulk_update(
+        retried_task_run_model_list,
+        ["attempt_count", "next_attempt_at", "last_error"],
+    )
+    RecurringTaskDeadLetter.objects.bulk_create(dead_letter_model_list)
+    RecurringTaskRun.objects.filter(pk__in=dead_task_run_pk_list).delete()
+
+
+def save_created_recurring_task_run(task_run_model, notion_page_id):
+    # Written as soon as the page exists, a retried job must not create it again
+    task_run_model.notion_page_id = notion_page_id
+    task_run_model.next_attempt_at = None
+    RecurringTaskRun.objects.filter(pk=task_run_model.pk).update(
+        notion_page_id=notion_page_id, next_attempt_at=None
+    )
+    RecurringTask.objects.filter(pk=task_run_model.task_id).update(last_run_at=now())
+
+
+def save_recurring_task_run_results(
+    compiled_task_model_list,
+    missing_database_task_pk_list,
+    failed_task_run_error_list,
+):
+    # Only writes the changed columns, RecurringTask.save() could reschedule
+    schedule_recurring_task_run_retries(failed_task_run_error_list)
+    RecurringTask.objects.bulk_update(
+        compiled_task_model_list, ["create_page_payload_json"]
+    )
+    if len(missing_database_task_pk_list) > 0:
+        RecurringTask.objects.filter(pk__in=missing_database_task_pk_list).update(
+            database=None
+        )
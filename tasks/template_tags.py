@@ -8,3 +8,13 @@ register = template.Library()
 @register.simple_tag
 def interval_choices():
     return RecurringTask.TaskIntervals.choices
+
+
+@register.simple_tag
+def catch_up_policy_choices():
+    return RecurringTask.CatchUpPolicies.choices
+
+
+@register.simple_tag
+def schedule_tolerance_choices():
+    return RecurringTask.ScheduleTolerances.choices
@@ -1,23 +1,74 @@
+import asyncio
 from datetime import datetime, timedelta, timezone
+from io import StringIO
 from unittest import mock
 
+import httpx
 import pytz
+from asgiref.sync import async_to_sync
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse, reverse_lazy
 from django.utils import timezone
 from django_q.models import Schedule
+from notion_client import APIResponseError
+from notion_client.errors import APIErrorCode
 
 import notion_database.notion_mock_api as notion_db_mock
+from accounts.models import CustomUser
+from config.testing import CacheIsolatedTestCase
 from notion_database.models import NotionDatabase
 from notion_database.notion_mock_api import VALID_ACCESS_TOKEN, VALID_DATABASE_ID
+from notion_database.service import (
+    convert_notion_database_resp_dict_to_simple_database_dict,
+    get_or_update_database_from_simple_database_dict_returning_model,
+)
+from security.authorization_context import (
+    AuthorizationContextMiddleware,
+    get_authorization_context,
+    invalidate_authorization_context,
+)
 from workspaces.models import NotionWorkspace, NotionWorkspaceAccess
 
-from .jobs import create_recurring_task_in_notion
-from .models import RecurringTask
+from .async_jobs import create_recurring_task_run_groups_in_notion_concurrently
+from .jobs import (
+    RECURRING_TASK_BATCH_JOB_FUNC,
+    claim_recurring_task_runs_to_retry,
+    create_due_recurring_tasks_in_notion,
+    create_recurring_task_in_notion,
+    create_recurring_tasks_in_notion_batch,
+    get_or_create_recurring_task_runs,
+    group_recurring_task_runs_by_access_token_and_database,
+    prune_recurring_task_runs,
+)
+from .models import RecurringTask, RecurringTaskDeadLetter, RecurringTaskRun
+from .service import (
+    calculate_recurring_task_run_retry_delay_seconds,
+    create_recurring_task_for_owner,
+    delete_recurring_task_of_owner,
+    save_recurring_task_database,
+    save_refreshed_recurring_task_properties,
+    update_task_notion_properties_from_request_dict,
+)
 
 DEFAULT_RECURRING_TASK_TEST_STARTIME_DATETIME = timezone.now()
 
+
+def create_notion_api_response_error(status_code, code, headers=None):
+    return APIResponseError(
+        httpx.Response(
+            status_code,
+            headers=headers,
+            request=httpx.Request("POST", "https://api.notion.com/v1/pages"),
+        ),
+        code.value,
+        code,
+    )
+
+
 CATEGORY_FIELD_ID = "epmG"
 EXAMPLE_NOTION_PROPERTIES = [
     {
@@ -139,7 +190,7 @@ EXAMPLE_NOTION_PROPERTIES = [
 ]
 
 
-class TasksTestCase(TestCase):
+class TasksTestCase(CacheIsolatedTestCase):
     def setUp(self):
         self.user = get_user_model().objects.create_user(
             username="testuser", email="test@email.com", password="secret"
@@ -312,6 +363,168 @@ class TasksTestCalculateNextRun(TasksTestCase):
         )
 
 
+class TestRecomputeRecurringTaskNextRuns(TasksTestCase):
+    def test_recomputed_next_runs_match_model(self):
+        task_list = [
+            RecurringTask.objects.create(
+                interval=interval,
+                start_time=timezone.now() + timedelta(days=start_day_offset, hours=3),
+                owner=self.user,
+                database=self.sample_database,
+            )
+            for interval, start_day_offset in [
+                (RecurringTask.TaskIntervals.EVERY_DAY.value, -3),
+                (RecurringTask.TaskIntervals.EVERY_7_DAYS.value, -10),
+                (RecurringTask.TaskIntervals.EVERY_30_DAYS.value, -45),
+                (RecurringTask.TaskIntervals.EVERY_365_DAYS.value, 2),
+            ]
+        ]
+        RecurringTask.objects.update(next_run=None)
+        call_command(
+            "recompute_recurring_task_next_runs", "--batch-size", "3", stdout=StringIO()
+        )
+        for task in task_list:
+            self.assertEqual(
+                RecurringTask.objects.get(pk=task.pk).next_run,
+                task.calculate_next_start_time_for_job(),
+            )
+
+    @mock.patch("tasks.models.RECURRING_TASK_MAX_DUE_TASKS_PER_MINUTE", 2)
+    def test_recomputed_next_runs_keep_schedule_tolerance(self):
+        start_time = (timezone.now() + timedelta(days=1)).replace(
+            minute=0, second=0, microsecond=0
+        )
+        task_list = [
+            RecurringTask.objects.create(
+                interval=RecurringTask.TaskIntervals.EVERY_DAY.value,
+                start_time=start_time,
+                owner=self.user,
+                database=self.sample_database,
+                schedule_tolerance_minutes=schedule_tolerance_minutes,
+            )
+            for schedule_tolerance_minutes in [
+                RecurringTask.ScheduleTolerances.FIVE_MINUTES,
+                RecurringTask.ScheduleTolerances.EXACT,
+                RecurringTask.ScheduleTolerances.EXACT,
+            ]
+        ]
+        RecurringTask.objects.update(next_run=None)
+        call_command(
+            "recompute_recurring_task_next_runs", "--batch-size", "2", stdout=StringIO()
+        )
+        self.assertEqual(
+            [RecurringTask.objects.get(pk=task.pk).next_run for task in task_list],
+            [start_time - timedelta(minutes=1), start_time, start_time],
+        )
+
+
+class TestTaskDatabaseSaveKeepsSchedule(TasksTestCase):
+    def setUp(self):
+        super().setUp()
+        self.task = RecurringTask.objects.create(
+            interval=RecurringTask.TaskIntervals.EVERY_DAY.value,
+            start_time=timezone.now() - timedelta(days=2),
+            owner=self.user,
+            database=self.sample_database,
+            workspace=self.init_workspace,
+        )
+        self.simple_database_dict = (
+            convert_notion_database_resp_dict_to_simple_database_dict(
+                notion_db_mock.MOCK_DATABASE_RESPONSE["results"][0]
+            )
+        )
+        # the scanner claims the task while the Notion request is in flight
+        self.advanced_next_run = self.task.next_run + timedelta(days=1)
+        self.last_run_at = timezone.now()
+        RecurringTask.objects.filter(pk=self.task.pk).update(
+            next_run=self.advanced_next_run, last_run_at=self.last_run_at
+        )
+
+    def assert_schedule_kept(self):
+        updated_task = RecurringTask.objects.get(pk=self.task.pk)
+        self.assertEqual(updated_task.next_run, self.advanced_next_run)
+        self.assertEqual(updated_task.last_run_at, self.last_run_at)
+        self.assertNotEqual(updated_task.properties_json, None)
+
+    def test_database_update_keeps_schedule(self):
+        save_recurring_task_database(
+            recurring_task_model=self.task,
+            task_database_dict=self.simple_database_dict,
+        )
+        self.assert_schedule_kept()
+
+    def test_properties_refresh_keeps_schedule(self):
+        _, properties_changed = save_refreshed_recurring_task_properties(
+            recurring_task_model=self.task,
+            task_database_dict=self.simple_database_dict,
+        )
+        self.assertTrue(properties_changed)
+        self.assert_schedule_kept()
+
+
+class TestReconcileRecurringTaskCounts(TasksTestCase):
+    def test_reconcile_fixes_drifted_counts(self):
+        other_user = get_user_model().objects.create(
+            username="other-user", recurring_task_count=5
+        )
+        for _ in range(2):
+            RecurringTask.objects.create(owner=self.user, database=self.sample_database)
+        get_user_model().objects.filter(pk=self.user.pk).update(recurring_task_count=1)
+        stdout = StringIO()
+        call_command(
+            "reconcile_recurring_task_counts", "--batch-size", "1", stdout=stdout
+        )
+        self.assertEqual(
+            get_user_model().objects.get(pk=self.user.pk).recurring_task_count, 2
+        )
+        self.assertEqual(
+            get_user_model().objects.get(pk=other_user.pk).recurring_task_count, 0
+        )
+        self.assertIn("Fixed recurring task count of 2 users.", stdout.getvalue())
+
+
+class TestScheduleLoadLeveling(TasksTestCase):
+    def setUp(self):
+        super().setUp()
+        self.start_time = (timezone.now() + timedelta(days=1)).replace(
+            minute=0, second=0, microsecond=0
+        )
+
+    def create_task(self, schedule_tolerance_minutes):
+        return RecurringTask.objects.create(
+            interval=RecurringTask.TaskIntervals.EVERY_DAY.value,
+            start_time=self.start_time,
+            owner=self.user,
+            database=self.sample_database,
+            schedule_tolerance_minutes=schedule_tolerance_minutes,
+        )
+
+    @mock.patch("tasks.models.RECURRING_TASK_MAX_DUE_TASKS_PER_MINUTE", 2)
+    def test_task_is_moved_to_earlier_minute_when_start_minute_is_full(self):
+        for _ in range(2):
+            self.create_task(RecurringTask.ScheduleTolerances.EXACT)
+        leveled_task = self.create_task(RecurringTask.ScheduleTolerances.FIVE_MINUTES)
+        self.assertEqual(leveled_task.next_run, self.start_time - timedelta(minutes=1))
+
+    @mock.patch("tasks.models.RECURRING_TASK_MAX_DUE_TASKS_PER_MINUTE", 2)
+    def test_task_keeps_start_minute_when_it_is_not_full(self):
+        self.create_task(RecurringTask.ScheduleTolerances.EXACT)
+        leveled_task = self.create_task(RecurringTask.ScheduleTolerances.FIVE_MINUTES)
+        self.assertEqual(leveled_task.next_run, self.start_time)
+
+    @mock.patch("tasks.models.RECURRING_TASK_MAX_DUE_TASKS_PER_MINUTE", 1)
+    def test_task_takes_least_busy_minute_when_window_is_full(self):
+        for minutes_early, task_count in [(0, 3), (1, 2), (2, 1)]:
+            for _ in range(task_count):
+                RecurringTask.objects.filter(
+                    pk=self.create_task(RecurringTask.ScheduleTolerances.EXACT).pk
+                ).update(next_run=self.start_time - timedelta(minutes=minutes_early))
+        task = self.create_task(RecurringTask.ScheduleTolerances.EXACT)
+        task.schedule_tolerance_minutes = 2
+        task.reschedule()
+        self.assertEqual(task.next_run, self.start_time - timedelta(minutes=2))
+
+
 class TestDateUntilPreview(TasksTestCase):
     def test_1_day_till_posted_over_1_day_interval(self):
         # create new recurring task
@@ -367,6 +580,20 @@ class TestCreateTasksJobTest(TasksTestCase):
             self.init_workspace.pk,
         )
 
+    @mock.patch(
+        "notion_database.service.notion_client.Client",
+        side_effect=notion_db_mock.create_or_get_mocked_oauth_notion_client,
+    )
+    def test_job_does_not_reschedule_task(self, m):
+        overdue_next_run = timezone.now() - timedelta(hours=1)
+        RecurringTask.objects.filter(pk=self.task.pk).update(
+            workspace=None, next_run=overdue_next_run
+        )
+        create_recurring_task_in_notion(self.task.pk)
+        updated_task = RecurringTask.objects.get(pk=self.task.pk)
+        self.assertEqual(updated_task.workspace.pk, self.init_workspace.pk)
+        self.assertEqual(updated_task.next_run, overdue_next_run)
+
     def test_create_scheduled_task_in_notion_despite_wrong_type_for_property(self):
         list_of_property_ids_to_change_back = []
         for property_dict in self.task.properties_json:
@@ -412,6 +639,672 @@ class TestCreateTasksJobTest(TasksTestCase):
         )
 
 
+class TestCreateTaskBatchJobQueries(TasksTestCase):
+    def setUp(self):
+        super().setUp()
+        self.task_list = [
+            RecurringTask.objects.create(
+                interval=RecurringTask.TaskIntervals.EVERY_DAY.value,
+                start_time=timezone.now() - timedelta(days=2),
+                owner=self.user,
+                properties_json=EXAMPLE_NOTION_PROPERTIES,
+                database=self.sample_database,
+                workspace=self.init_workspace,
+            )
+            for _ in range(3)
+        ]
+        self.task_run_list = [(task.pk, task.next_run) for task in self.task_list]
+
+    def test_batch_loads_runs_with_constant_queries(self):
+        # one query for the tasks that still exist, one to create the runs and
+        # one to load them with their task, database and owner access
+        with self.assertNumQueries(3):
+            task_runs_by_group_key = (
+                group_recurring_task_runs_by_access_token_and_database(
+                    get_or_create_recurring_task_runs(self.task_run_list)
+                )
+            )
+        self.assertEqual(
+            list(task_runs_by_group_key),
+            [(self.init_workspace_access.access_token, self.sample_database.pk)],
+        )
+        RecurringTaskRun.objects.all().delete()
+        RecurringTask.objects.update(workspace=None)
+        with self.assertNumQueries(4):
+            group_recurring_task_runs_by_access_token_and_database(
+                get_or_create_recurring_task_runs(self.task_run_list)
+            )
+        self.assertEqual(
+            RecurringTask.objects.filter(workspace=self.init_workspace).count(), 3
+        )
+
+    def test_runs_of_owner_without_workspace_access_are_skipped(self):
+        NotionWorkspaceAccess.objects.all().delete()
+        self.assertEqual(
+            group_recurring_task_runs_by_access_token_and_database(
+                get_or_create_recurring_task_runs(self.task_run_list)
+            ),
+            {},
+        )
+
+
+class WorkerStopped(BaseException):
+    pass
+
+
+class TestCreateRecurringTasksBatchJob(TasksTestCase):
+    def setUp(self):
+        super().setUp()
+        self.task_list = [
+            RecurringTask.objects.create(
+                interval=RecurringTask.TaskIntervals.EVERY_DAY.value,
+                start_time=timezone.now() - timedelta(days=2),
+                owner=self.user,
+                properties_json=EXAMPLE_NOTION_PROPERTIES,
+                database=self.sample_database,
+                workspace=self.init_workspace,
+            )
+            for _ in range(3)
+        ]
+        self.task_run_list = [(task.pk, task.next_run) for task in self.task_list]
+
+    @mock.patch(
+        "notion_database.service.notion_client.AsyncClient",
+        side_effect=notion_db_mock.create_or_get_mocked_async_oauth_notion_client,
+    )
+    def test_tasks_sharing_token_and_database_share_one_client(self, m):
+        create_recurring_tasks_in_notion_batch(self.task_run_list)
+        self.assertEqual(m.call_count, 1)
+
+    @mock.patch(
+        "notion_database.service.notion_client.AsyncClient",
+        side_effect=notion_db_mock.create_or_get_mocked_async_oauth_notion_client,
+    )
+    def test_tasks_without_workspace_get_workspace_assigned(self, m):
+        RecurringTask.objects.filter(pk=self.task_list[0].pk).update(workspace=None)
+        create_recurring_tasks_in_notion_batch(self.task_run_list)
+        self.assertEqual(
+            RecurringTask.objects.get(pk=self.task_list[0].pk).workspace.pk,
+            self.init_workspace.pk,
+        )
+
+    @mock.patch("tasks.jobs.async_task")
+    def test_due_tasks_are_claimed_and_next_run_moved_forward(self, m):
+        due_run = timezone.now() - timedelta(minutes=1)
+        RecurringTask.objects.filter(
+            pk__in=[task.pk for task in self.task_list]
+        ).update(next_run=due_run)
+        create_due_recurring_tasks_in_notion()
+        m.assert_called_once_with(
+            RECURRING_TASK_BATCH_JOB_FUNC,
+            [(task.pk, due_run) for task in self.task_list],
+            mock.ANY,
+        )
+        for task in self.task_list:
+            self.assertGreater(
+                RecurringTask.objects.get(pk=task.pk).next_run, timezone.now()
+            )
+
+    @mock.patch("tasks.jobs.RECURRING_TASK_SCAN_CHUNK_SIZE", 2)
+    @mock.patch("tasks.jobs.async_task")
+    def test_due_tasks_are_enqueued_in_chunks(self, m):
+        due_run = timezone.now() - timedelta(minutes=1)
+        RecurringTask.objects.filter(
+            pk__in=[task.pk for task in self.task_list]
+        ).update(next_run=due_run)
+        create_due_recurring_tasks_in_notion()
+        self.assertEqual(
+            [call.args[1] for call in m.call_args_list],
+            [
+                [(task.pk, due_run) for task in self.task_list[:2]],
+                [(task.pk, due_run) for task in self.task_list[2:]],
+            ],
+        )
+
+    @mock.patch("tasks.jobs.async_task")
+    def test_tasks_outside_of_window_are_not_claimed(self, m):
+        RecurringTask.objects.filter(
+            pk__in=[task.pk for task in self.task_list]
+        ).update(next_run=timezone.now() + timedelta(hours=5))
+        create_due_recurring_tasks_in_notion()
+        self.assertEqual(m.call_count, 0)
+
+    def test_next_run_advances_by_interval(self):
+        task = self.task_list[0]
+        task.interval = RecurringTask.TaskIntervals.EVERY_7_DAYS.value
+        task.next_run = timezone.now() - timedelta(minutes=5)
+        passed_run_list = task.advance_next_run_past(timezone.now())
+        self.assertEqual(len(passed_run_list), 1)
+        self.assertAlmostEqual(
+            task.next_run.timestamp(),
+            (passed_run_list[0] + timedelta(days=7)).timestamp(),
+        )
+
+    def set_tasks_missed_for_three_days(self, catch_up_policy_list):
+        missed_run = timezone.now() - timedelta(days=3) + timedelta(hours=2)
+        for task, catch_up_policy in zip(self.task_list, catch_up_policy_list):
+            RecurringTask.objects.filter(pk=task.pk).update(
+                next_run=missed_run, catch_up_policy=catch_up_policy
+            )
+        return [missed_run + timedelta(days=day) for day in range(3)]
+
+    @mock.patch("tasks.jobs.async_task")
+    def test_missed_runs_follow_catch_up_policy(self, m):
+        missed_run_list = self.set_tasks_missed_for_three_days(
+            [
+                RecurringTask.CatchUpPolicies.SKIP,
+                RecurringTask.CatchUpPolicies.RUN_ONCE,
+                RecurringTask.CatchUpPolicies.RUN_ALL,
+            ]
+        )
+        create_due_recurring_tasks_in_notion()
+        m.assert_called_once_with(
+            RECURRING_TASK_BATCH_JOB_FUNC,
+            [(self.task_list[1].pk, missed_run_list[-1])]
+            + [(self.task_list[2].pk, missed_run) for missed_run in missed_run_list],
+            mock.ANY,
+        )
+        for task in self.task_list:
+            self.assertGreater(
+                RecurringTask.objects.get(pk=task.pk).next_run, timezone.now()
+            )
+
+    @mock.patch("tasks.jobs.RECURRING_TASK_CATCH_UP_CHUNK_SIZE", 2)
+    @mock.patch("tasks.jobs.async_task")
+    def test_missed_runs_are_throttled_per_scan(self, m):
+        missed_run_list = self.set_tasks_missed_for_three_days(
+            [RecurringTask.CatchUpPolicies.RUN_ONCE] * 3
+        )
+        with self.assertLogs("tasks.jobs", level="WARNING") as log_context:
+            create_due_recurring_tasks_in_notion()
+        m.assert_called_once_with(
+            RECURRING_TASK_BATCH_JOB_FUNC,
+            [(task.pk, missed_run_list[-1]) for task in self.task_list[:2]],
+            mock.ANY,
+        )
+        self.assertIn("Catching up on 1 overdue recurring tasks", log_context.output[0])
+        self.assertLess(
+            RecurringTask.objects.get(pk=self.task_list[2].pk).next_run,
+            timezone.now(),
+        )
+
+    def create_recording_async_client(self, *args, **kwargs):
+        async_client = notion_db_mock.create_or_get_mocked_async_oauth_notion_client(
+            *args, **kwargs
+        )
+
+        async def retrieve_database(database_id):
+            if self.database_retrieval_error is not None:
+                raise self.database_retrieval_error
+            return notion_db_mock.MOCK_DATABASE_RESPONSE["results"][0]
+
+        async def create_page(**page_kwargs):
+            if self.page_creation_error is not None:
+                raise self.page_creation_error
+            self.created_page_list.append(page_kwargs)
+            return {"object": "page", "id": f"page-{len(self.created_page_list)}"}
+
+        async_client.databases.retrieve = retrieve_database
+        async_client.pages.create = create_page
+        return async_client
+
+    def run_batch_with_recording_client(
+        self,
+        task_run_list,
+        page_creation_error=None,
+        database_retrieval_error=None,
+        leased_until_datetime=None,
+    ):
+        self.created_page_list = []
+        self.page_creation_error = page_creation_error
+        self.database_retrieval_error = database_retrieval_error
+        with mock.patch(
+            "notion_database.service.notion_client.AsyncClient",
+            side_effect=self.create_recording_async_client,
+        ):
+            create_recurring_tasks_in_notion_batch(
+                task_run_list, leased_until_datetime=leased_until_datetime
+            )
+
+    def test_task_listed_per_missed_run_creates_page_per_run(self):
+        task = self.task_list[0]
+        self.run_batch_with_recording_client(
+            [(task.pk, task.next_run), (task.pk, task.next_run + timedelta(days=1))]
+        )
+        self.assertEqual(len(self.created_page_list), 2)
+        self.assertIsNotNone(RecurringTask.objects.get(pk=task.pk).last_run_at)
+
+    def test_created_runs_are_recorded_and_not_created_again(self):
+        self.run_batch_with_recording_client(self.task_run_list)
+        self.assertEqual(
+            sorted(RecurringTaskRun.objects.values_list("notion_page_id", flat=True)),
+            ["page-1", "page-2", "page-3"],
+        )
+        self.run_batch_with_recording_client(self.task_run_list)
+        self.assertEqual(self.created_page_list, [])
+        self.assertEqual(RecurringTaskRun.objects.count(), 3)
+
+    def create_client_stopped_after_first_page(self, *args, **kwargs):
+        def create_page(**page_kwargs):
+            if RecurringTaskRun.objects.exclude(notion_page_id="").exists():
+                raise WorkerStopped()
+            return {"object": "page", "id": "page-1"}
+
+        client = notion_db_mock.create_or_get_mocked_oauth_notion_client(
+            *args, **kwargs
+        )
+        return mock.Mock(
+            databases=client.databases, pages=mock.Mock(create=create_page)
+        )
+
+    @mock.patch("tasks.jobs.NOTION_ASYNC_JOB_RUNNER_ENABLED", False)
+    def test_created_page_is_recorded_before_job_is_stopped(self):
+        with mock.patch(
+            "notion_database.service.notion_client.Client",
+            side_effect=self.create_client_stopped_after_first_page,
+        ):
+            with self.assertRaises(WorkerStopped):
+                create_recurring_tasks_in_notion_batch(self.task_run_list)
+        self.assertEqual(
+            list(
+                RecurringTaskRun.objects.exclude(notion_page_id="").values_list(
+                    "notion_page_id", flat=True
+                )
+            ),
+            ["page-1"],
+        )
+
+    @mock.patch("tasks.jobs.NOTION_ASYNC_JOB_RUNNER_ENABLED", False)
+    @mock.patch("tasks.jobs.async_task")
+    def test_runs_of_killed_batch_are_retried_after_lease(self, m):
+        RecurringTask.objects.update(next_run=timezone.now() - timedelta(minutes=1))
+        create_due_recurring_tasks_in_notion()
+        _, task_run_list, leased_until_datetime = m.call_args.args
+        # the runs are leased before the job starts, nothing is retried during the lease
+        self.assertEqual(
+            RecurringTaskRun.objects.filter(
+                next_attempt_at=leased_until_datetime
+            ).count(),
+            3,
+        )
+        self.assertEqual(claim_recurring_task_runs_to_retry(chunk_size=10)[0], [])
+        with mock.patch(
+            "notion_database.service.notion_client.Client",
+            side_effect=self.create_client_stopped_after_first_page,
+        ):
+            with self.assertRaises(WorkerStopped):
+                create_recurring_tasks_in_notion_batch(
+                    task_run_list, leased_until_datetime
+                )
+        created_task_run_model = RecurringTaskRun.objects.exclude(
+            notion_page_id=""
+        ).get()
+        with mock.patch(
+            "tasks.jobs.now", return_value=timezone.now() + timedelta(hours=1)
+        ):
+            retry_task_run_list, _ = claim_recurring_task_runs_to_retry(chunk_size=10)
+        self.assertEqual(len(retry_task_run_list), 2)
+        self.assertNotIn(
+            (created_task_run_model.task_id, created_task_run_model.occurrence),
+            retry_task_run_list,
+        )
+
+    def test_runs_that_cannot_be_created_release_their_lease(self):
+        RecurringTask.objects.filter(pk=self.task_list[0].pk).update(database=None)
+        leased_until_datetime = timezone.now() + timedelta(minutes=4)
+        self.run_batch_with_recording_client(
+            self.task_run_list, leased_until_datetime=leased_until_datetime
+        )
+        self.assertIsNone(
+            RecurringTaskRun.objects.get(task_id=self.task_list[0].pk).next_attempt_at
+        )
+
+    def test_old_finished_runs_are_pruned(self):
+        self.run_batch_with_recording_client(self.task_run_list[:2])
+        self.run_batch_with_recording_client(
+            self.task_run_list[2:], page_creation_error=httpx.ConnectTimeout("")
+        )
+        RecurringTaskRun.objects.update(created_at=timezone.now() - timedelta(days=31))
+        self.run_batch_with_recording_client(
+            [(self.task_list[0].pk, self.task_list[0].next_run + timedelta(days=1))]
+        )
+        prune_recurring_task_runs()
+        self.assertEqual(
+            sorted(RecurringTaskRun.objects.values_list("task_id", "attempt_count")),
+            [(self.task_list[0].pk, 0), (self.task_list[2].pk, 1)],
+        )
+
+    def test_transient_failure_schedules_retry_with_retry_after(self):
+        self.run_batch_with_recording_client(
+            self.task_run_list,
+            page_creation_error=create_notion_api_response_error(
+                status_code=429,
+                code=APIErrorCode.RateLimited,
+                headers={"Retry-After": "600"},
+            ),
+        )
+        for task_run_model in RecurringTaskRun.objects.all():
+            self.assertEqual(task_run_model.attempt_count, 1)
+            self.assertGreaterEqual(
+                task_run_model.next_attempt_at,
+                timezone.now() + timedelta(seconds=590),
+            )
+        self.run_batch_with_recording_client(self.task_run_list)
+        self.assertEqual(self.created_page_list, [])
+
+    @mock.patch("tasks.jobs.async_task")
+    def test_due_retries_are_enqueued_and_created(self, m):
+        self.run_batch_with_recording_client(
+            self.task_run_list, page_creation_error=httpx.ConnectTimeout("")
+        )
+        RecurringTaskRun.objects.update(next_attempt_at=timezone.now())
+        create_due_recurring_tasks_in_notion()
+        m.assert_called_once()
+        _, task_run_list, leased_until_datetime = m.call_args.args
+        self.assertEqual(task_run_list, self.task_run_list)
+        self.assertEqual(
+            RecurringTaskRun.objects.filter(
+                next_attempt_at=leased_until_datetime
+            ).count(),
+            3,
+        )
+        self.run_batch_with_recording_client(
+            self.task_run_list, leased_until_datetime=leased_until_datetime
+        )
+        self.assertEqual(len(self.created_page_list), 3)
+        self.assertFalse(
+            RecurringTaskRun.objects.filter(next_attempt_at__isnull=False).exists()
+        )
+
+    @mock.patch("tasks.jobs.async_task")
+    def test_retries_of_lost_job_are_claimed_after_lease(self, m):
+        self.run_batch_with_recording_client(
+            self.task_run_list, page_creation_error=httpx.ConnectTimeout("")
+        )
+        RecurringTaskRun.objects.update(next_attempt_at=timezone.now())
+        create_due_recurring_tasks_in_notion()
+        # the job is lost, nothing is claimed again while the lease lasts
+        create_due_recurring_tasks_in_notion()
+        self.assertEqual(m.call_count, 1)
+        with mock.patch(
+            "tasks.jobs.now", return_value=timezone.now() + timedelta(hours=1)
+        ):
+            retry_task_run_list, _ = claim_recurring_task_runs_to_retry(chunk_size=10)
+        self.assertEqual(len(retry_task_run_list), 3)
+
+    @mock.patch("tasks.service.RECURRING_TASK_RUN_MAX_ATTEMPTS", 2)
+    def test_run_is_dead_lettered_after_last_attempt(self):
+        for _ in range(2):
+            RecurringTaskRun.objects.update(next_attempt_at=None)
+            self.run_batch_with_recording_client(
+                self.task_run_list[:1], page_creation_error=httpx.ConnectTimeout("")
+            )
+        self.assertFalse(RecurringTaskRun.objects.exists())
+        dead_letter_model = RecurringTaskDeadLetter.objects.get()
+        self.assertEqual(dead_letter_model.task_id, self.task_list[0].pk)
+        self.assertEqual(dead_letter_model.attempt_count, 2)
+
+    def test_permanent_failure_is_dead_lettered_right_away(self):
+        self.run_batch_with_recording_client(
+            self.task_run_list[:1],
+            page_creation_error=create_notion_api_response_error(
+                status_code=403, code=APIErrorCode.RestrictedResource
+            ),
+        )
+        self.assertEqual(RecurringTaskDeadLetter.objects.get().attempt_count, 1)
+
+    def test_transient_database_failure_keeps_database(self):
+        self.run_batch_with_recording_client(
+            self.task_run_list,
+            database_retrieval_error=create_notion_api_response_error(
+                status_code=503, code=APIErrorCode.ServiceUnavailable
+            ),
+        )
+        for task in self.task_list:
+            self.assertIsNotNone(RecurringTask.objects.get(pk=task.pk).database)
+        self.assertEqual(RecurringTaskRun.objects.filter(attempt_count=1).count(), 3)
+
+    def test_missing_database_is_unset(self):
+        self.run_batch_with_recording_client(
+            self.task_run_list,
+            database_retrieval_error=create_notion_api_response_error(
+                status_code=404, code=APIErrorCode.ObjectNotFound
+            ),
+        )
+        for task in self.task_list:
+            self.assertIsNone(RecurringTask.objects.get(pk=task.pk).database)
+
+    def test_batch_does_not_save_or_reschedule_tasks(self):
+        overdue_next_run = timezone.now() - timedelta(hours=1)
+        RecurringTask.objects.update(
+            workspace=None, next_run=overdue_next_run, create_page_payload_json=None
+        )
+        with mock.patch.object(
+            RecurringTask, "save", side_effect=AssertionError
+        ), mock.patch.object(RecurringTask, "reschedule", side_effect=AssertionError):
+            self.run_batch_with_recording_client(self.task_run_list[:2])
+            self.run_batch_with_recording_client(
+                self.task_run_list[2:], page_creation_error=httpx.ConnectTimeout("")
+            )
+        self.assertEqual(RecurringTaskRun.objects.exclude(notion_page_id="").count(), 2)
+        self.assertEqual(RecurringTaskRun.objects.filter(attempt_count=1).count(), 1)
+        for task in RecurringTask.objects.all():
+            self.assertEqual(task.next_run, overdue_next_run)
+            self.assertEqual(task.workspace_id, self.init_workspace.pk)
+            self.assertIsNotNone(task.create_page_payload_json)
+
+    def test_retry_delay_backs_off_exponentially(self):
+        for attempt_count in range(1, 5):
+            retry_delay_seconds = calculate_recurring_task_run_retry_delay_seconds(
+                attempt_count
+            )
+            self.assertGreaterEqual(retry_delay_seconds, 15 * 2 ** (attempt_count - 1))
+            self.assertLessEqual(retry_delay_seconds, 30 * 2 ** (attempt_count - 1))
+        self.assertLessEqual(
+            calculate_recurring_task_run_retry_delay_seconds(50), 60 * 60
+        )
+
+    def test_runs_of_deleted_tasks_are_skipped(self):
+        RecurringTask.objects.filter(pk=self.task_list[0].pk).delete()
+        self.run_batch_with_recording_client(self.task_run_list)
+        self.assertEqual(len(self.created_page_list), 2)
+
+    @mock.patch("tasks.jobs.NOTION_ASYNC_JOB_RUNNER_ENABLED", False)
+    @mock.patch(
+        "notion_database.service.notion_client.Client",
+        side_effect=notion_db_mock.create_or_get_mocked_oauth_notion_client,
+    )
+    def test_sync_fallback_shares_one_client(self, m):
+        create_recurring_tasks_in_notion_batch(self.task_run_list)
+        self.assertEqual(m.call_count, 1)
+
+    @mock.patch("tasks.async_jobs.NOTION_ASYNC_MAX_CONCURRENCY_PER_WORKSPACE", 2)
+    def test_async_runner_bounds_requests_in_flight_per_workspace(self):
+        in_flight_counter = {"current": 0, "max": 0}
+
+        async def create_page(properties, parent):
+            in_flight_counter["current"] += 1
+            in_flight_counter["max"] = max(
+                in_flight_counter["max"], in_flight_counter["current"]
+            )
+            await asyncio.sleep(0.01)
+            in_flight_counter["current"] -= 1
+            return {"object": "page", "id": "page-id"}
+
+        def create_async_client(*args, **kwargs):
+            async_client = (
+                notion_db_mock.create_or_get_mocked_async_oauth_notion_client(
+                    *args, **kwargs
+                )
+            )
+            async_client.pages.create = create_page
+            return async_client
+
+        with mock.patch(
+            "notion_database.service.notion_client.AsyncClient",
+            side_effect=create_async_client,
+        ):
+            create_recurring_tasks_in_notion_batch(self.task_run_list)
+        self.assertEqual(in_flight_counter["max"], 2)
+
+    @mock.patch("tasks.async_jobs.NOTION_ASYNC_MAX_CONCURRENCY", 2)
+    @mock.patch("tasks.async_jobs.NOTION_ASYNC_MAX_CONCURRENCY_PER_WORKSPACE", 1)
+    def test_large_workspace_does_not_block_other_workspaces(self):
+        other_workspace = NotionWorkspace.objects.create(
+            name="OTHER_WORKSPACE_NAME", notion_id="OTHER_WORKSPACE_ID"
+        )
+        other_task = RecurringTask.objects.create(
+            interval=RecurringTask.TaskIntervals.EVERY_DAY.value,
+            start_time=timezone.now() - timedelta(days=2),
+            owner=self.user,
+            properties_json=EXAMPLE_NOTION_PROPERTIES,
+            database=self.sample_database,
+            workspace=other_workspace,
+        )
+        task_run_model_list = get_or_create_recurring_task_runs(
+            self.task_run_list
+            + [(self.task_list[0].pk, self.task_list[0].next_run + timedelta(days=1))]
+            + [(other_task.pk, other_task.next_run)]
+        )
+        task_runs_by_group_key = {
+            ("large-workspace-token", self.sample_database.pk): [
+                task_run_model
+                for task_run_model in task_run_model_list
+                if task_run_model.task_id != other_task.pk
+            ],
+            ("small-workspace-token", self.sample_database.pk): [
+                task_run_model
+                for task_run_model in task_run_model_list
+                if task_run_model.task_id == other_task.pk
+            ],
+        }
+        created_page_token_list = []
+
+        def create_async_client(*args, **kwargs):
+            async_client = (
+                notion_db_mock.create_or_get_mocked_async_oauth_notion_client(
+                    auth=VALID_ACCESS_TOKEN
+                )
+            )
+
+            async def create_page(properties, parent):
+                created_page_token_list.append(kwargs["auth"])
+                await asyncio.sleep(0.01)
+                return {"object": "page", "id": f"page-{len(created_page_token_list)}"}
+
+            async_client.pages.create = create_page
+            return async_client
+
+        cached_database_dict = (
+            convert_notion_database_resp_dict_to_simple_database_dict(
+                notion_db_mock.MOCK_DATABASE_RESPONSE["results"][0]
+            )
+        )
+        with mock.patch(
+            "notion_database.service.notion_client.AsyncClient",
+            side_effect=create_async_client,
+        ):
+            async_to_sync(create_recurring_task_run_groups_in_notion_concurrently)(
+                task_runs_by_group_key=task_runs_by_group_key,
+                cached_database_dict_by_group_key={
+                    group_key: cached_database_dict
+                    for group_key in task_runs_by_group_key
+                },
+            )
+        self.assertEqual(len(created_page_token_list), 5)
+        # the runs of the large workspace only hold the global slot they use
+        self.assertIn("small-workspace-token", created_page_token_list[:2])
+
+
+class TestRecurringTaskCreatePagePayload(TasksTestCase):
+    def setUp(self):
+        super().setUp()
+        self.sample_database = get_or_update_database_from_simple_database_dict_returning_model(
+            simple_database_dict=convert_notion_database_resp_dict_to_simple_database_dict(
+                notion_db_mock.MOCK_DATABASE_RESPONSE["results"][0]
+            )
+        )
+        self.task = RecurringTask.objects.create(
+            interval=RecurringTask.TaskIntervals.EVERY_DAY.value,
+            start_time=timezone.now(),
+            owner=self.user,
+            name="Rent",
+            database=self.sample_database,
+            workspace=self.init_workspace,
+        )
+        self.created_page_kwargs_list = []
+
+    def create_async_client(self, *args, **kwargs):
+        async_client = notion_db_mock.create_or_get_mocked_async_oauth_notion_client(
+            *args, **kwargs
+        )
+
+        async def create_page(**page_kwargs):
+            self.created_page_kwargs_list.append(page_kwargs)
+            return {"object": "page", "id": "page-id"}
+
+        async_client.pages.create = create_page
+        return async_client
+
+    def test_payload_is_compiled_when_properties_are_updated(self):
+        update_task_notion_properties_from_request_dict(
+            property_value_by_id_dict={"E%3F%5EI": "cali@gmail.com"},
+            task_model=self.task,
+        )
+        payload_dict = RecurringTask.objects.get(
+            pk=self.task.pk
+        ).create_page_payload_json
+        self.assertEqual(payload_dict["parent"], {"database_id": VALID_DATABASE_ID})
+        self.assertEqual(payload_dict["properties"]["Property 2"], "cali@gmail.com")
+        self.assertEqual(
+            payload_dict["properties"]["Name"], [{"text": {"content": "Rent"}}]
+        )
+
+    def test_job_sends_stored_payload(self):
+        stored_payload_dict = {
+            "parent": {"database_id": VALID_DATABASE_ID},
+            "properties": {"Name": [{"text": {"content": "Stored"}}]},
+        }
+        RecurringTask.objects.filter(pk=self.task.pk).update(
+            create_page_payload_json=stored_payload_dict
+        )
+        with mock.patch(
+            "notion_database.service.notion_client.AsyncClient",
+            side_effect=self.create_async_client,
+        ):
+            create_recurring_tasks_in_notion_batch([(self.task.pk, self.task.next_run)])
+        self.assertEqual(self.created_page_kwargs_list, [stored_payload_dict])
+
+    def test_job_compiles_and_stores_missing_payload(self):
+        with mock.patch(
+            "notion_database.service.notion_client.AsyncClient",
+            side_effect=self.create_async_client,
+        ):
+            create_recurring_tasks_in_notion_batch([(self.task.pk, self.task.next_run)])
+        stored_payload_dict = RecurringTask.objects.get(
+            pk=self.task.pk
+        ).create_page_payload_json
+        self.assertIsNotNone(stored_payload_dict)
+        self.assertEqual(self.created_page_kwargs_list, [stored_payload_dict])
+
+    def test_schema_change_invalidates_payload(self):
+        update_task_notion_properties_from_request_dict(
+            property_value_by_id_dict={}, task_model=self.task
+        )
+        changed_database_dict = (
+            convert_notion_database_resp_dict_to_simple_database_dict(
+                notion_db_mock.MOCK_DATABASE_RESPONSE["results"][0]
+            )
+        )
+        changed_database_dict["properties"] = changed_database_dict["properties"][1:]
+        get_or_update_database_from_simple_database_dict_returning_model(
+            simple_database_dict=changed_database_dict
+        )
+        self.assertIsNone(
+            RecurringTask.objects.get(pk=self.task.pk).create_page_payload_json
+        )
+
+
 class TestCreateRecurringTasks(TasksTestCase):
     def setUp(self):
         super().setUp()
@@ -432,9 +1325,7 @@ class TestCreateRecurringTasks(TasksTestCase):
         self.assertEqual(created_recurring_task.name, "New Page")
         self.assertEqual(created_recurring_task.owner, self.user)
         self.assertEqual(created_recurring_task.workspace.pk, self.init_workspace.pk)
-        self.assertEqual(Schedule.objects.count(), 1)
-        schedule_object = Schedule.objects.all()[0]
-        self.assertEqual(schedule_object.args, f"{created_recurring_task.pk}")
+        self.assertIsNotNone(created_recurring_task.next_run)
 
     def assert_task_was_not_created(self):
         self.assertEqual(RecurringTask.objects.count(), 0)
@@ -464,20 +1355,76 @@ class TestCreateRecurringTasks(TasksTestCase):
         self.assertEqual(response.status_code, 405)
         self.assert_task_was_not_created()
 
-    def test_create_recurring_task_also_creates_djangoq_scheduler(self):
+    @mock.patch("security.authorization_context.settings.NUM_FREE_RECURRING_TASKS", 1)
+    def test_cannot_create_recurring_task_over_free_limit(self):
+        self.client.force_login(self.user)
+        self.client.post("/create-recurring-task/", self.create_payload)
+        response = self.client.post("/create-recurring-task/", self.create_payload)
+        self.assertRedirects(
+            response, reverse("recurring-tasks-view"), fetch_redirect_response=False
+        )
+        self.assertEqual(RecurringTask.objects.count(), 1)
+
+    def test_authorization_context_is_cached_until_invalidated(self):
+        self.assertEqual(get_authorization_context(self.user).recurring_task_count, 0)
+        CustomUser.objects.filter(pk=self.user.pk).update(recurring_task_count=1)
+        with CaptureQueriesContext(connection) as query_context:
+            authorization_context = get_authorization_context(self.user)
+        self.assertEqual(authorization_context.recurring_task_count, 0)
+        self.assertFalse(
+            any(
+                CustomUser._meta.db_table in query_dict["sql"]
+                for query_dict in query_context.captured_queries
+            )
+        )
+        invalidate_authorization_context(self.user.pk)
+        self.assertEqual(get_authorization_context(self.user).recurring_task_count, 1)
+
+    def test_creating_and_deleting_task_invalidates_authorization_context(self):
+        self.assertEqual(get_authorization_context(self.user).recurring_task_count, 0)
+        created_task = create_recurring_task_for_owner(
+            self.user, workspace=self.init_workspace
+        )
+        self.assertEqual(get_authorization_context(self.user).recurring_task_count, 1)
+        delete_recurring_task_of_owner(created_task)
+        self.assertEqual(get_authorization_context(self.user).recurring_task_count, 0)
+
+    def test_authorization_context_middleware_supports_async_requests(self):
+        request = RequestFactory().get("/")
+        request.user = self.user
+
+        async def get_response(request):
+            return "response"
+
+        middleware = AuthorizationContextMiddleware(get_response)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        self.assertEqual(asyncio.run(middleware(request)), "response")
+        self.assertTrue(request.authorization_context.has_workspace_access)
+        sync_middleware = AuthorizationContextMiddleware(lambda request: "response")
+        self.assertFalse(asyncio.iscoroutinefunction(sync_middleware))
+        self.assertEqual(sync_middleware(request), "response")
+
+    def test_create_recurring_task_increments_task_count(self):
+        self.client.force_login(self.user)
+        self.client.post("/create-recurring-task/", self.create_payload)
+        self.assertEqual(
+            get_user_model().objects.get(pk=self.user.pk).recurring_task_count, 1
+        )
+
+    def test_create_recurring_task_sets_next_run(self):
         self.client.force_login(
             get_user_model().objects.get_or_create(username=self.user.username)[0]
         )
         response = self.client.post("/create-recurring-task/", self.create_payload)
         self.assertEqual(response.status_code, 302)
         self.assert_task_was_created()
-        scheduled_job = Schedule.objects.all()[0]
+        created_recurring_task = RecurringTask.objects.all()[0]
         self.assertTrue(
-            scheduled_job.next_run.timestamp()
+            created_recurring_task.next_run.timestamp()
             - (datetime.now() + timedelta(days=1)).timestamp()
             < 1000
         )
-        self.assertEqual(scheduled_job.schedule_type, Schedule.DAILY)
+        self.assertEqual(Schedule.objects.count(), 0)
 
 
 class TestUpdateRecurringTasksSchedule(TasksTestCase):
@@ -662,6 +1609,45 @@ class TestUpdateRecurringTasksSchedule(TasksTestCase):
             recurring_task.interval, self.update_interval_payload["interval"][0]
         )
 
+    def test_only_schedule_changes_reschedule_task(self):
+        overdue_next_run = timezone.now() - timedelta(hours=1)
+        RecurringTask.objects.filter(pk=self.recurring_test_task_model.pk).update(
+            next_run=overdue_next_run
+        )
+        self.client.force_login(
+            get_user_model().objects.get_or_create(username=self.user.username)[0]
+        )
+        self.client.post(self.request_url, {"task-name": ["New Name"]})
+        self.assertEqual(RecurringTask.objects.all()[0].next_run, overdue_next_run)
+        self.client.post(self.request_url, self.update_interval_payload)
+        self.assertGreater(RecurringTask.objects.all()[0].next_run, timezone.now())
+
+    def test_logged_in_user_successfully_updates_catch_up_policy(self):
+        self.client.force_login(
+            get_user_model().objects.get_or_create(username=self.user.username)[0]
+        )
+        response = self.client.post(self.request_url, {"catch-up-policy": ["all"]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            RecurringTask.objects.all()[0].catch_up_policy,
+            RecurringTask.CatchUpPolicies.RUN_ALL,
+        )
+
+    def test_logged_in_user_successfully_updates_schedule_tolerance(self):
+        self.client.force_login(
+            get_user_model().objects.get_or_create(username=self.user.username)[0]
+        )
+        response = self.client.post(self.request_url, {"schedule-tolerance": ["15"]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(RecurringTask.objects.all()[0].schedule_tolerance_minutes, 15)
+
+    def test_invalid_catch_up_policy_is_rejected(self):
+        self.client.force_login(
+            get_user_model().objects.get_or_create(username=self.user.username)[0]
+        )
+        response = self.client.post(self.request_url, {"catch-up-policy": ["often"]})
+        self.assertEqual(response.status_code, 400)
+
     def test_logged_in_user_successfully_updates_start_time(self):
         self.client.force_login(
             get_user_model().objects.get_or_create(username=self.user.username)[0]
@@ -698,6 +1684,14 @@ class TestDeleteRecurringTask(TasksTestCase):
         self.assertEqual(response.status_code, 302)
         self.assert_task_deleted()
 
+    def test_delete_decrements_task_count(self):
+        get_user_model().objects.filter(pk=self.user.pk).update(recurring_task_count=1)
+        self.client.force_login(self.user)
+        self.client.delete(self.request_url)
+        self.assertEqual(
+            get_user_model().objects.get(pk=self.user.pk).recurring_task_count, 0
+        )
+
     def test_successful_delete_with_post(self):
         self.client.force_login(
             get_user_model().objects.get_or_create(username=self.user.username)[0]
@@ -752,15 +1746,6 @@ class TestDeleteRecurringTask(TasksTestCase):
         )
         self.assertEqual(response.status_code, 404)
 
-    def test_delete_also_removes_scheduler_task(self):
-        self.client.force_login(
-            get_user_model().objects.get_or_create(username=self.user.username)[0]
-        )
-        response = self.client.delete(self.request_url)
-        self.assertEqual(response.status_code, 302)
-        self.assert_task_deleted()
-        self.assertEqual(Schedule.objects.count(), 0)
-
 
 class TestUpdateRecurringTasksProperties(TasksTestCase):
     def setUp(self):
@@ -979,8 +1964,8 @@ class TestUpdateRecurringTasksDatabase(TasksTestCase):
         self.assertNotEqual(RecurringTask.objects.all()[0].properties_json, dict())
 
     @mock.patch(
-        "notion_database.service.notion_client.Client",
-        side_effect=notion_db_mock.create_or_get_mocked_oauth_notion_client,
+        "notion_database.service.notion_client.AsyncClient",
+        side_effect=notion_db_mock.create_or_get_mocked_async_oauth_notion_client,
     )
     def test_only_logged_in_user_can_update_recurring_tasks(self, m):
         # create new recurring task
@@ -990,8 +1975,8 @@ class TestUpdateRecurringTasksDatabase(TasksTestCase):
         self.assert_task_was_not_created()
 
     @mock.patch(
-        "notion_database.service.notion_client.Client",
-        side_effect=notion_db_mock.create_or_get_mocked_oauth_notion_client,
+        "notion_database.service.notion_client.AsyncClient",
+        side_effect=notion_db_mock.create_or_get_mocked_async_oauth_notion_client,
     )
     def test_cannot_update_other_users_tasks_database(self, m):
         other_user_recurring_task = RecurringTask.objects.create(
@@ -1013,8 +1998,8 @@ class TestUpdateRecurringTasksDatabase(TasksTestCase):
         self.assert_database_was_not_updated()
 
     @mock.patch(
-        "notion_database.service.notion_client.Client",
-        side_effect=notion_db_mock.create_or_get_mocked_oauth_notion_client,
+        "notion_database.service.notion_client.AsyncClient",
+        side_effect=notion_db_mock.create_or_get_mocked_async_oauth_notion_client,
     )
     def test_throw_404_when_not_found(self, m):
         self.client.force_login(
@@ -1028,8 +2013,8 @@ class TestUpdateRecurringTasksDatabase(TasksTestCase):
         self.assert_database_was_not_updated()
 
     @mock.patch(
-        "notion_database.service.notion_client.Client",
-        side_effect=notion_db_mock.create_or_get_mocked_oauth_notion_client,
+        "notion_database.service.notion_client.AsyncClient",
+        side_effect=notion_db_mock.create_or_get_mocked_async_oauth_notion_client,
     )
     def test_throw_403_when_request_header_is_missing(self, m):
         self.client.force_login(
@@ -1042,8 +2027,8 @@ class TestUpdateRecurringTasksDatabase(TasksTestCase):
         self.assert_database_was_not_updated()
 
     @mock.patch(
-        "notion_database.service.notion_client.Client",
-        side_effect=notion_db_mock.create_or_get_mocked_oauth_notion_client,
+        "notion_database.service.notion_client.AsyncClient",
+        side_effect=notion_db_mock.create_or_get_mocked_async_oauth_notion_client,
     )
     def test_update_recurring_task_database_creates_database(self, m):
         NotionDatabase.objects.all().delete()
@@ -1058,8 +2043,8 @@ class TestUpdateRecurringTasksDatabase(TasksTestCase):
         self.assert_database_was_updated()
 
     @mock.patch(
-        "notion_database.service.notion_client.Client",
-        side_effect=notion_db_mock.create_or_get_mocked_oauth_notion_client,
+        "notion_database.service.notion_client.AsyncClient",
+        side_effect=notion_db_mock.create_or_get_mocked_async_oauth_notion_client,
     )
     def test_update_recurring_task_does_not_create_new_db_if_already_exists(self, m):
         NotionDatabase.objects.all().delete()
@@ -1103,15 +2088,14 @@ class TestDuplicateRecurringTasksDatabase(TasksTestCase):
 
     def assert_task_was_not_duplicated(self):
         self.assertEqual(RecurringTask.objects.count(), 1)
-        self.assertEqual(Schedule.objects.count(), 1)
         original_task = RecurringTask.objects.all()[0]
         self.assertEqual(original_task.pk, self.recurring_test_task_model.pk)
 
     def assert_task_was_duplicated(self):
         self.assertEqual(RecurringTask.objects.count(), 2)
-        self.assertEqual(Schedule.objects.count(), 2)
         original_task = RecurringTask.objects.all()[0]
         duplicated_task = RecurringTask.objects.all()[1]
+        self.assertEqual(original_task.next_run, duplicated_task.next_run)
         self.assertEqual(original_task.name + " Copy", duplicated_task.name)
         self.assertEqual(original_task.start_time, duplicated_task.start_time)
         self.assertEqual(original_task.properties_json, duplicated_task.properties_json)
@@ -1201,6 +2185,108 @@ class TestGetRecurringTaskView(TasksTestCase):
         response = self.client.get(self.request_url)
         self.assertEqual(response.status_code, 200)
 
+    @mock.patch("notion_database.service.notion_client.Client")
+    def test_task_is_rendered_without_notion_request(self, notion_client_mock):
+        self.client.force_login(self.user)
+        response = self.client.get(self.request_url)
+        self.assertContains(
+            response,
+            reverse(
+                "refresh-recurring-task-properties",
+                kwargs={"pk": self.recurring_test_task_model.pk},
+            ),
+        )
+        notion_client_mock.assert_not_called()
+
+
+class TestRefreshRecurringTaskPropertiesView(TasksTestCase):
+    def setUp(self):
+        super().setUp()
+        self.recurring_test_task_model = RecurringTask.objects.create(
+            interval=RecurringTask.TaskIntervals.EVERY_DAY.value,
+            owner=self.user,
+            database=self.sample_database,
+        )
+        self.request_url = reverse(
+            "refresh-recurring-task-properties",
+            kwargs={"pk": self.recurring_test_task_model.pk},
+        )
+        self.client.force_login(self.user)
+
+    @mock.patch(
+        "notion_database.service.notion_client.AsyncClient",
+        side_effect=notion_db_mock.create_or_get_mocked_async_oauth_notion_client,
+    )
+    def test_changed_properties_are_rendered(self, m):
+        response = self.client.get(self.request_url)
+        self.assertEqual(response.status_code, 200)
+        self.recurring_test_task_model.refresh_from_db()
+        self.assertGreater(len(self.recurring_test_task_model.properties_json), 0)
+
+    @mock.patch(
+        "notion_database.service.notion_client.AsyncClient",
+        side_effect=notion_db_mock.create_or_get_mocked_async_oauth_notion_client,
+    )
+    def test_unchanged_properties_are_not_rendered(self, m):
+        self.client.get(self.request_url)
+        response = self.client.get(self.request_url)
+        self.assertEqual(response.status_code, 204)
+
+    def request_refresh_with_database_retrieval_error(self, error):
+        def create_failing_async_client(*args, **kwargs):
+            async_client = (
+                notion_db_mock.create_or_get_mocked_async_oauth_notion_client(
+                    *args, **kwargs
+                )
+            )
+
+            async def retrieve_database(database_id):
+                raise error
+
+            async_client.databases.retrieve = retrieve_database
+            return async_client
+
+        with mock.patch(
+            "notion_database.service.notion_client.AsyncClient",
+            side_effect=create_failing_async_client,
+        ):
+            return self.client.get(self.request_url)
+
+    def test_rate_limited_refresh_keeps_database(self):
+        response = self.request_refresh_with_database_retrieval_error(
+            create_notion_api_response_error(
+                status_code=429, code=APIErrorCode.RateLimited
+            )
+        )
+        self.assertEqual(response.status_code, 204)
+        self.recurring_test_task_model.refresh_from_db()
+        self.assertIsNotNone(self.recurring_test_task_model.database)
+
+    def test_timed_out_refresh_keeps_database(self):
+        response = self.request_refresh_with_database_retrieval_error(
+            httpx.ReadTimeout("")
+        )
+        self.assertEqual(response.status_code, 204)
+        self.recurring_test_task_model.refresh_from_db()
+        self.assertIsNotNone(self.recurring_test_task_model.database)
+
+    def test_missing_database_is_unlinked_on_refresh(self):
+        self.request_refresh_with_database_retrieval_error(
+            create_notion_api_response_error(
+                status_code=404, code=APIErrorCode.ObjectNotFound
+            )
+        )
+        self.recurring_test_task_model.refresh_from_db()
+        self.assertIsNone(self.recurring_test_task_model.database)
+
+    def test_cannot_refresh_task_of_other_user(self):
+        other_user = get_user_model().objects.create_user(
+            username="otheruser", email="other@email.com", password="secret"
+        )
+        self.client.force_login(other_user)
+        response = self.client.get(self.request_url)
+        self.assertEqual(response.status_code, 404)
+
 
 class TestGetRecurringTaskListView(TasksTestCase):
     def setUp(self):
@@ -6,6 +6,7 @@ from .views import (
     duplicate_recurring_task,
     recurring_task_view,
     recurring_tasks_list_view,
+    refresh_recurring_task_properties,
     update_recurring_task_database,
     update_recurring_task_properties,
     update_recurring_task_schedule,
@@ -39,5 +40,10 @@ urlpatterns = [
         update_recurring_task_database,
         name="update-recurring-task-database",
     ),
+    path(
+        "refresh-recurring-task-properties/<int:pk>",
+        refresh_recurring_task_properties,
+        name="refresh-recurring-task-properties",
+    ),
     path("tasks", recurring_tasks_list_view, name="recurring-tasks-view"),
 ]
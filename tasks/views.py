@@ -1,6 +1,7 @@
 import datetime
 import logging
 
+from asgiref.sync import sync_to_async
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.http import HttpResponse
@@ -9,24 +10,32 @@ from django.urls import reverse
 from django.utils.timezone import now
 from django.views.decorators.http import require_http_methods
 
-from config.settings import NUM_FREE_RECURRING_TASKS
-from notion_properties.forms import NotionPropertyForm
+from notion_properties.forms import create_notion_property_form
+from security.authorization_context import get_request_authorization_context
 from security.security_decorator import (
+    async_login_required,
+    async_require_http_methods,
     check_free_tasks_usage_limit,
     notion_workspace_authorization_required,
 )
 from workspaces.models import NotionWorkspaceAccess
+from workspaces.service import NotionAccessTokenInvalidException
 
 from .models import RecurringTask
 from .service import (
     RecurringTaskBadFormData,
     RecurringTaskMissingDatabaseException,
     RecurringTaskNotFoundException,
-    get_recurring_task_with_properties_update,
+    arefresh_recurring_task_properties_from_notion,
+    aupdate_task_notion_database,
+    create_recurring_task_for_owner,
+    delete_recurring_task_of_owner,
+    get_recurring_task,
+    update_recurring_task_catch_up_policy,
     update_recurring_task_interval,
     update_recurring_task_name,
+    update_recurring_task_schedule_tolerance,
     update_recurring_task_start_time,
-    update_task_notion_database,
     update_task_notion_properties_from_request_dict,
 )
 
@@ -45,9 +54,9 @@ def recurring_tasks_list_view(request):
         "tasks/recurring-tasks-list-view.html",
         {
             "recurring_tasks": tasks_query,
-            "num_remaining_tasks": max(
-                NUM_FREE_RECURRING_TASKS - tasks_query.count(), 0
-            ),
+            "num_remaining_tasks": get_request_authorization_context(
+                request
+            ).num_remaining_recurring_tasks,
         },
     )
 
@@ -57,9 +66,9 @@ def recurring_tasks_list_view(request):
 @check_free_tasks_usage_limit
 @require_http_methods(["POST"])
 def create_recurring_task(request):
-    created_task = RecurringTask.objects.create(
+    created_task = create_recurring_task_for_owner(
+        request.user,
         start_time=now() + datetime.timedelta(days=1),
-        owner=request.user,
         workspace=NotionWorkspaceAccess.objects.filter(owner=request.user)[0].workspace,
     )
     messages.success(request, f"Successfully Created a new Recurring Task!")
@@ -79,7 +88,7 @@ def delete_recurring_task(request, pk):
         task_to_remove_model.pk,
         task_to_remove_model.name,
     )
-    task_to_remove_model.delete()
+    delete_recurring_task_of_owner(task_to_remove_model)
     if "X-Hx-Partial" in request.headers and request.headers["X-Hx-Partial"] == "true":
         return HttpResponse(
             f"""
@@ -105,13 +114,16 @@ def duplicate_recurring_task(request, pk):
     except IndexError:
         return HttpResponse("Could not find recurring task.", status=404)
 
-    duplicated_task = RecurringTask.objects.create(
+    duplicated_task = create_recurring_task_for_owner(
+        request.user,
         name=task_to_duplicate.name + " Copy",
-        owner=request.user,
         database=task_to_duplicate.database,
         interval=task_to_duplicate.interval,
         start_time=task_to_duplicate.start_time,
         properties_json=task_to_duplicate.properties_json,
+        create_page_payload_json=task_to_duplicate.create_page_payload_json,
+        catch_up_policy=task_to_duplicate.catch_up_policy,
+        schedule_tolerance_minutes=task_to_duplicate.schedule_tolerance_minutes,
         workspace=task_to_duplicate.workspace,
     )
     messages.success(
@@ -131,6 +143,18 @@ def update_recurring_task_schedule(request, pk):
                 task_pk=pk,
                 interval_value_str=request.POST["interval"],
             )
+        elif "catch-up-policy" in request.POST:
+            recurring_task_to_update_model = update_recurring_task_catch_up_policy(
+                user=request.user,
+                task_pk=pk,
+                catch_up_policy_str=request.POST["catch-up-policy"],
+            )
+        elif "schedule-tolerance" in request.POST:
+            recurring_task_to_update_model = update_recurring_task_schedule_tolerance(
+                user=request.user,
+                task_pk=pk,
+                tolerance_minutes_str=request.POST["schedule-tolerance"],
+            )
         elif "task-name" in request.POST:
             recurring_task_to_update_model = update_recurring_task_name(
                 user=request.user,
@@ -164,8 +188,8 @@ def update_recurring_task_schedule(request, pk):
 def update_recurring_task_properties(request, pk):
     try:
         task_to_update = RecurringTask.objects.filter(pk=pk, owner=request.user)[0]
-        property_form = NotionPropertyForm(
-            request.POST, task_model=task_to_update, show_save_notification=True
+        property_form = create_notion_property_form(
+            task_to_update, data=request.POST, show_save_notification=True
         )
         if not property_form.is_valid():
             raise RecurringTaskBadFormData("Form data was not valid!")
@@ -193,27 +217,32 @@ def update_recurring_task_properties(request, pk):
     )
 
 
-@login_required
-@require_http_methods(["POST"])
-def update_recurring_task_database(request, pk):
+@async_login_required
+@async_require_http_methods(["POST"])
+async def update_recurring_task_database(request, pk):
     if "newDatabaseId" not in request.POST:
         return HttpResponse("Invalid parameters for updating tasks!", status=400)
     try:
-        updated_recurring_task_model = update_task_notion_database(
+        updated_recurring_task_model = await aupdate_task_notion_database(
             user=request.user,
             database_id=request.POST["newDatabaseId"],
             task_pk=pk,
         )
     except RecurringTaskNotFoundException:
         return HttpResponse("Could not find Task for Update", status=404)
-    property_form = NotionPropertyForm(task_model=updated_recurring_task_model)
-    return render(
+    return await sync_to_async(render_recurring_task_property_form)(
         request,
         "tasks/partials/recurring-task-update-property-form.html",
-        {
-            "recurring_task": updated_recurring_task_model,
-            "property_form": property_form,
-        },
+        updated_recurring_task_model,
+    )
+
+
+def render_recurring_task_property_form(request, template_name, recurring_task_model):
+    property_form = create_notion_property_form(recurring_task_model)
+    return render(
+        request,
+        template_name,
+        {"recurring_task": recurring_task_model, "property_form": property_form},
     )
 
 
@@ -221,15 +250,41 @@ def update_recurring_task_database(request, pk):
 @notion_workspace_authorization_required
 @require_http_methods(["GET"])
 def recurring_task_view(request, pk):
+    # Rendered from the stored schema, the page asks for a refresh once it has loaded
     try:
-        recurring_task_model = get_recurring_task_with_properties_update(
+        recurring_task_model = get_recurring_task(
             task_pk=pk, owner_user_model=request.user
         )
     except RecurringTaskNotFoundException:
         return render(request, "404.html", status=404)
-    property_form = NotionPropertyForm(task_model=recurring_task_model)
+    property_form = create_notion_property_form(recurring_task_model)
     return render(
         request,
         "tasks/recurring-task-view.html",
         {"recurring_task": recurring_task_model, "property_form": property_form},
     )
+
+
+@async_login_required
+@async_require_http_methods(["GET"])
+async def refresh_recurring_task_properties(request, pk):
+    try:
+        (
+            recurring_task_model,
+            properties_were_changed,
+        ) = await arefresh_recurring_task_properties_from_notion(
+            task_pk=pk, owner_user_model=request.user
+        )
+    except RecurringTaskNotFoundException:
+        return HttpResponse("Could not find Task for Update", status=404)
+    except NotionAccessTokenInvalidException:
+        logger.warning(f"Could not refresh properties of task {pk}, invalid token.")
+        return HttpResponse(status=204)
+    if not properties_were_changed:
+        # htmx leaves the rendered form in place on an empty response
+        return HttpResponse(status=204)
+    return await sync_to_async(render_recurring_task_property_form)(
+        request,
+        "tasks/partials/recurring-task-properties.html",
+        recurring_task_model,
+    )
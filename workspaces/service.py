@@ -1,4 +1,6 @@
+import httpx
 import requests
+from asgiref.sync import sync_to_async
 from requests.auth import HTTPBasicAuth
 
 from config.settings import (
@@ -6,6 +8,9 @@ from config.settings import (
     NOTION_CLIENT_SECRET,
     NOTION_OAUTH_CALLBACK,
 )
+from notion_database.client_pool import discard_pooled_notion_http_transport
+from notion_database.models import NotionDatabaseCatalog
+from security.authorization_context import invalidate_authorization_context
 
 from .models import NotionWorkspace, NotionWorkspaceAccess
 
@@ -14,48 +19,76 @@ class NotionAccessTokenInvalidException(Exception):
     pass
 
 
-def create_access_workspace_from_user_code(user_model, oauth_code):
-    auth_payload_dict = {
+NOTION_OAUTH_TOKEN_URL = "https://api.notion.com/v1/oauth/token"
+
+
+def create_oauth_token_payload_dict(oauth_code):
+    return {
         "grant_type": "authorization_code",
         "code": oauth_code,
         "redirect_uri": NOTION_OAUTH_CALLBACK,
     }
+
+
+def create_access_workspace_from_user_code(user_model, oauth_code):
     response = requests.post(
-        "https://api.notion.com/v1/oauth/token",
-        json=auth_payload_dict,
+        NOTION_OAUTH_TOKEN_URL,
+        json=create_oauth_token_payload_dict(oauth_code),
         auth=HTTPBasicAuth(NOTION_CLIENT_ID, NOTION_CLIENT_SECRET),
     )
     if response.status_code == 200:
-        notion_workspace_auth_data = response.json()
-        workspace_id = notion_workspace_auth_data["workspace_id"]
-        notion_workspace_model = NotionWorkspace.objects.filter(
-            notion_id=workspace_id
-        ).first()
-        if notion_workspace_model is None:
-            notion_workspace_model = NotionWorkspace(
-                name=notion_workspace_auth_data["workspace_name"],
-                notion_id=workspace_id,
-                icon_url=notion_workspace_auth_data["workspace_icon"],
-            )
-        else:
-            notion_workspace_model.name = notion_workspace_auth_data["workspace_name"]
-            notion_workspace_model.icon_url = notion_workspace_auth_data[
-                "workspace_icon"
-            ]
-        notion_workspace_model.save()
-        workspace_access_model = NotionWorkspaceAccess.objects.filter(
-            workspace=notion_workspace_model, owner=user_model
-        ).first()
-        if workspace_access_model:
-            workspace_access_model.access_token = notion_workspace_auth_data[
-                "access_token"
-            ]
-        else:
-            workspace_access_model = NotionWorkspaceAccess.objects.create(
-                access_token=notion_workspace_auth_data["access_token"],
-                workspace=notion_workspace_model,
-                owner=user_model,
-            )
-        workspace_access_model.save()
+        save_access_workspace_from_auth_data(
+            user_model=user_model, notion_workspace_auth_data=response.json()
+        )
     else:
         raise Exception("Unexpected Error - could not add Notion workspace to Account.")
+
+
+async def acreate_access_workspace_from_user_code(user_model, oauth_code):
+    async with httpx.AsyncClient() as client:
+        response = await client.post(
+            NOTION_OAUTH_TOKEN_URL,
+            json=create_oauth_token_payload_dict(oauth_code),
+            auth=(NOTION_CLIENT_ID, NOTION_CLIENT_SECRET),
+        )
+    if response.status_code == 200:
+        await sync_to_async(save_access_workspace_from_auth_data)(
+            user_model=user_model, notion_workspace_auth_data=response.json()
+        )
+    else:
+        raise Exception("Unexpected Error - could not add Notion workspace to Account.")
+
+
+def save_access_workspace_from_auth_data(user_model, notion_workspace_auth_data):
+    workspace_id = notion_workspace_auth_data["workspace_id"]
+    notion_workspace_model = NotionWorkspace.objects.filter(
+        notion_id=workspace_id
+    ).first()
+    if notion_workspace_model is None:
+        notion_workspace_model = NotionWorkspace(
+            name=notion_workspace_auth_data["workspace_name"],
+            notion_id=workspace_id,
+            icon_url=notion_workspace_auth_data["workspace_icon"],
+        )
+    else:
+        notion_workspace_model.name = notion_workspace_auth_data["workspace_name"]
+        notion_workspace_model.icon_url = notion_workspace_auth_data["workspace_icon"]
+    notion_workspace_model.save()
+    workspace_access_model = NotionWorkspaceAccess.objects.filter(
+        workspace=notion_workspace_model, owner=user_model
+    ).first()
+    if workspace_access_model:
+        discard_pooled_notion_http_transport(workspace_access_model.access_token)
+        # the new token might be granted other databases
+        NotionDatabaseCatalog.objects.filter(
+            workspace_access=workspace_access_model
+        ).delete()
+        workspace_access_model.access_token = notion_workspace_auth_data["access_token"]
+    else:
+        workspace_access_model = NotionWorkspaceAccess.objects.create(
+            access_token=notion_workspace_auth_data["access_token"],
+            workspace=notion_workspace_model,
+            owner=user_model,
+        )
+    workspace_access_model.save()
+    invalidate_authorization_context(user_model.pk)
@@ -1,7 +1,8 @@
 from unittest import mock
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+
+from config.testing import CacheIsolatedTestCase
 
 from .models import NotionWorkspace, NotionWorkspaceAccess
 from .service import create_access_workspace_from_user_code
@@ -53,7 +54,7 @@ def mocked_oauth_notion_api(*args, **kwargs):
     return MockResponse(None, 404)
 
 
-class NotionWorkspacesTestCase(TestCase):
+class NotionWorkspacesTestCase(CacheIsolatedTestCase):
     def setUp(self):
         self.user = get_user_model().objects.create_user(
             username="testuser", email="test@email.com", password="secret"
@@ -107,7 +108,11 @@ class NotionWorkspacesTestCase(TestCase):
         self.assertNotEqual(updated_workspace_access, None)
         updated_workspace_access.workspace = old_workspace
 
-    @mock.patch("workspaces.service.requests.post", side_effect=mocked_oauth_notion_api)
+    @mock.patch(
+        "workspaces.service.httpx.AsyncClient.post",
+        new_callable=mock.AsyncMock,
+        side_effect=mocked_oauth_notion_api,
+    )
     def test_client_request_create_new_workspace_and_access(self, m):
         self.client.force_login(
             get_user_model().objects.get_or_create(username=self.user.username)[0]
@@ -122,7 +127,11 @@ class NotionWorkspacesTestCase(TestCase):
             None,
         )
 
-    @mock.patch("workspaces.service.requests.post", side_effect=mocked_oauth_notion_api)
+    @mock.patch(
+        "workspaces.service.httpx.AsyncClient.post",
+        new_callable=mock.AsyncMock,
+        side_effect=mocked_oauth_notion_api,
+    )
     def test_client_request_bad_method(self, m):
         self.client.force_login(
             get_user_model().objects.get_or_create(username=self.user.username)[0]
@@ -130,7 +139,11 @@ class NotionWorkspacesTestCase(TestCase):
         response = self.client.post("/notion-oauth?code=" + NEW_WORKSPACE_CODE)
         self.assertEqual(response.status_code, 405)
 
-    @mock.patch("workspaces.service.requests.post", side_effect=mocked_oauth_notion_api)
+    @mock.patch(
+        "workspaces.service.httpx.AsyncClient.post",
+        new_callable=mock.AsyncMock,
+        side_effect=mocked_oauth_notion_api,
+    )
     def test_client_request_not_logged_in(self, m):
         response = self.client.get("/notion-oauth?code=" + NEW_WORKSPACE_CODE)
         self.assertEqual(response.status_code, 302)
@@ -142,7 +155,11 @@ class NotionWorkspacesTestCase(TestCase):
             None,
         )
 
-    @mock.patch("workspaces.service.requests.post", side_effect=mocked_oauth_notion_api)
+    @mock.patch(
+        "workspaces.service.httpx.AsyncClient.post",
+        new_callable=mock.AsyncMock,
+        side_effect=mocked_oauth_notion_api,
+    )
     def test_client_request_no_code(self, m):
         self.client.force_login(
             get_user_model().objects.get_or_create(username=self.user.username)[0]
@@ -157,7 +174,11 @@ class NotionWorkspacesTestCase(TestCase):
             None,
         )
 
-    @mock.patch("workspaces.service.requests.post", side_effect=mocked_oauth_notion_api)
+    @mock.patch(
+        "workspaces.service.httpx.AsyncClient.post",
+        new_callable=mock.AsyncMock,
+        side_effect=mocked_oauth_notion_api,
+    )
     def test_client_request_bad_code(self, m):
         self.client.force_login(
             get_user_model().objects.get_or_create(username=self.user.username)[0]
@@ -4,19 +4,19 @@ import urllib.parse
 from django.contrib.auth.decorators import login_required
 from django.http import HttpResponseBadRequest, HttpResponseServerError
 from django.shortcuts import redirect, render
-from django.views.decorators.http import require_http_methods
 
 from config.settings import NOTION_CLIENT_ID, NOTION_OAUTH_CALLBACK
+from security.security_decorator import async_login_required, async_require_http_methods
 
-from .service import create_access_workspace_from_user_code
+from .service import acreate_access_workspace_from_user_code
 
 logger = logging.getLogger(__name__)
 
 
 # Create your views here.
-@login_required
-@require_http_methods(["GET"])
-def add_notion_workspace_from_access_code(request):
+@async_login_required
+@async_require_http_methods(["GET"])
+async def add_notion_workspace_from_access_code(request):
     logger.info("Fetching Notion workspace from access_code!")
     oauth_request_code_string = request.GET.get("code", None)
     if oauth_request_code_string is None or oauth_request_code_string == "":
@@ -25,7 +25,7 @@ def add_notion_workspace_from_access_code(request):
             "You need to provide an OAuth2 Code to get Access"
         )
     try:
-        create_access_workspace_from_user_code(
+        await acreate_access_workspace_from_user_code(
             user_model=request.user, oauth_code=oauth_request_code_string
         )
     except Exception as e: